@@ -8,6 +8,3 @@ class UserConfig(AppConfig):
 
 class AccountsConfig(AppConfig):
     name = 'accounts'
-
-    def ready(self):
-        import accounts.signals
@@ -2,6 +2,8 @@ from django import forms
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
 
+from .models import Profile
+
 class UserRegisterForm(UserCreationForm):
     email = forms.EmailField()
     phone_no = forms.CharField(max_length=20)
@@ -19,6 +21,6 @@ class UserRegisterForm(UserCreationForm):
         user.last_name = self.cleaned_data['last_name']
         if commit:
             user.save()
-            user.profile.phone_no = self.cleaned_data['phone_no']
-            user.profile.save()
+            # Profiles exist only for users with profile data.
+            Profile.objects.update_or_create(user=user, defaults={'phone_no': self.cleaned_data['phone_no']})
         return user
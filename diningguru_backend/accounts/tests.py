@@ -1,3 +1,84 @@
-from django.test import TestCase
+import json
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+
+from .forms import UserRegisterForm
+from .models import Profile, VerificationCode
+
+
+def _statements(queries):
+    # Transaction control differs between backends and test case types.
+    return [
+        q["sql"] for q in queries.captured_queries
+        if not q["sql"].startswith(("SAVEPOINT", "RELEASE", "BEGIN", "COMMIT"))
+    ]
+
+
+class LoginFlowQueryTests(TestCase):
+    email = "new@example.com"
+
+    def setUp(self):
+        # Rate-limit buckets live in the cache, which outlives each test.
+        cache.clear()
+        self.client = Client()
+
+    def post(self, url, payload):
+        return self.client.post(url, json.dumps(payload), content_type="application/json")
+
+    def login(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post("/api/accounts/login/", {"email": self.email})
+        self.assertEqual(response.status_code, 200)
+        return _statements(queries)
+
+    def test_first_login_is_one_lookup_and_two_inserts(self):
+        statements = self.login()
+        self.assertEqual(len(statements), 3, statements)
+        self.assertTrue(User.objects.filter(username=self.email, email=self.email).exists())
+        self.assertFalse(Profile.objects.exists())
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_returning_login_is_one_lookup_and_one_insert(self):
+        self.login()
+        statements = self.login()
+        self.assertEqual(len(statements), 2, statements)
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_verify_is_one_lookup_and_one_update(self):
+        self.login()
+        code = VerificationCode.objects.get().code
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post("/api/accounts/verify/", {"email": self.email, "code": code})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"user_id": User.objects.get().id})
+        self.assertEqual(len(_statements(queries)), 2, _statements(queries))
+
+        # Single use.
+        response = self.post("/api/accounts/verify/", {"email": self.email, "code": code})
+        self.assertEqual(response.json(), {"error": "Invalid or expired code."})
+
+    def test_verify_unknown_email(self):
+        response = self.post("/api/accounts/verify/", {"email": "nobody@example.com", "code": "123456"})
+        self.assertEqual(response.json(), {"error": "Invalid email."})
+
+
+class ProfileTests(TestCase):
+    def test_registration_creates_the_profile_with_its_data(self):
+        form = UserRegisterForm(data={
+            "username": "reg", "email": "reg@example.com", "first_name": "Reg", "last_name": "User",
+            "phone_no": "555-0100", "password1": "a-long-passphrase-1", "password2": "a-long-passphrase-1",
+        })
+        self.assertTrue(form.is_valid(), form.errors)
+        user = form.save()
+        self.assertEqual(Profile.objects.get(user=user).phone_no, "555-0100")
+
+    def test_saving_a_user_writes_no_profile(self):
+        user = User.objects.create(username="plain@example.com", email="plain@example.com")
+        with CaptureQueriesContext(connection) as queries:
+            user.save()
+        self.assertEqual(len(_statements(queries)), 1, _statements(queries))
@@ -9,14 +9,17 @@ from django.core.mail import send_mail
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
+from django.db import IntegrityError, transaction
 from django.utils import timezone
 from datetime import timedelta
 import random
 import string
 import json
+import logging
 from .models import VerificationCode
 
 
+logger = logging.getLogger(__name__)
 User = get_user_model()
 
 def send_login_link(request):
@@ -32,7 +35,8 @@ def send_login_link(request):
             uid = urlsafe_base64_encode(force_bytes(user.pk))
             domain = get_current_site(request).domain
             login_link = f'http://{domain}/login/{uid}/{token}/'
-            print("login,", login_link)
+            # The link itself is a credential; never log it.
+            logger.info("Login link issued user_id=%(user_id)s", {"user_id": user.pk})
 
             # Send the login link via email
             subject = 'Your Login Link'
@@ -77,13 +81,23 @@ def login_or_signup(request):
         if not email:
             return JsonResponse({'error': 'Email is required.'}, status=400)
 
-        user, created = User.objects.get_or_create(email=email, username=email)
-
         # Generate a 6-digit verification code
         code = ''.join(random.choices(string.digits, k=6))
 
-        # Save the code
-        VerificationCode.objects.create(user=user, code=code)
+        # Save the code, creating the account on a first login: one lookup
+        # on the unique username plus one or two inserts, in one transaction.
+        for attempt in range(2):
+            try:
+                with transaction.atomic():
+                    user = User.objects.filter(username=email).first()
+                    if user is None:
+                        user = User.objects.create(username=email, email=email)
+                    VerificationCode.objects.create(user=user, code=code)
+                break
+            except IntegrityError:
+                # A concurrent first login created the account; the retry finds it.
+                if attempt:
+                    raise
 
         # Send email with the code (using console backend for development)
         send_mail(
@@ -121,29 +135,25 @@ def verify_code(request):
         if not email or not code:
             return JsonResponse({'error': 'Email and code are required.'}, status=400)
 
-        try:
-            user = User.objects.get(email=email)
-        except User.DoesNotExist:
-            return JsonResponse({'error': 'Invalid email.'}, status=400)
-
         # Check if code is valid and not expired (10-minute validity)
         now = timezone.now()
         code_validity_period = now - timedelta(minutes=10)
 
-        try:
-            verification_code = VerificationCode.objects.filter(
-                user=user,
-                code=code,
-                is_used=False,
-                created_at__gte=code_validity_period
-            ).latest('created_at')
-        except VerificationCode.DoesNotExist:
+        # Accounts from login_or_signup use the email as their username.
+        match = VerificationCode.objects.filter(
+            user__username=email,
+            code=code,
+            is_used=False,
+            created_at__gte=code_validity_period
+        ).order_by('-created_at').values_list('id', 'user_id').first()
+
+        # Mark code as used; the is_used guard makes a code single-use even
+        # when two verifications race.
+        if match is None or not VerificationCode.objects.filter(id=match[0], is_used=False).update(is_used=True):
+            if not User.objects.filter(username=email).exists():
+                return JsonResponse({'error': 'Invalid email.'}, status=400)
             return JsonResponse({'error': 'Invalid or expired code.'}, status=400)
 
-        # Mark code as used
-        verification_code.is_used = True
-        verification_code.save()
-
-        return JsonResponse({'user_id': user.id}, status=200)
+        return JsonResponse({'user_id': match[1]}, status=200)
     else:
         return JsonResponse({'error': 'Invalid request method.'}, status=405)
@@ -0,0 +1,92 @@
+# diningguru_backend/log.py
+
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+
+from django.utils.module_loading import import_string
+
+# Attributes every LogRecord has; anything else on a record came from `extra`.
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: time, level, logger and message, plus the
+    record's structured fields. A record logged with a single dict argument
+    (`logger.info("Rated venue_id=%(venue_id)s", {"venue_id": 3})`) has the
+    dict's keys as fields, as do any `extra` keys.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if isinstance(record.args, dict):
+            entry.update(record.args)
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key not in entry:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class BackgroundHandler(logging.Handler):
+    """
+    Hands records to a listener thread that formats and writes them, so the
+    request thread only pays for an enqueue.
+
+    `handler` is the dotted path of the handler doing the I/O, built with
+    `handler_kwargs`; a formatter configured on this handler is passed on to
+    it. Formatting happens on the listener thread, so log arguments must not
+    be mutated after the call. Gunicorn preloads the app in the master and
+    threads do not survive fork, so each worker restarts its own listener.
+
+    Not a QueueHandler subclass: from Python 3.12 dictConfig configures those
+    itself, expecting the stdlib's `queue`/`listener`/`handlers` keys.
+    """
+
+    def __init__(self, handler='logging.StreamHandler', handler_kwargs=None):
+        super().__init__()
+        self.queue = queue.SimpleQueue()
+        self.target = import_string(handler)(**(handler_kwargs or {}))
+        self.listener = logging.handlers.QueueListener(self.queue, self.target)
+        self.listener.start()
+        # Runs before logging's own shutdown hook, so queued records drain
+        # while the target handler is still open.
+        atexit.register(self._stop_listener)
+        os.register_at_fork(after_in_child=self._restart_listener)
+
+    def setFormatter(self, fmt):
+        self.target.setFormatter(fmt)
+
+    def emit(self, record):
+        # Same process, so the record needs no pickling or eager formatting;
+        # the listener thread formats it.
+        try:
+            self.queue.put_nowait(record)
+        except Exception:
+            self.handleError(record)
+
+    def _restart_listener(self):
+        # The listener thread is gone in the child; records are still queued.
+        if self.listener._thread is not None:
+            self.listener._thread = None
+            self.listener.start()
+
+    def _stop_listener(self):
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+    def close(self):
+        self._stop_listener()
+        self.target.close()
+        super().close()
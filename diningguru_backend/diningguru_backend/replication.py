@@ -0,0 +1,28 @@
+# diningguru_backend/replication.py
+
+import os
+import sqlite3
+
+
+def replicate(primary_path, replica_path, pages=1024):
+    """
+    Copy the primary SQLite file to the replica with the online backup API.
+
+    Writers keep going while the copy runs: SQLite restarts the copy of any
+    page range a writer touches. The copy goes to a temporary file that
+    replaces the replica in one rename, so replica readers see either the
+    old snapshot or the new one and never a partial file. Connections that
+    are already open keep the old snapshot until they reconnect, which
+    Django does per request.
+    """
+    tmp_path = f"{replica_path}.tmp"
+    source = sqlite3.connect(primary_path)
+    try:
+        target = sqlite3.connect(tmp_path)
+        try:
+            source.backup(target, pages=pages)
+        finally:
+            target.close()
+    finally:
+        source.close()
+    os.replace(tmp_path, replica_path)
@@ -0,0 +1,108 @@
+# diningguru_backend/routers.py
+
+import contextvars
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+PRIMARY = 'default'
+REPLICA = 'replica'
+
+STICKY_COOKIE = 'dg_primary_reads'
+
+_pinned = contextvars.ContextVar('pinned_to_primary', default=False)
+
+
+@contextmanager
+def use_primary():
+    """Send every read inside the block to the primary database."""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    Reads go to the replica, writes to the primary. Reads stay on the
+    primary while pinned (a write request, or a client's first reads after
+    its own write) and inside a transaction on the primary, so a writer
+    always sees its own changes.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _pinned.get() or connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica is a copy of the primary file and is never migrated.
+        return db == PRIMARY
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Pins requests to the primary where replica lag would show.
+
+    Unsafe methods run pinned. A write that succeeds sets a short-lived
+    cookie, so the same client's next REPLICA_STICKY_READS reads (within
+    REPLICA_STICKY_SECONDS) are pinned as well. The state travels with the
+    client, so it holds across workers without shared storage.
+    """
+
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sticky_reads = getattr(settings, 'REPLICA_STICKY_READS', 5)
+        self.sticky_seconds = getattr(settings, 'REPLICA_STICKY_SECONDS', 30)
+
+    def __call__(self, request):
+        if request.method not in self.SAFE_METHODS:
+            with use_primary():
+                response = self.get_response(request)
+            if response.status_code < 400:
+                self._set_sticky(response, self.sticky_reads)
+            return response
+
+        remaining, expires = self._read_sticky(request)
+        if remaining <= 0:
+            return self.get_response(request)
+        with use_primary():
+            response = self.get_response(request)
+        if remaining > 1:
+            self._set_sticky(response, remaining - 1, expires)
+        else:
+            response.delete_cookie(STICKY_COOKIE)
+        return response
+
+    def _read_sticky(self, request):
+        try:
+            remaining, expires = request.COOKIES[STICKY_COOKIE].split(':')
+            remaining, expires = int(remaining), float(expires)
+        except (KeyError, ValueError):
+            return 0, 0.0
+        if expires < time.time():
+            return 0, 0.0
+        return remaining, expires
+
+    def _set_sticky(self, response, remaining, expires=None):
+        if expires is None:
+            expires = time.time() + self.sticky_seconds
+        response.set_cookie(
+            STICKY_COOKIE,
+            f"{remaining}:{expires:.0f}",
+            max_age=max(int(expires - time.time()), 1),
+            httponly=True,
+            samesite='Lax',
+        )
@@ -55,6 +55,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'ratings',
+    'venue_ratings',
     'django_extensions',
     'accounts',
 ]
@@ -63,6 +64,7 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'diningguru_backend.ratelimit.RateLimitMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -92,12 +94,177 @@ WSGI_APPLICATION = 'diningguru_backend.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
+#
+# DB_ENGINE=sqlite (default) uses the local file; DB_ENGINE=postgresql uses
+# the POSTGRES_* variables. Tests and benchmarks run against whichever is
+# selected, e.g. `DB_ENGINE=postgresql POSTGRES_DB=diningguru_scratch
+# python manage.py test` against a throwaway local Postgres.
+
+DB_ENGINE = config('DB_ENGINE', default='sqlite')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('POSTGRES_DB', default='diningguru'),
+            'USER': config('POSTGRES_USER', default='postgres'),
+            'PASSWORD': config('POSTGRES_PASSWORD', default=''),
+            'HOST': config('POSTGRES_HOST', default='localhost'),
+            'PORT': config('POSTGRES_PORT', default=5432, cast=int),
+            # The native psycopg pool replaces persistent connections, which
+            # is why CONN_MAX_AGE stays at 0.
+            'CONN_MAX_AGE': 0,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': config('POSTGRES_POOL_MIN', default=2, cast=int),
+                    'max_size': config('POSTGRES_POOL_MAX', default=10, cast=int),
+                    'timeout': config('POSTGRES_POOL_TIMEOUT', default=10, cast=int),
+                },
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'OPTIONS': {
+                # Take the write lock at BEGIN so concurrent writers queue on the
+                # busy timeout instead of failing with "database is locked".
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 20,
+            },
+            'TEST': {
+                # File-backed so threaded tests get SQLite's real locking rather
+                # than the shared-cache in-memory database's table locks.
+                'NAME': BASE_DIR / 'test_db.sqlite3',
+            },
+        }
+    }
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Optional read replica: with SQLite a second file refreshed from the
+# primary by `manage.py replicate_db`, with Postgres a streaming replica
+# (REPLICA_DB_HOST). GET requests read from it; writes, and a client's first
+# few reads after its own write, stay on the primary.
+REPLICA_DB_NAME = config('REPLICA_DB_NAME', default='')
+REPLICA_STICKY_READS = config('REPLICA_STICKY_READS', default=5, cast=int)
+REPLICA_STICKY_SECONDS = config('REPLICA_STICKY_SECONDS', default=30, cast=int)
+
+if REPLICA_DB_NAME:
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': REPLICA_DB_NAME,
+        'HOST': config('REPLICA_DB_HOST', default=DATABASES['default'].get('HOST', '')),
+        'TEST': {'MIRROR': 'default'},
     }
+    DATABASE_ROUTERS = ['diningguru_backend.routers.PrimaryReplicaRouter']
+    MIDDLEWARE.insert(0, 'diningguru_backend.routers.ReplicaRoutingMiddleware')
+
+# Cache
+# Local memory is per process; with several workers point CACHE_BACKEND at a
+# shared one (e.g. django.core.cache.backends.redis.RedisCache) so rate limits
+# hold across all of them.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    },
+    # Kept apart so large listing bodies do not evict rate-limit buckets.
+    'listings': {
+        'BACKEND': config('LISTING_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('LISTING_CACHE_LOCATION', default='listings'),
+    },
+}
+
+# Gzipped listing bodies (ratings/listings.py), keyed by path and query
+# string. Writes invalidate them, but only in caches the writer can see: with
+# a per-process cache other workers serve theirs until they expire.
+LISTING_CACHE = 'listings'
+LISTING_CACHE_SECONDS = config('LISTING_CACHE_SECONDS', default=30, cast=int)
+
+# Token-bucket limits per URL name (diningguru_backend/ratelimit.py): per
+# client IP and per user, as 'count/period' with period s, m, h or d.
+RATE_LIMIT_CACHE = 'default'
+# Behind a proxy, e.g. 'HTTP_X_FORWARDED_FOR'.
+RATE_LIMIT_IP_HEADER = config('RATE_LIMIT_IP_HEADER', default='REMOTE_ADDR')
+RATE_LIMITS = {
+    # Each sends an email.
+    'login_or_signup': {'ip': '20/m', 'user': '5/m'},
+    'send_login_link': {'ip': '20/m', 'user': '5/m'},
+    'verify_code': {'ip': '30/m', 'user': '10/m'},
+    'submit_rating': {'ip': '120/m', 'user': '30/m'},
+    'submit_or_update_comment': {'ip': '120/m', 'user': '20/m'},
+    'like_comment': {'ip': '300/m', 'user': '120/m'},
+    'unlike_comment': {'ip': '300/m', 'user': '120/m'},
+    'toggle_likes': {'ip': '120/m', 'user': '60/m'},
+}
+
+# Optional memory-mapped copy of the rating aggregates shared by every worker
+# (ratings/aggregate_store.py), e.g. /dev/shm/diningguru-aggregates. The
+# gunicorn master builds it before forking; `manage.py rebuild_aggregate_store`
+# rebuilds or verifies it by hand.
+AGGREGATE_STORE_PATH = config('AGGREGATE_STORE_PATH', default='')
+AGGREGATE_STORE_SLOTS = config('AGGREGATE_STORE_SLOTS', default=65536, cast=int)
+
+# Retention: `manage.py archive_ratings` moves ratings and comments older than
+# the start of the RETENTION_KEEP_SEMESTERS most recent semesters (each begins
+# on one of SEMESTER_STARTS, as month and day) into the archive tables.
+# RETENTION_CUTOFF (YYYY-MM-DD) sets a fixed date instead.
+RETENTION_KEEP_SEMESTERS = config('RETENTION_KEEP_SEMESTERS', default=2, cast=int)
+RETENTION_CUTOFF = config('RETENTION_CUTOFF', default='')
+SEMESTER_STARTS = [(1, 15), (8, 20)]
+
+# Meal periods by local start hour at the dining halls, as the app derives
+# them; each runs until the next one starts (ratings/meal_clock.py).
+DINING_TIME_ZONE = config('DINING_TIME_ZONE', default='UTC')
+MEAL_PERIOD_STARTS = [(6, 'breakfast'), (11, 'lunch'), (17, 'dinner'), (22, 'closed')]
+
+# Pre-warming (ratings/prewarm.py): PREWARM_LEAD_SECONDS before each meal
+# period, every venue's comment list goes into the listing cache (averages
+# come from the aggregate store, or one indexed row, and are not cached).
+# `manage.py prewarm_meal_periods` runs the scheduler against a shared cache,
+# where lists are kept for PREWARM_CACHE_SECONDS. With a per-process cache,
+# PREWARM_IN_WORKERS runs it in each gunicorn worker instead; as other
+# workers' writes cannot drop them, lists there last no longer than
+# LISTING_CACHE_SECONDS and requests do not add to them.
+PREWARM_LEAD_SECONDS = config('PREWARM_LEAD_SECONDS', default=120, cast=int)
+PREWARM_CACHE_SECONDS = config('PREWARM_CACHE_SECONDS', default=900, cast=int)
+PREWARM_IN_WORKERS = config('PREWARM_IN_WORKERS', default=False, cast=bool)
+
+# Venue recommendations (ratings/recommendations.py): the file
+# `manage.py build_recommendations` writes and every worker maps, e.g.
+# /var/lib/diningguru/recommendations; the endpoint answers 503 until it is
+# built. RECOMMENDATIONS_K venues are kept per user and meal period.
+RECOMMENDATIONS_PATH = config('RECOMMENDATIONS_PATH', default='')
+RECOMMENDATIONS_K = config('RECOMMENDATIONS_K', default=10, cast=int)
+
+
+# Logging
+# Records are queued on the request thread and written by a listener thread
+# (diningguru_backend.log.BackgroundHandler). LOG_FORMAT=json writes one JSON
+# object per line with the record's structured fields.
+
+LOG_LEVEL = config('LOG_LEVEL', default='INFO')
+LOG_FORMAT = config('LOG_FORMAT', default='text')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'text': {'format': '%(asctime)s %(levelname)s %(name)s %(message)s'},
+        'json': {'()': 'diningguru_backend.log.JsonFormatter'},
+    },
+    'handlers': {
+        'background': {
+            'class': 'diningguru_backend.log.BackgroundHandler',
+            'handler': 'logging.StreamHandler',
+            'formatter': LOG_FORMAT,
+        },
+    },
+    'root': {
+        'handlers': ['background'],
+        'level': LOG_LEVEL,
+    },
 }
 
 
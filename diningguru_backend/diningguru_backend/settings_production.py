@@ -0,0 +1,63 @@
+# diningguru_backend/settings_production.py
+
+"""
+Production settings: the development settings with debug off and only the
+apps and middleware the API actually serves with.
+
+Idle instances are spun down, so everything loaded at startup is paid again
+on the next cold request. Select with
+DJANGO_SETTINGS_MODULE=diningguru_backend.settings_production (gunicorn.conf.py
+does this by default).
+"""
+
+from decouple import config
+
+from .settings import *  # noqa: F401,F403
+from .settings import REPLICA_DB_NAME, SIMPLE_JWT
+
+DEBUG = False
+SECRET_KEY = config('DJANGO_SECRET_KEY')
+ALLOWED_HOSTS = config('ALLOWED_HOSTS', default='localhost').split(',')
+SIMPLE_JWT = {**SIMPLE_JWT, 'SIGNING_KEY': SECRET_KEY}
+
+# No admin, messages, staticfiles or django_extensions: nothing routes to
+# them. Sessions and auth stay for the emailed login-link pages.
+INSTALLED_APPS = [
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'ratings',
+    'venue_ratings',
+    'accounts',
+]
+
+MIDDLEWARE = [
+    'django.middleware.security.SecurityMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'diningguru_backend.ratelimit.RateLimitMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+if REPLICA_DB_NAME:
+    MIDDLEWARE.insert(0, 'diningguru_backend.routers.ReplicaRoutingMiddleware')
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            # user.html reads `user`; nothing else uses a context processor.
+            'context_processors': [
+                'django.contrib.auth.context_processors.auth',
+            ],
+        },
+    },
+]
+
+# Every response is English JSON; skip loading translation catalogs.
+USE_I18N = False
+
@@ -0,0 +1,181 @@
+import io
+import json
+import logging
+import logging.config
+import os
+import sys
+import tempfile
+import threading
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+
+from .log import BackgroundHandler, JsonFormatter
+from .ratelimit import RateLimitMiddleware
+
+
+def _record(msg, args=(), **extra):
+    record = logging.LogRecord("ratings.views", logging.INFO, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+class JsonFormatterTests(SimpleTestCase):
+    def format(self, record):
+        return json.loads(JsonFormatter().format(record))
+
+    def test_dict_args_become_fields(self):
+        entry = self.format(_record(
+            "Rating submitted user_id=%(user_id)s venue_id=%(venue_id)s", ({"user_id": 7, "venue_id": 593},)
+        ))
+        self.assertEqual(entry["message"], "Rating submitted user_id=7 venue_id=593")
+        self.assertEqual((entry["level"], entry["logger"]), ("INFO", "ratings.views"))
+        self.assertEqual((entry["user_id"], entry["venue_id"]), (7, 593))
+        self.assertTrue(entry["time"].endswith("+00:00"))
+
+    def test_extra_fields_and_exceptions(self):
+        try:
+            raise ValueError("bad rating")
+        except ValueError:
+            record = logging.LogRecord(
+                "ratings.views", logging.ERROR, __file__, 1, "Failed for %s", ("alice",), sys.exc_info()
+            )
+        record.__dict__.update(request_id="abc", elapsed=object())
+        entry = self.format(record)
+        self.assertEqual(entry["message"], "Failed for alice")
+        self.assertEqual(entry["request_id"], "abc")
+        # Values JSON cannot encode are written as strings.
+        self.assertTrue(entry["elapsed"].startswith("<object object"))
+        self.assertIn("ValueError: bad rating", entry["exc_info"])
+
+
+class BackgroundHandlerTests(SimpleTestCase):
+    def handler(self, **handler_kwargs):
+        # Capture the exit and fork hooks instead of registering them for
+        # the rest of the test run.
+        hooks = {}
+        with mock.patch("atexit.register", lambda fn: hooks.setdefault("exit", fn)), \
+                mock.patch("os.register_at_fork", lambda after_in_child: hooks.setdefault("fork", after_in_child)):
+            handler = BackgroundHandler("logging.StreamHandler", handler_kwargs)
+        self.addCleanup(handler.close)
+        return handler, hooks
+
+    def test_records_are_written_by_the_listener_and_drained_at_exit(self):
+        stream = io.StringIO()
+        handler, hooks = self.handler(stream=stream)
+        handler.setFormatter(JsonFormatter())
+        for n in range(200):
+            handler.handle(_record("Rated venue_id=%(venue_id)s", ({"venue_id": n},)))
+        hooks["exit"]()
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual([line["venue_id"] for line in lines], list(range(200)))
+        self.assertIsNone(handler.listener._thread)
+        # Running the hook again, or closing after it, is harmless.
+        hooks["exit"]()
+
+    def test_configured_from_the_logging_setting(self):
+        # From Python 3.12 dictConfig builds QueueHandler subclasses its own
+        # way, which this one must not be.
+        stream = io.StringIO()
+        config = {**settings.LOGGING["handlers"]["background"], "handler_kwargs": {"stream": stream}}
+        del config["formatter"]
+        with mock.patch("atexit.register"), mock.patch("os.register_at_fork"):
+            handler = logging.config.DictConfigurator({}).configure_handler(config)
+        self.addCleanup(handler.close)
+        handler.handle(_record("configured"))
+        handler.close()
+        self.assertEqual(stream.getvalue(), "configured\n")
+
+    def test_listener_restarts_in_a_forked_child(self):
+        with tempfile.NamedTemporaryFile("r", suffix=".log") as log_file:
+            hooks = {}
+            with mock.patch("atexit.register", lambda fn: hooks.setdefault("exit", fn)):
+                handler = BackgroundHandler("logging.FileHandler", {"filename": log_file.name})
+            self.addCleanup(handler.close)
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    # Without the fork hook the child has no listener thread
+                    # and this record would never be written.
+                    handler.handle(_record("child"))
+                    hooks["exit"]()
+                finally:
+                    os._exit(0)
+            os.waitpid(pid, 0)
+            handler.handle(_record("parent"))
+            hooks["exit"]()
+            self.assertEqual(sorted(log_file.read().split()), ["child", "parent"])
+
+
+@override_settings(RATE_LIMITS={"average_rating": {"ip": "4/m", "user": "2/m"}})
+class RateLimitTests(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        self.now = 1_000_000.0
+        clock = mock.patch("time.time", lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def get(self, ip="10.0.0.1", user_id=None, path="/api/ratings/593/average"):
+        params = {"meal_period": "lunch"}
+        if user_id is not None:
+            params["user_id"] = user_id
+        return Client(REMOTE_ADDR=ip).get(path, params)
+
+    def test_burst_then_429_with_retry_after(self):
+        self.assertEqual([self.get().status_code for _ in range(4)], [200] * 4)
+        response = self.get()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json(), {"error": "Too many requests."})
+        # One token refills every 15s.
+        self.assertEqual(response["Retry-After"], "15")
+        self.now += 15
+        self.assertEqual(self.get().status_code, 200)
+        self.assertEqual(self.get().status_code, 429)
+
+    def test_ip_and_user_buckets_are_separate(self):
+        self.assertEqual([self.get(user_id=1).status_code for _ in range(3)], [200, 200, 429])
+        # Another user on the same IP has their own bucket...
+        self.assertEqual(self.get(user_id=2).status_code, 200)
+        # ...the same user from another IP does not,
+        self.assertEqual(self.get(ip="10.0.0.2", user_id=1).status_code, 429)
+        # and the IP's bucket, at 4 of 4, now stops everyone on it.
+        self.assertEqual(self.get(user_id=3).status_code, 429)
+        self.assertEqual(self.get(ip="10.0.0.2", user_id=3).status_code, 200)
+
+    def test_unlisted_urls_are_untouched(self):
+        with mock.patch.object(RateLimitMiddleware, "_take") as take:
+            for _ in range(10):
+                self.assertEqual(self.get(path="/api/comments/593").status_code, 200)
+        take.assert_not_called()
+
+
+class RateLimitConcurrencyTests(SimpleTestCase):
+    THREADS = 8
+
+    def test_concurrent_requests_cannot_share_a_token(self):
+        caches["default"].clear()
+        middleware = RateLimitMiddleware(lambda request: None)
+        barrier = threading.Barrier(self.THREADS)
+        get = middleware.cache.get
+        results = []
+
+        def slow_get(*args, **kwargs):
+            # Widen the gap between reading and writing the bucket.
+            value = get(*args, **kwargs)
+            threading.Event().wait(0.01)
+            return value
+
+        def take():
+            barrier.wait()
+            results.append(middleware._take("rl:test:ip:10.0.0.1", 3, 60.0))
+
+        with mock.patch.object(middleware.cache, "get", slow_get):
+            threads = [threading.Thread(target=take) for _ in range(self.THREADS)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(results.count(0), 3)
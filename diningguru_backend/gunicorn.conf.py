@@ -0,0 +1,55 @@
+# gunicorn.conf.py
+#
+# gunicorn -c gunicorn.conf.py
+#
+# The app is imported once in the master and workers fork from that warm
+# image, so a cold instance pays for Django setup once rather than per worker.
+
+import os
+
+# Not `from decouple import config`: gunicorn reads every module-level name
+# here as a setting, and `config` is one of them.
+import decouple
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'diningguru_backend.settings_production')
+
+wsgi_app = 'diningguru_backend.wsgi:application'
+bind = decouple.config('GUNICORN_BIND', default='0.0.0.0:8000')
+workers = decouple.config('GUNICORN_WORKERS', default=2, cast=int)
+threads = decouple.config('GUNICORN_THREADS', default=4, cast=int)
+timeout = decouple.config('GUNICORN_TIMEOUT', default=30, cast=int)
+preload_app = True
+
+
+def when_ready(server):
+    # Runs in the master after the preload, before any worker forks. The URL
+    # conf (and with it every view module) is otherwise imported by the first
+    # request in each worker.
+    from django.db import connections
+    from django.urls import get_resolver
+
+    from ratings.aggregate_store import aggregate_store
+
+    get_resolver().url_patterns
+    if aggregate_store.enabled:
+        aggregate_store.rebuild()
+        aggregate_store.close()
+    # Workers must not share a socket inherited from the master. With the
+    # Postgres pool, closing only hands the connection back to the pool,
+    # whose sockets (and helper threads, which do not survive the fork) are
+    # the master's, so the pool itself is closed; each worker opens its own.
+    connections.close_all()
+    for connection in connections.all(initialized_only=True):
+        if connection.alias in getattr(connection, '_connection_pools', ()):
+            connection.close_pool()
+
+
+def post_worker_init(worker):
+    # Threads do not survive the fork, so each worker starts its own
+    # pre-warming scheduler, for its own per-process cache.
+    from django.conf import settings
+
+    if settings.PREWARM_IN_WORKERS:
+        from ratings.prewarm import start_scheduler
+
+        start_scheduler()
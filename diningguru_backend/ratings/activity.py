@@ -0,0 +1,86 @@
+# ratings/activity.py
+
+import datetime
+import heapq
+
+from django.db.models import Q
+
+from .models import Comment, CommentLike, MealPeriod, Rating
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+ONE_MICROSECOND = datetime.timedelta(microseconds=1)
+# Ids are 64-bit signed integers on both SQLite and Postgres.
+MAX_ID = 2 ** 63 - 1
+
+# Each source is one range scan on its (user, time, id) index; the rank breaks
+# ties between sources at the same instant.
+SOURCES = [
+    # (kind, rank, model, time field, other columns)
+    ('rating', 0, Rating, 'timestamp', ('venue_id', 'meal_period', 'rating')),
+    ('comment', 1, Comment, 'updated_at', ('venue_id', 'meal_period', 'text')),
+    ('like', 2, CommentLike, 'created_at', ('comment_id', 'comment__venue_id', 'comment__meal_period')),
+]
+
+
+def encode_cursor(timestamp, rank, row_id):
+    return f'{(timestamp - EPOCH) // ONE_MICROSECOND}.{rank}.{row_id}'
+
+
+def decode_cursor(cursor):
+    """The (timestamp, rank, id) of the last entry a client has seen; ValueError if malformed."""
+    micros, rank, row_id = (int(part) for part in cursor.split('.'))
+    if not 0 <= rank < len(SOURCES) or not 0 <= row_id <= MAX_ID:
+        raise ValueError(f"Cursor out of range: {cursor}")
+    try:
+        return EPOCH + datetime.timedelta(microseconds=micros), rank, row_id
+    except OverflowError:
+        raise ValueError(f"Cursor out of range: {cursor}")
+
+
+def activity_page(user_id, limit, cursor=None):
+    """
+    Up to `limit` of a user's ratings, comments (by last edit) and likes,
+    newest first, strictly after `cursor`, and the cursor for the next page
+    (None on the last one). Entries are ordered by (time, rank, id), so each
+    source reads at most `limit` rows from its index: three range scans per
+    page however much history the user has.
+    """
+    streams = [
+        _scan(kind, rank, model, time_field, columns, user_id, limit, cursor)
+        for kind, rank, model, time_field, columns in SOURCES
+    ]
+    merged = heapq.merge(*streams, key=lambda entry: entry[0], reverse=True)
+    page = [entry for _, entry in zip(range(limit + 1), merged)]
+    next_cursor = encode_cursor(*page[limit - 1][0]) if len(page) > limit else None
+    return [item for _, item in page[:limit]], next_cursor
+
+
+def _scan(kind, rank, model, time_field, columns, user_id, limit, cursor):
+    rows = model.objects.filter(user_id=user_id)
+    if cursor:
+        timestamp, cursor_rank, cursor_id = cursor
+        if rank < cursor_rank:
+            rows = rows.filter(**{f'{time_field}__lte': timestamp})
+        elif rank > cursor_rank:
+            rows = rows.filter(**{f'{time_field}__lt': timestamp})
+        else:
+            # The separate upper bound lets the index seek instead of
+            # scanning down from the user's newest entry.
+            rows = rows.filter(**{f'{time_field}__lte': timestamp}).filter(
+                Q(**{f'{time_field}__lt': timestamp}) | Q(id__lt=cursor_id)
+            )
+    rows = rows.order_by(f'-{time_field}', '-id').values_list(time_field, 'id', *columns)[:limit + 1]
+    for timestamp, row_id, *values in rows:
+        yield (timestamp, rank, row_id), _entry(kind, row_id, timestamp, values)
+
+
+def _entry(kind, row_id, timestamp, values):
+    if kind == 'like':
+        comment_id, venue_id, meal_period = values
+        entry = {'type': kind, 'comment_id': comment_id, 'venue_id': venue_id}
+    else:
+        venue_id, meal_period, detail = values
+        entry = {'type': kind, 'id': row_id, 'venue_id': venue_id, 'rating' if kind == 'rating' else 'text': detail}
+    entry['meal_period'] = MealPeriod(meal_period).label
+    entry['timestamp'] = timestamp.isoformat()
+    return entry
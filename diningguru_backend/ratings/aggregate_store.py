@@ -0,0 +1,306 @@
+# ratings/aggregate_store.py
+
+import fcntl
+import logging
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import router
+
+from .models import BUCKET_FIELDS, RatingAggregate
+
+logger = logging.getLogger(__name__)
+
+# File layout: a 64-byte header, then a fixed open-addressing table of slots
+# keyed by (venue_id, meal_period). Slots are never freed; a rebuild writes a
+# new file.
+MAGIC = b'DGAGG\x00\x00\x01'
+HEADER = struct.Struct('<8sIII')  # magic, capacity, state, generation
+HEADER_SIZE = 64
+STATE = struct.Struct('<II')  # state, generation
+STATE_OFFSET = 12
+SLOT = struct.Struct('<IHHqqdd5q')  # seq, meal_period, used, venue_id, then FIELDS
+SEQ = struct.Struct('<I')
+FIELDS = ['count', 'total', 'total_squares', *BUCKET_FIELDS]
+
+BUILDING, READY, RETIRED = 0, 1, 2
+
+# A rebuild sizes the table to at most half full; writes may fill the rest.
+MIN_FREE_RATIO = 2
+READ_ATTEMPTS = 100
+
+
+class AggregateStore:
+    """
+    The RatingAggregate rows, mirrored in a memory-mapped file every worker
+    process maps, so average_rating is answered without a database query.
+
+    The gunicorn master builds the file from the database before forking.
+    Reads take no lock: each slot carries a sequence number that writers make
+    odd while they change it, and readers retry until they see the same even
+    number on both sides of their read. Writers serialise on an flock of the
+    file and, once Rating.submit's transaction has committed, copy the venue's
+    RatingAggregate row into its slot: a late or repeated copy is harmless,
+    where a delta applied twice would not be. A rebuild holds the old file's
+    lock from its snapshot until the new file is in place, so no write lands
+    in the old file after the snapshot and is lost.
+
+    The database stays the source of truth. When the store cannot answer (not
+    configured, not built yet, full) get() returns None and callers query as
+    before. Writes that bypass Rating.submit, or a worker dying between commit
+    and update, leave it behind until the next rebuild; verify() compares it
+    with the Rating rows.
+    """
+
+    def __init__(self, path=None, slots=None):
+        self._path = path
+        self._slots = slots
+        self._lock = threading.RLock()
+        self._pid = None
+        self._file = None
+        self._buf = None
+
+    @property
+    def path(self):
+        return str(self._path if self._path is not None else getattr(settings, 'AGGREGATE_STORE_PATH', ''))
+
+    @property
+    def slots(self):
+        return self._slots if self._slots is not None else getattr(settings, 'AGGREGATE_STORE_SLOTS', 65536)
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def get(self, venue_id, meal_period):
+        """
+        The aggregate for (venue_id, meal_period) as an unsaved RatingAggregate
+        (empty if nobody has rated), or None if the caller should query the
+        database instead.
+        """
+        buf = self._mapping()
+        if buf is None:
+            return None
+        _, capacity, state, generation = HEADER.unpack_from(buf, 0)
+        if state != READY:
+            return None
+        values = self._find(buf, capacity, venue_id, meal_period)
+        # A rebuild that started or finished meanwhile invalidates the read.
+        if values is None or STATE.unpack_from(buf, STATE_OFFSET) != (READY, generation):
+            return None
+        aggregate = RatingAggregate(venue_id=venue_id, meal_period=meal_period)
+        if values[2]:
+            for field, value in zip(FIELDS, values[4:]):
+                setattr(aggregate, field, value)
+        return aggregate
+
+    def record(self, venue_id, meal_period):
+        """Copy the committed aggregate for (venue_id, meal_period) into the store."""
+        with self._locked() as buf:
+            if buf is None:
+                return
+            _, capacity, state, _ = HEADER.unpack_from(buf, 0)
+            if state != READY:
+                return
+            # Read under the lock, so writes land in the order they read
+            # and the last one holds the latest committed row.
+            values = _aggregates().filter(venue_id=venue_id, meal_period=meal_period).values_list(*FIELDS).first()
+            index = self._slot_for_write(buf, capacity, venue_id, meal_period)
+            if index is None:
+                # Readers fall back to the database until a rebuild resizes it.
+                logger.warning("Aggregate store %s is full; rebuild it to resize.", self.path)
+                STATE.pack_into(buf, STATE_OFFSET, BUILDING, HEADER.unpack_from(buf, 0)[3])
+                return
+            offset = HEADER_SIZE + index * SLOT.size
+            seq = SEQ.unpack_from(buf, offset)[0]
+            SEQ.pack_into(buf, offset, (seq + 1) & 0xFFFFFFFF)
+            SLOT.pack_into(
+                buf, offset, (seq + 1) & 0xFFFFFFFF, meal_period, 1, venue_id,
+                *(values or [0] * len(FIELDS)),
+            )
+            SEQ.pack_into(buf, offset, (seq + 2) & 0xFFFFFFFF)
+
+    def rebuild(self):
+        """
+        Load every RatingAggregate row into a new file and swap it in. Processes
+        mapping the old file see it retired and reopen. Returns the row count.
+        """
+        old = self._open(self.path)
+        if old is not None:
+            # Writers wait from before the snapshot until the new file is in
+            # place, then copy their row into it: nothing committed after the
+            # snapshot is written to the old file and lost.
+            fcntl.flock(old[0], fcntl.LOCK_EX)
+        try:
+            rows = self._snapshot()
+            capacity = max(self.slots, len(rows) * MIN_FREE_RATIO)
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.aggregates-')
+            try:
+                with os.fdopen(fd, 'r+b') as file:
+                    file.truncate(HEADER_SIZE + capacity * SLOT.size)
+                    with mmap.mmap(file.fileno(), 0) as buf:
+                        HEADER.pack_into(buf, 0, MAGIC, capacity, BUILDING, 0)
+                        for venue_id, meal_period, *values in rows:
+                            index = self._slot_for_write(buf, capacity, venue_id, meal_period)
+                            SLOT.pack_into(buf, HEADER_SIZE + index * SLOT.size, 0, meal_period, 1, venue_id, *values)
+                        STATE.pack_into(buf, STATE_OFFSET, READY, 1)
+                os.chmod(tmp_path, 0o644)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            if old is not None:
+                STATE.pack_into(old[1], STATE_OFFSET, RETIRED, 0)
+        finally:
+            if old is not None:
+                old_file, old_buf = old
+                fcntl.flock(old_file, fcntl.LOCK_UN)
+                old_buf.close()
+                old_file.close()
+        return len(rows)
+
+    def verify(self):
+        """
+        Compare the store with aggregates recomputed from the Rating rows.
+        Returns the (venue_id, meal_period) keys that differ, or None if the
+        store is unavailable.
+        """
+        buf = self._mapping()
+        if buf is None or HEADER.unpack_from(buf, 0)[2] != READY:
+            return None
+        expected = RatingAggregate.compute()
+        actual = {}
+        for index in range(HEADER.unpack_from(buf, 0)[1]):
+            values = self._read(buf, index)
+            if values is not None and values[2]:
+                actual[(values[3], values[1])] = values[4:]
+        mismatched = []
+        for key in expected.keys() | actual.keys():
+            want = [getattr(expected[key], field) for field in FIELDS] if key in expected else None
+            have = actual.get(key)
+            # An empty slot has no Rating rows behind it either.
+            if want is None and have is not None and not any(have):
+                continue
+            if want is None or have is None or not all(
+                math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9) for a, b in zip(want, have)
+            ):
+                mismatched.append(key)
+        return sorted(mismatched)
+
+    def close(self):
+        """Unmap the file; the next access maps it again."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+            # Left for the garbage collector: a reader may still hold it.
+            self._buf = self._file = self._pid = None
+
+    def _mapping(self):
+        buf = self._buf
+        if buf is not None and self._pid == os.getpid() and STATE.unpack_from(buf, STATE_OFFSET)[0] != RETIRED:
+            return buf
+        with self._lock:
+            if self._buf is not buf:
+                return self._buf
+            # First use, a retired file, or a forked worker: flock locks belong
+            # to the open file, so each process needs its own.
+            self.close()
+            if not self.enabled:
+                return None
+            opened = self._open(self.path)
+            if opened is not None:
+                self._file, self._buf = opened
+                self._pid = os.getpid()
+            return self._buf
+
+    @staticmethod
+    def _open(path):
+        try:
+            file = open(path, 'r+b')
+        except FileNotFoundError:
+            return None
+        size = os.fstat(file.fileno()).st_size
+        if size >= HEADER_SIZE:
+            buf = mmap.mmap(file.fileno(), size)
+            magic, capacity = HEADER.unpack_from(buf, 0)[:2]
+            if magic == MAGIC and size == HEADER_SIZE + capacity * SLOT.size:
+                return file, buf
+            buf.close()
+        file.close()
+        return None
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            buf = self._mapping()
+            if buf is None:
+                yield None
+                return
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+            while STATE.unpack_from(buf, STATE_OFFSET)[0] == RETIRED:
+                # Rebuilt while we waited; write to the new file instead.
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+                buf = self._mapping()
+                if buf is None:
+                    yield None
+                    return
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+            try:
+                yield buf
+            finally:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _snapshot():
+        return list(_aggregates().values_list('venue_id', 'meal_period', *FIELDS).iterator())
+
+    @staticmethod
+    def _probe(capacity, venue_id, meal_period):
+        start = ((venue_id * 8 + meal_period) * 0x9E3779B1) % capacity
+        for step in range(capacity):
+            yield (start + step) % capacity
+
+    def _read(self, buf, index):
+        offset = HEADER_SIZE + index * SLOT.size
+        for _ in range(READ_ATTEMPTS):
+            seq = SEQ.unpack_from(buf, offset)[0]
+            if seq & 1:
+                os.sched_yield()
+                continue
+            values = SLOT.unpack_from(buf, offset)
+            if SEQ.unpack_from(buf, offset)[0] == seq:
+                return values
+        # A writer died mid-update; let the caller use the database.
+        return None
+
+    def _find(self, buf, capacity, venue_id, meal_period):
+        for index in self._probe(capacity, venue_id, meal_period):
+            values = self._read(buf, index)
+            if values is None or not values[2]:
+                return values
+            if values[3] == venue_id and values[1] == meal_period:
+                return values
+        return None
+
+    def _slot_for_write(self, buf, capacity, venue_id, meal_period):
+        # Callers hold the write lock, so slots cannot change under us.
+        for index in self._probe(capacity, venue_id, meal_period):
+            _, period, used, venue = SLOT.unpack_from(buf, HEADER_SIZE + index * SLOT.size)[:4]
+            if not used or (venue == venue_id and period == meal_period):
+                return index
+        return None
+
+
+def _aggregates():
+    # The primary: a replica may not have the row that was just committed.
+    return RatingAggregate.objects.using(router.db_for_write(RatingAggregate))
+
+
+aggregate_store = AggregateStore()
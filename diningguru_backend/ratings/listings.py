@@ -0,0 +1,91 @@
+# ratings/listings.py
+
+import gzip
+import hashlib
+import json
+import re
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+# The same test GZipMiddleware uses.
+_ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+_GZIP_LEVEL = 6
+
+# Datetimes exactly as JsonResponse writes them.
+json_datetime = DjangoJSONEncoder().default
+
+
+def rows(fields, values, converters=None):
+    """
+    Dicts keyed by `fields` for the tuples of a values_list() query, with
+    `converters` ({field: function}) applied to their columns. No model
+    instances are built, and the values are then plain JSON types.
+    """
+    converters = converters or {}
+    convert = [(i, converters[field]) for i, field in enumerate(fields) if field in converters]
+    result = []
+    for row in values:
+        if convert:
+            row = list(row)
+            for i, function in convert:
+                if row[i] is not None:
+                    row[i] = function(row[i])
+        result.append(dict(zip(fields, row)))
+    return result
+
+
+def dumps(payload):
+    """Compact UTF-8 JSON bytes; every value must already be a JSON type."""
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def cached_response(request, namespace, build):
+    """
+    Serve `build()` (a JSON payload) for this path and query string from
+    the listing cache, where bodies are stored gzip-compressed. Clients
+    that accept gzip get the stored bytes as they are; others get them
+    decompressed. Cached bodies stay valid for LISTING_CACHE_SECONDS or
+    until invalidate(namespace).
+    """
+    cache = caches[settings.LISTING_CACHE]
+    query = sorted(request.GET.lists())
+    key = 'listing:%s:%s:%s' % (
+        namespace, generation(namespace), hashlib.md5(f'{request.path}?{query}'.encode()).hexdigest(),
+    )
+    body = cache.get(key)
+    if body is None:
+        body = gzip.compress(dumps(build()), compresslevel=_GZIP_LEVEL, mtime=0)
+        cache.set(key, body, settings.LISTING_CACHE_SECONDS)
+
+    if _ACCEPTS_GZIP.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+        response = HttpResponse(body, content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(gzip.decompress(body), content_type='application/json')
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def generation(namespace):
+    """The current generation of `namespace`; part of every key cached under it."""
+    return caches[settings.LISTING_CACHE].get(_generation_key(namespace), 0)
+
+
+def invalidate(namespace):
+    """Drop every cached body in `namespace` by moving to a new generation."""
+    cache = caches[settings.LISTING_CACHE]
+    key = _generation_key(namespace)
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted between the add and the incr.
+        cache.set(key, 1, None)
+
+
+def _generation_key(namespace):
+    return f'listing:{namespace}:generation'
@@ -0,0 +1,48 @@
+# ratings/management/commands/archive_ratings.py
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ratings.models import ArchivedComment, ArchivedRating, Comment, Rating
+from ratings.retention import retention_cutoff
+
+
+class Command(BaseCommand):
+    help = (
+        "Move ratings and comments last changed before the retention cutoff into the archive "
+        "tables, in short batches so writers are never locked out for long. "
+        "Rating aggregates keep counting archived ratings."
+    )
+
+    def add_arguments(self, parser):
+        cutoff = parser.add_mutually_exclusive_group()
+        cutoff.add_argument('--before', help="Archive rows before this date (YYYY-MM-DD).")
+        cutoff.add_argument('--keep-semesters', type=int, help="Keep this many most recent semesters.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows moved per transaction.")
+        parser.add_argument('--pause', type=float, default=0.05, help="Seconds to yield to writers between batches.")
+        parser.add_argument('--dry-run', action='store_true', help="Only print the cutoff.")
+
+    def handle(self, *args, **options):
+        try:
+            cutoff = retention_cutoff(options['before'], options['keep_semesters'])
+        except ValueError as e:
+            raise CommandError(e)
+
+        self.stdout.write(f"Archiving ratings and comments from before {cutoff.isoformat()}.")
+        if options['dry_run']:
+            self.stdout.write(
+                f"{Rating.objects.filter(updated_at__lt=cutoff).count()} ratings and "
+                f"{Comment.objects.filter(updated_at__lt=cutoff).count()} comments would move."
+            )
+            return
+
+        for model in (ArchivedRating, ArchivedComment):
+            started = time.perf_counter()
+            moved = 0
+            while batch := model.archive_batch(cutoff, options['batch_size']):
+                moved += batch
+                time.sleep(options['pause'])
+            self.stdout.write(self.style.SUCCESS(
+                f"Moved {moved} rows to {model._meta.db_table} in {time.perf_counter() - started:.1f}s."
+            ))
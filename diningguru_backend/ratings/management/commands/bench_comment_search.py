@@ -0,0 +1,144 @@
+# ratings/management/commands/bench_comment_search.py
+
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from ratings import search
+from ratings.models import MealPeriod
+
+WORDS = (
+    "pasta pizza salad soup burger fries tofu curry rice noodles chicken "
+    "salmon omelette pancakes waffles bagel yogurt fruit coffee tea cold warm "
+    "fresh stale salty sweet spicy bland crispy soggy great terrible amazing "
+    "okay line long short busy quiet staff friendly slow fast vegan halal"
+).split()
+
+MEAL_PERIODS = tuple(period.value for period in MealPeriod if period != MealPeriod.UNKNOWN)
+
+# Long tail of dish names so that, like real comments, most search terms are
+# selective while a few common words match a large share of the table.
+RARE_WORDS = [f"dish{n:05d}" for n in range(20_000)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark FTS5 comment search against the LIKE scan that an "
+        "icontains filter compiles to. Runs on a throwaway SQLite file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--venues', type=int, default=20)
+        parser.add_argument('--queries', type=int, default=25)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        fd, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        try:
+            db = sqlite3.connect(path)
+            self._load(db, rng, options['rows'], options['venues'])
+            queries = options['queries']
+            venue = rng.randrange(options['venues'])
+            workloads = {
+                "rare term": rng.sample(RARE_WORDS, queries),
+                "common term": rng.choices(WORDS, k=queries),
+            }
+
+            self.stdout.write(
+                f"{'workload':<14}{'filter':<8}{'query':<11}{'median ms':>11}{'p95 ms':>10}"
+            )
+            for workload, terms in workloads.items():
+                for scope, filters, params in (
+                    ("none", "", ()),
+                    ("venue", " AND venue_id = ? AND meal_period = ?", (venue, MealPeriod.LUNCH.value)),
+                ):
+                    like = self._time(db, terms, lambda term: (
+                        "SELECT id FROM ratings_comment "
+                        f"WHERE text LIKE ? ESCAPE '\\'{filters} "
+                        "ORDER BY created_at DESC LIMIT 20",
+                        (f"%{term}%", *params),
+                    ))
+                    fts = self._time(db, terms, lambda term: (
+                        f"SELECT c.id FROM {search.FTS_TABLE} "
+                        f"JOIN ratings_comment c ON c.id = {search.FTS_TABLE}.rowid "
+                        f"WHERE {search.FTS_TABLE} MATCH ?{filters.replace('venue_id', 'c.venue_id').replace('meal_period', 'c.meal_period')} "
+                        f"ORDER BY bm25({search.FTS_TABLE}) LIMIT 20",
+                        (search.build_match_query(term), *params),
+                    ))
+                    for name, timings in (("icontains", like), ("fts5", fts)):
+                        self.stdout.write(
+                            f"{workload:<14}{scope:<8}{name:<11}"
+                            f"{statistics.median(timings):>11.2f}{_p95(timings):>10.2f}"
+                        )
+            db.close()
+        finally:
+            os.remove(path)
+
+    def _load(self, db, rng, rows, venues):
+        db.executescript("""
+            PRAGMA journal_mode = OFF;
+            PRAGMA synchronous = OFF;
+            CREATE TABLE ratings_comment (
+                id INTEGER PRIMARY KEY,
+                venue_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                meal_period SMALLINT NOT NULL,
+                text TEXT NOT NULL,
+                created_at DATETIME NOT NULL,
+                updated_at DATETIME NOT NULL
+            );
+            CREATE INDEX ratings_comment_venue ON ratings_comment (venue_id, meal_period);
+        """)
+        started = time.perf_counter()
+        batch = []
+        for pk in range(1, rows + 1):
+            stamp = f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} 12:00:00"
+            batch.append((
+                pk, rng.randrange(venues), rng.randrange(1, 5000),
+                rng.choice(MEAL_PERIODS), self._text(rng),
+                stamp, stamp,
+            ))
+            if len(batch) == 50_000:
+                db.executemany("INSERT INTO ratings_comment VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+                batch.clear()
+        if batch:
+            db.executemany("INSERT INTO ratings_comment VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+        db.commit()
+        loaded = time.perf_counter()
+
+        for statement in search.CREATE_FTS_SQL:
+            db.execute(statement)
+        db.execute(f"INSERT INTO {search.FTS_TABLE}({search.FTS_TABLE}) VALUES ('rebuild')")
+        db.commit()
+        self.stdout.write(
+            f"Loaded {rows} comments in {loaded - started:.1f}s, "
+            f"built FTS index in {time.perf_counter() - loaded:.1f}s."
+        )
+
+    def _text(self, rng):
+        words = rng.choices(WORDS, k=rng.randint(4, 30))
+        words += rng.choices(RARE_WORDS, k=rng.randint(0, 3))
+        rng.shuffle(words)
+        return " ".join(words)
+
+    def _time(self, db, terms, build):
+        timings = []
+        for term in terms:
+            sql, params = build(term)
+            started = time.perf_counter()
+            db.execute(sql, params).fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
+
+
+def _p95(values):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
@@ -0,0 +1,116 @@
+# ratings/management/commands/bench_listings.py
+
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.http import JsonResponse
+from django.test import RequestFactory
+
+from ratings.models import Comment, MealPeriod, Rating
+from ratings.views import fetch_comments, get_all_comments, get_all_ratings
+
+
+def _before_ratings(request, *args):
+    # get_all_ratings' serialization as it was: values() dicts through JsonResponse.
+    ratings = list(
+        Rating.objects.order_by('-timestamp')
+        .values('id', 'venue_id', 'user_id', 'rating', 'meal_period', 'timestamp')[:int(request.GET['page_size'])]
+    )
+    for rating in ratings:
+        rating['meal_period'] = MealPeriod(rating['meal_period']).label
+    return JsonResponse({'ratings': ratings, 'total_ratings': Rating.objects.count()})
+
+
+def _before_comments(request, *args):
+    # get_all_comments' as it was: a model instance per row, then a dict.
+    comments = Comment.objects.annotate(num_likes=Count('likes')).order_by('-created_at')
+    return JsonResponse({
+        'comments': [
+            {
+                "id": comment.id,
+                "venue_id": comment.venue_id,
+                "user_id": comment.user_id,
+                "meal_period": comment.get_meal_period_display(),
+                "text": comment.text,
+                "like_count": comment.like_count,
+                "created_at": comment.created_at.isoformat(),
+                "updated_at": comment.updated_at.isoformat(),
+            }
+            for comment in comments[:int(request.GET['page_size'])]
+        ],
+        'total_comments': Comment.objects.count(),
+    })
+
+
+def _before_fetch(request, venue_id):
+    # fetch_comments' as it was, without the per-user likes.
+    comments = (
+        Comment.objects.filter(venue_id=venue_id, meal_period=MealPeriod.parse(request.GET['meal_period']))
+        .annotate(num_likes=Count('likes')).order_by('-created_at')
+    )
+    return JsonResponse({'comments': [
+        {
+            "id": comment.id,
+            "venue_id": comment.venue_id,
+            "user_id": comment.user_id,
+            "text": comment.text,
+            "like_count": comment.num_likes,
+            "created_at": comment.created_at.isoformat(),
+            "updated_at": comment.updated_at.isoformat(),
+            "has_liked": False,
+        }
+        for comment in comments
+    ]})
+
+
+class Command(BaseCommand):
+    help = (
+        "CPU time and bytes on the wire for get_all_ratings, get_all_comments and "
+        "fetch_comments: the old JsonResponse path, then the pre-serialized path "
+        "on a cache miss and on a hit, with and without gzip."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--page-size', type=int, default=200)
+        parser.add_argument('--meal-period', default='lunch')
+
+    def handle(self, *args, **options):
+        cache = caches[settings.LISTING_CACHE]
+        factory = RequestFactory()
+        page = {'page_size': options['page_size']}
+        venue_id = (
+            Comment.objects.filter(meal_period=MealPeriod.parse(options['meal_period']))
+            .values_list('venue_id', flat=True).first() or 1
+        )
+        endpoints = [
+            ('get_all_ratings', '/api/ratings/all/', page, get_all_ratings, (), _before_ratings),
+            ('get_all_comments', '/api/comments/all/', page, get_all_comments, (), _before_comments),
+            ('fetch_comments', f'/api/comments/{venue_id}', {'meal_period': options['meal_period']},
+             fetch_comments, (venue_id,), _before_fetch),
+        ]
+        self.stdout.write(f"{options['requests']} requests each, page_size {options['page_size']}")
+        self.stdout.write(f"{'endpoint':<18}{'mode':<16}{'cpu ms/req':>12}{'bytes':>10}")
+        for name, path, params, view, args, before in endpoints:
+            plain = factory.get(path, params)
+            gzipped = factory.get(path, params, HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+            runs = [
+                ('miss, identity', lambda: (cache.clear(), view(plain, *args))[1]),
+                ('miss, gzip', lambda: (cache.clear(), view(gzipped, *args))[1]),
+                ('hit, identity', lambda: view(plain, *args)),
+                ('hit, gzip', lambda: view(gzipped, *args)),
+            ]
+            runs.insert(0, ('before', lambda: before(plain, *args)))
+            for label, call in runs:
+                cpu, size = self._run(options['requests'], call)
+                self.stdout.write(f"{name:<18}{label:<16}{cpu * 1e3:>12.3f}{size:>10}")
+
+    def _run(self, requests, call):
+        response = call()  # Warm up, and fills the cache for the hit runs.
+        started = time.process_time()
+        for _ in range(requests):
+            response = call()
+        return (time.process_time() - started) / requests, len(response.content)
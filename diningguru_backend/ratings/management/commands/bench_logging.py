@@ -0,0 +1,80 @@
+# ratings/management/commands/bench_logging.py
+
+import logging
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from diningguru_backend.log import BackgroundHandler, JsonFormatter
+
+
+def _before(logger, venue_id, user_id, rating, meal_period):
+    # submit_rating's logging as it was: f-strings built whatever the level.
+    logger.debug(f"Received rating submission: venue_id={venue_id}, user_id={user_id}, rating={rating}, meal_period={meal_period}")
+    logger.info(f"Rating submitted successfully by user {user_id} for venue {venue_id}.")
+
+
+def _after(logger, venue_id, user_id, rating, meal_period):
+    # submit_rating's logging now: lazy, structured arguments.
+    logger.debug(
+        "Received rating submission venue_id=%(venue_id)s user_id=%(user_id)s "
+        "rating=%(rating)s meal_period=%(meal_period)s",
+        {"venue_id": venue_id, "user_id": user_id, "rating": rating, "meal_period": meal_period},
+    )
+    logger.info(
+        "Rating submitted user_id=%(user_id)s venue_id=%(venue_id)s",
+        {"user_id": user_id, "venue_id": venue_id},
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Per-request logging overhead of submit_rating on the request thread: the old "
+        "f-string calls with a synchronous file handler vs. the lazy calls with the "
+        "queued background handler, at DEBUG and INFO."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50000)
+        parser.add_argument('--format', choices=['text', 'json'], default='json')
+
+    def handle(self, *args, **options):
+        formatter = (
+            JsonFormatter() if options['format'] == 'json'
+            else logging.Formatter('%(asctime)s %(levelname)s %(name)s %(message)s')
+        )
+        self.stdout.write(f"{options['requests']} requests, {options['format']} lines to a temp file")
+        self.stdout.write(f"{'level':<7}{'variant':<32}{'us/request':>12}")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bench.log')
+            variants = [
+                ('before: f-strings, sync file', _before, lambda: logging.FileHandler(path)),
+                ('after: lazy, background queue', _after, lambda: BackgroundHandler(
+                    'logging.FileHandler', {'filename': path}
+                )),
+            ]
+            for level in (logging.DEBUG, logging.INFO):
+                for name, log_calls, make_handler in variants:
+                    elapsed = self._run(options['requests'], level, log_calls, make_handler(), formatter)
+                    self.stdout.write(
+                        f"{logging.getLevelName(level):<7}{name:<32}"
+                        f"{elapsed / options['requests'] * 1e6:>12.2f}"
+                    )
+
+    def _run(self, requests, level, log_calls, handler, formatter):
+        logger = logging.getLogger('bench_logging')
+        logger.propagate = False
+        logger.setLevel(level)
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
+        try:
+            started = time.perf_counter()
+            for n in range(requests):
+                log_calls(logger, 593, n, 0.5, 'lunch')
+            # Only the request thread's time: the listener drains afterwards.
+            return time.perf_counter() - started
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
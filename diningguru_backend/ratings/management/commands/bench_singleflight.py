@@ -0,0 +1,90 @@
+# ratings/management/commands/bench_singleflight.py
+
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.test import RequestFactory
+
+from ratings.singleflight import flights
+from ratings.views import average_rating, fetch_comments
+from venue_ratings.models import Venue
+
+
+class Command(BaseCommand):
+    help = (
+        "Thundering-herd load test for average_rating and fetch_comments, "
+        "comparing database queries with single-flight coalescing off and on."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=32)
+        parser.add_argument('--rounds', type=int, default=50)
+        parser.add_argument('--venues', type=int, default=4, help="Hot venues hit by every round.")
+        parser.add_argument('--meal-period', default='lunch')
+
+    def handle(self, *args, **options):
+        venue_ids = list(Venue.objects.values_list('id', flat=True)[:options['venues']]) or [1]
+        self.stdout.write(
+            f"{options['threads']} threads x {options['rounds']} rounds over venues {venue_ids}"
+        )
+        self.stdout.write(f"{'mode':<6}{'requests':>10}{'queries':>10}{'q/req':>8}{'wall s':>9}{'q/s':>10}{'req/s':>10}")
+        for enabled in (False, True):
+            flights.enabled = enabled
+            requests, queries, elapsed = self._run(venue_ids, options)
+            self.stdout.write(
+                f"{'on' if enabled else 'off':<6}{requests:>10}{queries:>10}"
+                f"{queries / requests:>8.2f}{elapsed:>9.2f}"
+                f"{queries / elapsed:>10.0f}{requests / elapsed:>10.0f}"
+            )
+        flights.enabled = True
+
+    def _run(self, venue_ids, options):
+        factory = RequestFactory()
+        threads = options['threads']
+        rounds = options['rounds']
+        # Caches go cold as each round starts, so every round is a herd.
+        barrier = threading.Barrier(threads, action=caches[settings.LISTING_CACHE].clear)
+        lock = threading.Lock()
+        totals = {'requests': 0, 'queries': 0}
+
+        def count_queries(execute, sql, params, many, context):
+            with lock:
+                totals['queries'] += 1
+            return execute(sql, params, many, context)
+
+        def worker(n):
+            try:
+                with connection.execute_wrapper(count_queries):
+                    for round_number in range(rounds):
+                        venue_id = venue_ids[round_number % len(venue_ids)]
+                        request = factory.get('/', {'meal_period': options['meal_period'], 'user_id': n + 1})
+                        # Everyone arrives in the same instant, as at the start of a meal period.
+                        barrier.wait()
+                        average_rating(request, venue_id)
+                        fetch_comments(request, venue_id)
+                        # As at the end of a request: with the Postgres pool this
+                        # hands the connection back, so more threads than
+                        # pooled connections can take part.
+                        close_old_connections()
+                        with lock:
+                            totals['requests'] += 2
+            except Exception:
+                # Don't leave the other threads waiting for this one.
+                barrier.abort()
+                raise
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        if barrier.broken:
+            raise CommandError("A worker failed; see its traceback above.")
+        return totals['requests'], totals['queries'], time.perf_counter() - started
@@ -0,0 +1,112 @@
+# ratings/management/commands/bench_startup.py
+
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Run in a fresh interpreter: set up Django, serve one average_rating request
+# through the WSGI handler and print the wall-clock time it completed at.
+WSGI_SCRIPT = """
+import sys, time
+from wsgiref.util import setup_testing_defaults
+from django.core.wsgi import get_wsgi_application
+
+application = get_wsgi_application()
+environ = {'PATH_INFO': sys.argv[1], 'QUERY_STRING': sys.argv[2], 'HTTP_HOST': 'localhost'}
+setup_testing_defaults(environ)
+statuses = []
+b''.join(application(environ, lambda status, headers: statuses.append(status)))
+print(time.time(), statuses[0])
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Cold-start benchmark: time from process start to the first served "
+        "average_rating response, per settings module."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--server', choices=['wsgi', 'gunicorn'], default='wsgi',
+                            help="wsgi: one request in a bare interpreter; gunicorn: poll a real server.")
+        parser.add_argument('--settings-module', action='append', dest='settings_modules',
+                            help="Repeatable. Defaults to the development and production settings.")
+        parser.add_argument('--venue-id', type=int, default=1)
+        parser.add_argument('--meal-period', default='lunch')
+
+    def handle(self, *args, **options):
+        modules = options['settings_modules'] or [
+            'diningguru_backend.settings',
+            'diningguru_backend.settings_production',
+        ]
+        path = f"/api/ratings/{options['venue_id']}/average"
+        query = f"meal_period={options['meal_period']}"
+        run = self._run_gunicorn if options['server'] == 'gunicorn' else self._run_wsgi
+
+        self.stdout.write(f"{options['runs']} cold starts per module via {options['server']}, GET {path}?{query}")
+        self.stdout.write(f"{'settings':<42}{'min ms':>9}{'median ms':>11}{'max ms':>9}")
+        for module in modules:
+            env = {
+                **os.environ,
+                'DJANGO_SETTINGS_MODULE': module,
+                # The production settings refuse to start without a key.
+                'DJANGO_SECRET_KEY': os.environ.get('DJANGO_SECRET_KEY', 'bench-startup-only'),
+            }
+            # One discarded start so every measured run finds compiled bytecode.
+            run(env, path, query)
+            timings = [run(env, path, query) for _ in range(options['runs'])]
+            self.stdout.write(
+                f"{module:<42}{min(timings):>9.0f}"
+                f"{statistics.median(timings):>11.0f}{max(timings):>9.0f}"
+            )
+
+    def _run_wsgi(self, env, path, query):
+        started = time.time()
+        result = subprocess.run(
+            [sys.executable, '-c', WSGI_SCRIPT, path, query],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            raise CommandError(result.stderr.strip())
+        served_at, status = result.stdout.split(' ', 1)
+        if not status.startswith('200'):
+            raise CommandError(f"{env['DJANGO_SETTINGS_MODULE']} answered {status.strip()}")
+        return (float(served_at) - started) * 1000
+
+    def _run_gunicorn(self, env, path, query):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        started = time.time()
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+             '--bind', f'127.0.0.1:{port}', '--workers', '1'],
+            cwd=settings.BASE_DIR, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        )
+        try:
+            while True:
+                if server.poll() is not None:
+                    raise CommandError(server.stderr.read().decode().strip())
+                try:
+                    client = http.client.HTTPConnection('localhost', port, timeout=5)
+                    client.request('GET', f"{path}?{query}")
+                    status = client.getresponse().status
+                    client.close()
+                except OSError:
+                    time.sleep(0.005)
+                    continue
+                if status != 200:
+                    raise CommandError(f"{env['DJANGO_SETTINGS_MODULE']} answered {status}")
+                return (time.time() - started) * 1000
+        finally:
+            server.terminate()
+            server.wait()
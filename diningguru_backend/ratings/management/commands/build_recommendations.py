@@ -0,0 +1,37 @@
+# ratings/management/commands/build_recommendations.py
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ratings.recommendations import recommendation_store
+
+
+class Command(BaseCommand):
+    help = (
+        "Build each user's top venues per meal period into RECOMMENDATIONS_PATH. "
+        "By default only users who rated since the last build are recomputed; "
+        "run with --full periodically, and after archive_ratings, to refresh "
+        "the venue similarities too. Needs requirements-recommendations.txt."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Recompute everything from every rating.")
+        parser.add_argument('-k', type=int, help="Venues per user and meal period; defaults to RECOMMENDATIONS_K.")
+
+    def handle(self, *args, **options):
+        if not recommendation_store.enabled:
+            raise CommandError("No recommendations file configured; set RECOMMENDATIONS_PATH.")
+        try:
+            from ratings import recommender
+        except ImportError as exc:
+            raise CommandError(
+                f"{exc}; install requirements-recommendations.txt to build recommendations."
+            )
+
+        started = time.perf_counter()
+        users, full = recommender.build(recommendation_store.path, k=options['k'], full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Built' if full else 'Updated'} recommendations for {users} users in "
+            f"{recommendation_store.path} in {time.perf_counter() - started:.2f}s."
+        ))
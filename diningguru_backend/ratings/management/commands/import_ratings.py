@@ -0,0 +1,223 @@
+# ratings/management/commands/import_ratings.py
+
+import csv
+import itertools
+import json
+import sys
+import time
+from contextlib import nullcontext
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from ratings import listings, prewarm, search
+from ratings.aggregate_store import aggregate_store
+from ratings.models import RATING_MAX, RATING_MIN, ArchivedRating, Comment, MealPeriod, Rating, RatingAggregate
+from venue_ratings.models import Venue
+
+UNIQUE_FIELDS = ['venue', 'meal_period', 'user']
+IMPORT_TABLES = [Rating._meta.db_table, Comment._meta.db_table]
+PROGRESS_SECONDS = 5
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-load historical ratings and comments from CSV or JSONL. Each row "
+        "has email, venue_id, meal_period and a rating and/or a comment; rows "
+        "replace any existing rating or comment with the same key."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, or - for stdin.")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="Defaults to the file extension.")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows per transaction.")
+        parser.add_argument('--create-users', action='store_true',
+                            help="Create accounts for unknown emails instead of skipping their rows.")
+        parser.add_argument('--drop-indexes', action='store_true',
+                            help="Drop secondary indexes (and search triggers) for the load and rebuild them after.")
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or ('csv' if options['path'].endswith('.csv') else 'jsonl')
+        self.create_users = options['create_users']
+        self.user_ids = {}
+        self.known_venue_ids = set()
+        self.comment_keys = set()
+        self.counts = {'rows': 0, 'ratings': 0, 'comments': 0, 'skipped': 0}
+
+        source = sys.stdin if options['path'] == '-' else open(options['path'], newline='', encoding='utf-8')
+        started = reported = time.perf_counter()
+        try:
+            with _DroppedIndexes(self.stdout) if options['drop_indexes'] else nullcontext():
+                # Only one batch is held at a time, whatever the file size.
+                rows = self._read(source, file_format)
+                while batch := list(itertools.islice(rows, options['batch_size'])):
+                    self._load(batch)
+                    now = time.perf_counter()
+                    if now - reported >= PROGRESS_SECONDS:
+                        reported = now
+                        self.stdout.write(
+                            f"{self.counts['rows']} rows, {self.counts['rows'] / (now - started):.0f} rows/s"
+                        )
+        finally:
+            if source is not sys.stdin:
+                source.close()
+        load_elapsed = time.perf_counter() - started
+
+        # Bulk writes bypass Rating.submit, so fold them in afterwards.
+        if self.counts['ratings']:
+            RatingAggregate.rebuild()
+            if aggregate_store.enabled:
+                aggregate_store.rebuild()
+        listings.invalidate('ratings')
+        listings.invalidate('comments')
+        prewarm.forget_comments(self.comment_keys)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {self.counts['ratings']} ratings and {self.counts['comments']} comments "
+            f"from {self.counts['rows']} rows ({self.counts['skipped']} skipped) in {load_elapsed:.1f}s, "
+            f"{self.counts['rows'] / max(load_elapsed, 1e-9):.0f} rows/s; "
+            f"{time.perf_counter() - started:.1f}s with aggregates."
+        ))
+
+    def _read(self, source, file_format):
+        if file_format == 'csv':
+            yield from csv.DictReader(source)
+            return
+        for line_number, line in enumerate(source, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                raise CommandError(f"Line {line_number}: {e}")
+
+    def _load(self, batch):
+        self.counts['rows'] += len(batch)
+        user_ids = self._resolve_users({str(row.get('email') or '').strip() for row in batch})
+        user_ids[''] = None
+
+        # Keyed so a repeated (venue, meal period, user) in one batch keeps
+        # its last row; Postgres rejects one upsert touching a row twice.
+        ratings, comments = {}, {}
+        for row in batch:
+            try:
+                key = (
+                    int(row['venue_id']),
+                    MealPeriod.parse(row['meal_period']),
+                    user_ids[str(row.get('email') or '').strip()],
+                )
+                rating = row.get('rating')
+                rating = None if rating in (None, '') else float(rating)
+                text = row.get('comment') or None
+            except (KeyError, TypeError, ValueError):
+                self.counts['skipped'] += 1
+                continue
+            if (
+                None in key
+                or (rating is None and text is None)
+                or (rating is not None and not RATING_MIN <= rating <= RATING_MAX)
+            ):
+                self.counts['skipped'] += 1
+                continue
+            if rating is not None:
+                ratings[key] = rating
+            if text is not None:
+                comments[key] = text
+
+        new_venue_ids = {venue_id for venue_id, _, _ in itertools.chain(ratings, comments)} - self.known_venue_ids
+        with transaction.atomic():
+            if new_venue_ids:
+                Venue.objects.bulk_create([Venue(id=venue_id) for venue_id in new_venue_ids], ignore_conflicts=True)
+            Rating.objects.bulk_create(
+                [
+                    Rating(venue_id=venue_id, meal_period=meal_period, user_id=user_id, rating=rating)
+                    for (venue_id, meal_period, user_id), rating in ratings.items()
+                ],
+                update_conflicts=True, unique_fields=UNIQUE_FIELDS, update_fields=['rating', 'updated_at'],
+            )
+            # As in Rating.submit, a rating replaces an archived one for the same key.
+            superseded = [
+                archived_id
+                for archived_id, *key in ArchivedRating.objects.filter(
+                    user_id__in={user_id for _, _, user_id in ratings}
+                ).values_list('id', 'venue_id', 'meal_period', 'user_id')
+                if tuple(key) in ratings
+            ]
+            if superseded:
+                ArchivedRating.objects.filter(id__in=superseded).delete()
+            Comment.objects.bulk_create(
+                [
+                    Comment(venue_id=venue_id, meal_period=meal_period, user_id=user_id, text=text)
+                    for (venue_id, meal_period, user_id), text in comments.items()
+                ],
+                update_conflicts=True, unique_fields=UNIQUE_FIELDS, update_fields=['text', 'updated_at'],
+            )
+        self.known_venue_ids |= new_venue_ids
+        self.counts['ratings'] += len(ratings)
+        self.counts['comments'] += len(comments)
+        self.comment_keys.update((venue_id, meal_period) for venue_id, meal_period, _ in comments)
+
+    def _resolve_users(self, emails):
+        """
+        Map emails to user ids (None if unknown), querying only emails not
+        seen in earlier batches.
+        """
+        missing = {email for email in emails if email and email not in self.user_ids}
+        if missing:
+            found = dict(User.objects.filter(email__in=missing).values_list('email', 'id'))
+            if self.create_users and len(found) < len(missing):
+                # Same shape as login_or_signup's accounts.
+                new_emails = missing - found.keys()
+                User.objects.bulk_create(
+                    [User(username=email, email=email) for email in new_emails], ignore_conflicts=True
+                )
+                found.update(User.objects.filter(email__in=new_emails).values_list('email', 'id'))
+            self.user_ids.update(dict.fromkeys(missing))
+            self.user_ids.update(found)
+        return self.user_ids
+
+
+class _DroppedIndexes:
+    """
+    Drop the non-unique indexes on the rating and comment tables, and on
+    SQLite the comment search triggers, then recreate them on exit, even if
+    the load fails. The unique indexes stay: the upserts need them.
+    """
+
+    def __init__(self, stdout):
+        self.stdout = stdout
+        self.indexes = []
+
+    def __enter__(self):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    "SELECT indexname, indexdef FROM pg_indexes "
+                    "WHERE tablename = ANY(%s) AND indexdef NOT LIKE 'CREATE UNIQUE%%'",
+                    [IMPORT_TABLES],
+                )
+            else:
+                cursor.execute(
+                    "SELECT name, sql FROM sqlite_master WHERE type = 'index' "
+                    "AND tbl_name IN (%s, %s) AND sql IS NOT NULL AND sql NOT LIKE 'CREATE UNIQUE%%'",
+                    IMPORT_TABLES,
+                )
+            self.indexes = cursor.fetchall()
+            for name, _ in self.indexes:
+                cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+            if connection.vendor == 'sqlite':
+                for statement in search.DROP_FTS_SQL[:-1]:
+                    cursor.execute(statement)
+        self.stdout.write(f"Dropped {len(self.indexes)} indexes for the load.")
+
+    def __exit__(self, *exc):
+        started = time.perf_counter()
+        with connection.cursor() as cursor:
+            for _, sql in self.indexes:
+                cursor.execute(sql)
+        if connection.vendor == 'sqlite':
+            # Recreates the triggers and reindexes every comment.
+            search.rebuild_index()
+        self.stdout.write(f"Rebuilt indexes in {time.perf_counter() - started:.1f}s.")
+        return False
@@ -0,0 +1,60 @@
+# ratings/management/commands/prewarm_meal_periods.py
+
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from ratings import prewarm
+from ratings.meal_clock import current_meal_period, dining_date, next_meal_period
+from ratings.models import MealPeriod
+
+
+class Command(BaseCommand):
+    help = (
+        "Warm every venue's comment list shortly before each meal "
+        "period starts, and log each period's warm-cache hit rates when it ends. "
+        "Needs a cache shared with the web workers (LISTING_CACHE)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lead-seconds', type=int, help="Defaults to PREWARM_LEAD_SECONDS.")
+        parser.add_argument('--once', action='store_true',
+                            help="Warm the current meal period (or the next, when closed) and exit.")
+        parser.add_argument('--report', action='store_true', help="Print hit rates and exit.")
+        parser.add_argument('--meal-period', help="For --once or --report; defaults to the current one.")
+        parser.add_argument('--date', help="For --report, YYYY-MM-DD; defaults to today at the dining halls.")
+
+    def handle(self, *args, **options):
+        period = current_meal_period()
+        if options['meal_period']:
+            code = MealPeriod.parse(options['meal_period'])
+            if code is None:
+                raise CommandError(f"Invalid meal period {options['meal_period']!r}.")
+            period = MealPeriod(code)
+
+        if options['report']:
+            day = parse_date(options['date']) if options['date'] else dining_date()
+            if day is None:
+                raise CommandError(f"Invalid date {options['date']!r}; expected YYYY-MM-DD.")
+            for kind, (hits, misses) in prewarm.hit_rates(day, period).items():
+                self.stdout.write(
+                    f"{day} {period.label:<10}{kind:<9}{hits:>8} hits{misses:>8} misses"
+                    f"{hits / max(hits + misses, 1):>8.1%}"
+                )
+            return
+
+        if options['once']:
+            if period == MealPeriod.CLOSED:
+                period = next_meal_period()[1]
+            venues = prewarm.warm(period)
+            self.stdout.write(self.style.SUCCESS(f"Warmed {period.label} for {venues} venues."))
+            return
+
+        start, period = next_meal_period()
+        self.stdout.write(f"Next: {period.label} at {start.isoformat()}; logging to the 'ratings.prewarm' logger.")
+        stop = threading.Event()
+        try:
+            prewarm.Scheduler(options['lead_seconds']).run(stop)
+        except KeyboardInterrupt:
+            stop.set()
@@ -0,0 +1,40 @@
+# ratings/management/commands/rebuild_aggregate_store.py
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ratings.aggregate_store import aggregate_store
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the shared-memory aggregate store from the RatingAggregate table "
+        "and check it against the raw Rating rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify-only', action='store_true', help="Check the store without rebuilding it.")
+
+    def handle(self, *args, **options):
+        if not aggregate_store.enabled:
+            raise CommandError("No aggregate store configured; set AGGREGATE_STORE_PATH.")
+
+        if not options['verify_only']:
+            started = time.perf_counter()
+            loaded = aggregate_store.rebuild()
+            self.stdout.write(
+                f"Loaded {loaded} aggregates into {aggregate_store.path} "
+                f"in {time.perf_counter() - started:.2f}s."
+            )
+
+        started = time.perf_counter()
+        mismatched = aggregate_store.verify()
+        if mismatched is None:
+            raise CommandError(f"{aggregate_store.path} is missing or not ready.")
+        elapsed = time.perf_counter() - started
+        if mismatched:
+            for venue_id, meal_period in mismatched[:20]:
+                self.stdout.write(f"  venue {venue_id} meal_period {meal_period} differs")
+            raise CommandError(f"{len(mismatched)} aggregates differ from the Rating rows.")
+        self.stdout.write(self.style.SUCCESS(f"Store matches the Rating rows ({elapsed:.2f}s)."))
@@ -0,0 +1,24 @@
+# ratings/management/commands/rebuild_comment_search.py
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from ratings import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index over comment text."
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError("Comment search needs the SQLite or Postgres backend.")
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            indexed = search.rebuild_index(connection)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {indexed} comments in {elapsed:.2f}s."
+        ))
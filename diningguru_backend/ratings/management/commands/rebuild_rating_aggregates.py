@@ -0,0 +1,22 @@
+# ratings/management/commands/rebuild_rating_aggregates.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from ratings.aggregate_store import aggregate_store
+from ratings.models import RatingAggregate
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-venue rating aggregates and histograms from the Rating table."
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rebuilt = RatingAggregate.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {rebuilt} aggregates in {time.perf_counter() - started:.2f}s."
+        ))
+        if aggregate_store.enabled:
+            aggregate_store.rebuild()
+            self.stdout.write(f"Reloaded the aggregate store at {aggregate_store.path}.")
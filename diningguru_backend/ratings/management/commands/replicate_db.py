@@ -0,0 +1,34 @@
+# ratings/management/commands/replicate_db.py
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from diningguru_backend.replication import replicate
+from diningguru_backend.routers import PRIMARY, REPLICA
+
+
+class Command(BaseCommand):
+    help = "Copy the primary SQLite database to the read replica, once or on an interval."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0, help="Seconds between copies; 0 copies once.")
+        parser.add_argument('--pages', type=int, default=1024, help="Pages copied per backup step.")
+
+    def handle(self, *args, **options):
+        databases = settings.DATABASES
+        if REPLICA not in databases:
+            raise CommandError("No replica database configured; set REPLICA_DB_NAME.")
+        if databases[PRIMARY]['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError("File replication only applies to the SQLite backend.")
+
+        primary_path = str(databases[PRIMARY]['NAME'])
+        replica_path = str(databases[REPLICA]['NAME'])
+        while True:
+            started = time.perf_counter()
+            replicate(primary_path, replica_path, pages=options['pages'])
+            self.stdout.write(f"Replicated to {replica_path} in {time.perf_counter() - started:.2f}s.")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
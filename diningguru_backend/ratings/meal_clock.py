@@ -0,0 +1,46 @@
+# ratings/meal_clock.py
+
+import datetime
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import MealPeriod
+
+
+def _starts():
+    # [(hour, MealPeriod)] by hour; each period runs until the next one starts.
+    return sorted((hour, MealPeriod(MealPeriod.parse(name))) for hour, name in settings.MEAL_PERIOD_STARTS)
+
+
+def _local(now):
+    return (now or timezone.now()).astimezone(ZoneInfo(settings.DINING_TIME_ZONE))
+
+
+def dining_date(now=None):
+    """The date at the dining halls at `now` (default: now)."""
+    return _local(now).date()
+
+
+def current_meal_period(now=None):
+    """The meal period the dining halls are in at `now` (default: now)."""
+    local = _local(now)
+    starts = _starts()
+    current = starts[-1][1]  # Before the first start, the last one is still running.
+    for hour, period in starts:
+        if hour <= local.hour:
+            current = period
+    return current
+
+
+def next_meal_period(now=None):
+    """The (aware start time, MealPeriod) of the next period to begin after `now`."""
+    local = _local(now)
+    starts = _starts()
+    for hour, period in starts:
+        if hour > local.hour:
+            return local.replace(hour=hour, minute=0, second=0, microsecond=0), period
+    hour, period = starts[0]
+    tomorrow = local.date() + datetime.timedelta(days=1)
+    return datetime.datetime.combine(tomorrow, datetime.time(hour), tzinfo=local.tzinfo), period
@@ -1,6 +1,5 @@
 # Generated by Django 5.1.3 on 2024-11-30 00:09
 
-import django.utils.timezone
 from django.db import migrations, models
 
 
@@ -14,13 +13,13 @@ class Migration(migrations.Migration):
         migrations.AlterField(
             model_name='comment',
             name='meal_period',
-            field=models.CharField(default=django.utils.timezone.now, max_length=20),
+            field=models.CharField(default='', max_length=20),
             preserve_default=False,
         ),
         migrations.AlterField(
             model_name='rating',
             name='meal_period',
-            field=models.CharField(default=django.utils.timezone.now, max_length=20),
+            field=models.CharField(default='', max_length=20),
             preserve_default=False,
         ),
     ]
@@ -0,0 +1,64 @@
+from django.db import migrations
+
+# SQLite-only: an external-content FTS5 index over ratings_comment.text, kept
+# in sync by triggers. Other backends skip this migration.
+
+FORWARD_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS ratings_comment_fts USING fts5(
+        text,
+        content='ratings_comment',
+        content_rowid='id',
+        tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS ratings_comment_fts_ai AFTER INSERT ON ratings_comment BEGIN
+        INSERT INTO ratings_comment_fts(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS ratings_comment_fts_ad AFTER DELETE ON ratings_comment BEGIN
+        INSERT INTO ratings_comment_fts(ratings_comment_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS ratings_comment_fts_au AFTER UPDATE OF text ON ratings_comment BEGIN
+        INSERT INTO ratings_comment_fts(ratings_comment_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        INSERT INTO ratings_comment_fts(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    "INSERT INTO ratings_comment_fts(ratings_comment_fts) VALUES ('rebuild')",
+]
+
+REVERSE_SQL = [
+    "DROP TRIGGER IF EXISTS ratings_comment_fts_au",
+    "DROP TRIGGER IF EXISTS ratings_comment_fts_ad",
+    "DROP TRIGGER IF EXISTS ratings_comment_fts_ai",
+    "DROP TABLE IF EXISTS ratings_comment_fts",
+]
+
+
+def create_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in FORWARD_SQL:
+        schema_editor.execute(statement)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in REVERSE_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ratings', '0004_alter_comment_meal_period_alter_rating_meal_period'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
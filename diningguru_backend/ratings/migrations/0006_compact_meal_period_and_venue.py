@@ -0,0 +1,192 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+MEAL_PERIOD_CODES = {
+    'breakfast': 1,
+    'lunch': 2,
+    'dinner': 3,
+    'closed': 4,
+}
+UNKNOWN_MEAL_PERIOD = 0
+
+MEAL_PERIOD_CHOICES = [
+    (0, 'unknown'),
+    (1, 'breakfast'),
+    (2, 'lunch'),
+    (3, 'dinner'),
+    (4, 'closed'),
+]
+
+# Django rebuilds ratings_comment on SQLite, which drops the FTS triggers
+# from 0005; they are recreated at the end of this migration.
+FTS_TRIGGER_SQL = [
+    """
+    CREATE TRIGGER IF NOT EXISTS ratings_comment_fts_ai AFTER INSERT ON ratings_comment BEGIN
+        INSERT INTO ratings_comment_fts(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS ratings_comment_fts_ad AFTER DELETE ON ratings_comment BEGIN
+        INSERT INTO ratings_comment_fts(ratings_comment_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS ratings_comment_fts_au AFTER UPDATE OF text ON ratings_comment BEGIN
+        INSERT INTO ratings_comment_fts(ratings_comment_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        INSERT INTO ratings_comment_fts(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    "INSERT INTO ratings_comment_fts(ratings_comment_fts) VALUES ('rebuild')",
+]
+
+
+def populate_venues_and_codes(apps, schema_editor):
+    Venue = apps.get_model('venue_ratings', 'Venue')
+    db = schema_editor.connection.alias
+    for model_name in ('Rating', 'Comment'):
+        model = apps.get_model('ratings', model_name)
+        venue_ids = model.objects.using(db).values_list('venue_id', flat=True).distinct()
+        Venue.objects.using(db).bulk_create(
+            [Venue(id=venue_id) for venue_id in venue_ids], ignore_conflicts=True
+        )
+        periods = model.objects.using(db).values_list('meal_period', flat=True).distinct()
+        for period in periods:
+            code = MEAL_PERIOD_CODES.get((period or '').strip().lower(), UNKNOWN_MEAL_PERIOD)
+            model.objects.using(db).filter(meal_period=period).update(meal_period_code=code)
+
+
+def restore_meal_period_names(apps, schema_editor):
+    names = {code: name for name, code in MEAL_PERIOD_CODES.items()}
+    db = schema_editor.connection.alias
+    for model_name in ('Rating', 'Comment'):
+        model = apps.get_model('ratings', model_name)
+        for code in model.objects.using(db).values_list('meal_period_code', flat=True).distinct():
+            model.objects.using(db).filter(meal_period_code=code).update(
+                meal_period=names.get(code, 'unknown')
+            )
+
+
+def recreate_fts_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in FTS_TRIGGER_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ratings', '0005_comment_fts'),
+        ('venue_ratings', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='comment',
+            unique_together=set(),
+        ),
+        migrations.AlterUniqueTogether(
+            name='rating',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='meal_period_code',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='rating',
+            name='meal_period_code',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_venues_and_codes, restore_meal_period_names),
+        # A default lets the old column be re-added when migrating backwards.
+        migrations.AlterField(
+            model_name='comment',
+            name='meal_period',
+            field=models.CharField(default='unknown', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='rating',
+            name='meal_period',
+            field=models.CharField(default='unknown', max_length=20),
+        ),
+        migrations.RemoveField(
+            model_name='comment',
+            name='meal_period',
+        ),
+        migrations.RemoveField(
+            model_name='rating',
+            name='meal_period',
+        ),
+        migrations.RenameField(
+            model_name='comment',
+            old_name='meal_period_code',
+            new_name='meal_period',
+        ),
+        migrations.RenameField(
+            model_name='rating',
+            old_name='meal_period_code',
+            new_name='meal_period',
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='meal_period',
+            field=models.PositiveSmallIntegerField(choices=MEAL_PERIOD_CHOICES),
+        ),
+        migrations.AlterField(
+            model_name='rating',
+            name='meal_period',
+            field=models.PositiveSmallIntegerField(choices=MEAL_PERIOD_CHOICES),
+        ),
+        # venue_id keeps its column; only the model field becomes a foreign
+        # key to the Venue dimension table. The unique index below leads with
+        # venue_id, so the standalone foreign key index is not created.
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.AlterField(
+                    model_name='comment',
+                    name='venue_id',
+                    field=models.ForeignKey(db_column='venue_id', db_index=False, on_delete=django.db.models.deletion.CASCADE, to='venue_ratings.venue'),
+                ),
+                migrations.AlterField(
+                    model_name='rating',
+                    name='venue_id',
+                    field=models.ForeignKey(db_column='venue_id', db_index=False, on_delete=django.db.models.deletion.CASCADE, to='venue_ratings.venue'),
+                ),
+            ],
+            state_operations=[
+                migrations.RemoveField(
+                    model_name='comment',
+                    name='venue_id',
+                ),
+                migrations.RemoveField(
+                    model_name='rating',
+                    name='venue_id',
+                ),
+                migrations.AddField(
+                    model_name='comment',
+                    name='venue',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='venue_ratings.venue'),
+                    preserve_default=False,
+                ),
+                migrations.AddField(
+                    model_name='rating',
+                    name='venue',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='venue_ratings.venue'),
+                    preserve_default=False,
+                ),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='comment',
+            unique_together={('venue', 'meal_period', 'user')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='rating',
+            unique_together={('venue', 'meal_period', 'user')},
+        ),
+        migrations.RunPython(recreate_fts_triggers, migrations.RunPython.noop),
+    ]
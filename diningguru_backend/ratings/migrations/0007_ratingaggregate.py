@@ -0,0 +1,57 @@
+# Generated by Django 5.1.3 on 2026-10-19 04:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+RATING_MIN = -1.0
+BUCKET_WIDTH = 0.4
+HISTOGRAM_BUCKETS = 5
+
+
+def backfill_aggregates(apps, schema_editor):
+    Rating = apps.get_model('ratings', 'Rating')
+    RatingAggregate = apps.get_model('ratings', 'RatingAggregate')
+    db = schema_editor.connection.alias
+    totals = {}
+    for venue_id, meal_period, rating in Rating.objects.using(db).values_list('venue_id', 'meal_period', 'rating').iterator():
+        aggregate = totals.setdefault(
+            (venue_id, meal_period), RatingAggregate(venue_id=venue_id, meal_period=meal_period)
+        )
+        aggregate.count += 1
+        aggregate.total += rating
+        aggregate.total_squares += rating * rating
+        bucket = min(max(int((rating - RATING_MIN) // BUCKET_WIDTH), 0), HISTOGRAM_BUCKETS - 1)
+        field = f'bucket_{bucket}'
+        setattr(aggregate, field, getattr(aggregate, field) + 1)
+    RatingAggregate.objects.using(db).bulk_create(totals.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ratings', '0006_compact_meal_period_and_venue'),
+        ('venue_ratings', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatingAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('meal_period', models.PositiveSmallIntegerField(choices=[(0, 'unknown'), (1, 'breakfast'), (2, 'lunch'), (3, 'dinner'), (4, 'closed')])),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.FloatField(default=0.0)),
+                ('total_squares', models.FloatField(default=0.0)),
+                ('bucket_0', models.PositiveIntegerField(default=0)),
+                ('bucket_1', models.PositiveIntegerField(default=0)),
+                ('bucket_2', models.PositiveIntegerField(default=0)),
+                ('bucket_3', models.PositiveIntegerField(default=0)),
+                ('bucket_4', models.PositiveIntegerField(default=0)),
+                ('venue', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='venue_ratings.venue')),
+            ],
+            options={
+                'unique_together': {('venue', 'meal_period')},
+            },
+        ),
+        migrations.RunPython(backfill_aggregates, migrations.RunPython.noop),
+    ]
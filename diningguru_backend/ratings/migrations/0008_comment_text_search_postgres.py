@@ -0,0 +1,30 @@
+from django.db import migrations
+
+# Postgres counterpart of 0005: a GIN expression index for comment search.
+# SQLite keeps using the FTS5 table and skips this migration.
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS ratings_comment_text_fts ON ratings_comment "
+        "USING gin (to_tsvector('english', text))"
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS ratings_comment_text_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ratings', '0007_ratingaggregate'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.1.3 on 2026-10-19 04:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ratings', '0008_comment_text_search_postgres'),
+        ('venue_ratings', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedRating',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('rating', models.FloatField()),
+                ('meal_period', models.PositiveSmallIntegerField(choices=[(0, 'unknown'), (1, 'breakfast'), (2, 'lunch'), (3, 'dinner'), (4, 'closed')])),
+                ('timestamp', models.DateTimeField()),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('venue', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='venue_ratings.venue')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['timestamp'], name='ratings_arch_rating_ts')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedComment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('meal_period', models.PositiveSmallIntegerField(choices=[(0, 'unknown'), (1, 'breakfast'), (2, 'lunch'), (3, 'dinner'), (4, 'closed')])),
+                ('compressed_text', models.BinaryField()),
+                ('like_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('venue', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='venue_ratings.venue')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at'], name='ratings_arch_comment_ts')],
+            },
+        ),
+    ]
@@ -0,0 +1,127 @@
+# Generated by Django 5.1.3 on 2026-10-19 04:31
+#
+# Comment.likes gets an explicit through model, CommentLike, on the table the
+# implicit one already had, so a like can carry its time. Only the state
+# changes for that step; the table then gains created_at, and the per-user
+# activity indexes replace the single-column user indexes.
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+# Django rebuilds ratings_comment on SQLite, which drops the FTS triggers
+# from 0005; they are recreated at the end of this migration.
+FTS_TRIGGER_SQL = [
+    """
+    CREATE TRIGGER IF NOT EXISTS ratings_comment_fts_ai AFTER INSERT ON ratings_comment BEGIN
+        INSERT INTO ratings_comment_fts(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS ratings_comment_fts_ad AFTER DELETE ON ratings_comment BEGIN
+        INSERT INTO ratings_comment_fts(ratings_comment_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS ratings_comment_fts_au AFTER UPDATE OF text ON ratings_comment BEGIN
+        INSERT INTO ratings_comment_fts(ratings_comment_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        INSERT INTO ratings_comment_fts(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+]
+
+
+def backfill_like_times(apps, schema_editor):
+    # When older likes happened is unknown; the liked comment's creation is
+    # the closest lower bound and keeps them out of the top of the feed.
+    CommentLike = apps.get_model('ratings', 'CommentLike')
+    Comment = apps.get_model('ratings', 'Comment')
+    CommentLike.objects.update(
+        created_at=models.Subquery(
+            Comment.objects.filter(id=models.OuterRef('comment_id')).values('created_at')[:1]
+        )
+    )
+
+
+def recreate_fts_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in FTS_TRIGGER_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ratings', '0009_archivedcomment_archivedrating'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Last when migrating backwards.
+        migrations.RunPython(migrations.RunPython.noop, recreate_fts_triggers),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                # Exactly the implicit through model's table.
+                migrations.CreateModel(
+                    name='CommentLike',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('comment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='ratings.comment')),
+                        ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'db_table': 'ratings_comment_likes',
+                        'unique_together': {('comment', 'user')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='comment',
+                    name='likes',
+                    field=models.ManyToManyField(blank=True, related_name='liked_comments', through='ratings.CommentLike', to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='commentlike',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_like_times, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(fields=['user', 'timestamp', 'id', 'venue', 'meal_period', 'rating'], name='ratings_rating_activity'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['user', 'updated_at', 'id'], name='ratings_comment_activity'),
+        ),
+        migrations.AddIndex(
+            model_name='commentlike',
+            index=models.Index(fields=['user', 'created_at', 'id', 'comment'], name='ratings_like_activity'),
+        ),
+        # Prefixes of the indexes above, or of unique_together.
+        migrations.AlterField(
+            model_name='rating',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='commentlike',
+            name='comment',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='ratings.comment'),
+        ),
+        migrations.AlterField(
+            model_name='commentlike',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(recreate_fts_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.3 on 2026-10-19 04:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_updated_at(apps, schema_editor):
+    # Until now a rating's only time was its first submission.
+    Rating = apps.get_model('ratings', 'Rating')
+    Rating.objects.update(updated_at=models.F('timestamp'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ratings', '0010_commentlike_activity_indexes'),
+        ('venue_ratings', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rating',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(fields=['updated_at'], name='ratings_rating_updated'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.3 on 2026-10-19 05:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ratings', '0011_rating_updated_at'),
+        ('venue_ratings', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='archivedrating',
+            index=models.Index(fields=['user', 'venue', 'meal_period'], name='ratings_arch_rating_key'),
+        ),
+    ]
@@ -1,33 +1,500 @@
 # ratings/models.py
 
-from django.db import models
+import itertools
+import zlib
+
+from django.db import connection, models, transaction
+from django.db.models import Count, F
 from django.contrib.auth.models import User
+from venue_ratings.models import Venue
+
+from . import listings
+
+
+class MealPeriod(models.IntegerChoices):
+    # Stored as a small integer; the label is the name clients send and receive.
+    UNKNOWN = 0, 'unknown'
+    BREAKFAST = 1, 'breakfast'
+    LUNCH = 2, 'lunch'
+    DINNER = 3, 'dinner'
+    CLOSED = 4, 'closed'
+
+    @classmethod
+    def parse(cls, value):
+        """Map a client-supplied meal period name (any case) to its code, or None."""
+        if not isinstance(value, str):
+            return None
+        return _MEAL_PERIOD_CODES.get(value.strip().lower())
+
+
+_MEAL_PERIOD_CODES = {
+    period.label: period.value for period in MealPeriod if period != MealPeriod.UNKNOWN
+}
+
 
 class Rating(models.Model):
-    venue_id = models.IntegerField()
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    venue = models.ForeignKey(Venue, on_delete=models.CASCADE, db_index=False)  # Covered by unique_together
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)  # Covered by the activity index
     rating = models.FloatField()
-    meal_period = models.CharField(max_length=20)
+    meal_period = models.PositiveSmallIntegerField(choices=MealPeriod.choices)
     timestamp = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
-        unique_together = ('venue_id', 'user', 'meal_period')  # Ensures one rating per user per venue per meal period
+        # One rating per user per venue per meal period; (venue, meal_period)
+        # leads so per-venue aggregates are an index prefix scan.
+        unique_together = ('venue', 'meal_period', 'user')
+        indexes = [
+            # A user's ratings newest first, answered from the index alone.
+            models.Index(
+                fields=['user', 'timestamp', 'id', 'venue', 'meal_period', 'rating'],
+                name='ratings_rating_activity',
+            ),
+            # Who rated since the last recommendations build.
+            models.Index(fields=['updated_at'], name='ratings_rating_updated'),
+        ]
+
+    @classmethod
+    def submit(cls, venue_id, user_id, meal_period, rating):
+        """
+        Create or replace a user's rating (live or archived) and fold the
+        change into the venue's RatingAggregate in the same transaction
+        (copied into the shared aggregate store once it commits). Returns True
+        if a new rating was created.
+        """
+        from .aggregate_store import aggregate_store
+
+        with transaction.atomic():
+            # Writers for the same venue and meal period queue on the
+            # aggregate row, so `previous` cannot change under us, even for
+            # a double-tapped first rating.
+            RatingAggregate.lock(venue_id, meal_period)
+            key = dict(venue_id=venue_id, user_id=user_id, meal_period=meal_period)
+            previous = cls.objects.filter(**key).values_list('rating', flat=True).first()
+            if previous is None:
+                # An archived rating still counts in the aggregate; the new
+                # one replaces it there, and in the archive.
+                archived = ArchivedRating.objects.filter(**key).order_by('-timestamp', '-id').first()
+                if archived is not None:
+                    previous = archived.rating
+                    archived.delete()
+            # INSERT ... ON CONFLICT DO UPDATE on both SQLite and Postgres.
+            cls.objects.bulk_create(
+                [cls(rating=rating, **key)],
+                update_conflicts=True,
+                unique_fields=['venue', 'meal_period', 'user'],
+                update_fields=['rating', 'updated_at'],
+            )
+            RatingAggregate.record(venue_id, meal_period, rating, previous)
+            transaction.on_commit(lambda: aggregate_store.record(venue_id, meal_period))
+            transaction.on_commit(lambda: listings.invalidate('ratings'))
+        return previous is None
+
+
+# Fixed histogram over the client's rating scale (-1.0 "way worse" to 1.0
+# "way better" in steps of 0.5), one bucket per step.
+RATING_MIN = -1.0
+RATING_MAX = 1.0
+HISTOGRAM_BUCKETS = 5
+BUCKET_WIDTH = (RATING_MAX - RATING_MIN) / HISTOGRAM_BUCKETS
+BUCKET_FIELDS = [f'bucket_{n}' for n in range(HISTOGRAM_BUCKETS)]
+
+
+class RatingAggregate(models.Model):
+    """
+    Running count, sum, sum of squares and histogram of the ratings for one
+    venue and meal period, maintained by Rating.submit so reads never scan
+    the Rating table.
+    """
+    venue = models.ForeignKey(Venue, on_delete=models.CASCADE, db_index=False)  # Covered by unique_together
+    meal_period = models.PositiveSmallIntegerField(choices=MealPeriod.choices)
+    count = models.PositiveIntegerField(default=0)
+    total = models.FloatField(default=0.0)
+    total_squares = models.FloatField(default=0.0)
+    bucket_0 = models.PositiveIntegerField(default=0)
+    bucket_1 = models.PositiveIntegerField(default=0)
+    bucket_2 = models.PositiveIntegerField(default=0)
+    bucket_3 = models.PositiveIntegerField(default=0)
+    bucket_4 = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('venue', 'meal_period')
+
+    @staticmethod
+    def bucket_for(rating):
+        index = int((rating - RATING_MIN) // BUCKET_WIDTH)
+        return min(max(index, 0), HISTOGRAM_BUCKETS - 1)
+
+    @classmethod
+    def lock(cls, venue_id, meal_period):
+        """Lock this venue's aggregate row for the current transaction, creating it if needed."""
+        rows = cls.objects.select_for_update().filter(venue_id=venue_id, meal_period=meal_period)
+        if not list(rows.values_list('pk', flat=True)):
+            cls.objects.bulk_create(
+                [cls(venue_id=venue_id, meal_period=meal_period)], ignore_conflicts=True
+            )
+            # Lock whichever row now exists, ours or a concurrent writer's.
+            list(rows.values_list('pk', flat=True))
+
+    @classmethod
+    def deltas(cls, rating, previous=None):
+        """Field changes for a new rating, or for replacing `previous` with `rating`."""
+        deltas = {BUCKET_FIELDS[cls.bucket_for(rating)]: 1}
+        if previous is None:
+            deltas['count'] = 1
+            deltas['total'] = rating
+            deltas['total_squares'] = rating * rating
+        else:
+            old_bucket = BUCKET_FIELDS[cls.bucket_for(previous)]
+            deltas[old_bucket] = deltas.get(old_bucket, 0) - 1
+            deltas['total'] = rating - previous
+            deltas['total_squares'] = rating * rating - previous * previous
+        return {field: delta for field, delta in deltas.items() if delta}
+
+    @classmethod
+    def record(cls, venue_id, meal_period, rating, previous=None):
+        """Add a new rating, or replace `previous` with `rating` on a re-rate."""
+        updates = {field: F(field) + delta for field, delta in cls.deltas(rating, previous).items()}
+        if not updates:
+            return
+        rows = cls.objects.filter(venue_id=venue_id, meal_period=meal_period)
+        if not rows.update(**updates):
+            cls.objects.bulk_create(
+                [cls(venue_id=venue_id, meal_period=meal_period)], ignore_conflicts=True
+            )
+            rows.update(**updates)
+
+    @classmethod
+    def compute(cls):
+        """
+        Recompute every aggregate from the Rating and ArchivedRating rows,
+        unsaved, keyed by (venue_id, meal_period).
+        """
+        totals = {}
+        columns = ('venue_id', 'meal_period', 'rating')
+        rows = itertools.chain(
+            Rating.objects.values_list(*columns).iterator(),
+            ArchivedRating.objects.values_list(*columns).iterator(),
+        )
+        for venue_id, meal_period, rating in rows:
+            aggregate = totals.get((venue_id, meal_period))
+            if aggregate is None:
+                aggregate = totals[(venue_id, meal_period)] = cls(
+                    venue_id=venue_id, meal_period=meal_period
+                )
+            aggregate.count += 1
+            aggregate.total += rating
+            aggregate.total_squares += rating * rating
+            field = BUCKET_FIELDS[cls.bucket_for(rating)]
+            setattr(aggregate, field, getattr(aggregate, field) + 1)
+        return totals
+
+    @classmethod
+    def rebuild(cls):
+        """
+        Recompute every aggregate from the (live and archived) ratings. Returns
+        the row count. Rating writers wait for it to finish, so none is lost
+        between the recount and the swap; reads go on.
+        """
+        with transaction.atomic():
+            # SQLite's IMMEDIATE transactions already hold the write lock.
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(f'LOCK TABLE {cls._meta.db_table} IN EXCLUSIVE MODE')
+            totals = cls.compute()
+            cls.objects.all().delete()
+            cls.objects.bulk_create(totals.values(), batch_size=500)
+        return len(totals)
+
+    @property
+    def buckets(self):
+        return [getattr(self, field) for field in BUCKET_FIELDS]
+
+    @property
+    def average(self):
+        return self.total / self.count if self.count else 0.0
+
+    @property
+    def variance(self):
+        if not self.count:
+            return 0.0
+        return max(self.total_squares / self.count - self.average ** 2, 0.0)
+
+    def percentile(self, q):
+        """Estimate the q-th percentile by interpolating inside the histogram."""
+        if not self.count:
+            return None
+        target = self.count * q / 100
+        seen = 0
+        for index, bucket in enumerate(self.buckets):
+            if bucket and seen + bucket >= target:
+                low = RATING_MIN + index * BUCKET_WIDTH
+                return low + BUCKET_WIDTH * (target - seen) / bucket
+            seen += bucket
+        return RATING_MAX
+
+    def histogram(self):
+        percentiles = {q: self.percentile(q) for q in (25, 50, 75, 90)}
+        return {
+            "buckets": [
+                {
+                    "min": round(RATING_MIN + index * BUCKET_WIDTH, 4),
+                    "max": round(RATING_MIN + (index + 1) * BUCKET_WIDTH, 4),
+                    "count": bucket,
+                }
+                for index, bucket in enumerate(self.buckets)
+            ],
+            "variance": round(self.variance, 6),
+            "stddev": round(self.variance ** 0.5, 6),
+            "percentiles": {
+                f"p{q}": None if value is None else round(value, 4)
+                for q, value in percentiles.items()
+            },
+        }
 
 class Comment(models.Model):
-    venue_id = models.IntegerField()
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    venue = models.ForeignKey(Venue, on_delete=models.CASCADE, db_index=False)  # Covered by unique_together
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)  # Covered by the activity index
     text = models.TextField()
-    meal_period = models.CharField(max_length=20)
-    likes = models.ManyToManyField(User, related_name='liked_comments', blank=True)
+    meal_period = models.PositiveSmallIntegerField(choices=MealPeriod.choices)
+    likes = models.ManyToManyField(User, through='CommentLike', related_name='liked_comments', blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
-        unique_together = ('venue_id', 'user', 'meal_period')  # Ensures one comment per user per venue per meal period
+        unique_together = ('venue', 'meal_period', 'user')  # Ensures one comment per user per venue per meal period
+        indexes = [models.Index(fields=['user', 'updated_at', 'id'], name='ratings_comment_activity')]
+
+    @classmethod
+    def submit(cls, venue_id, user_id, meal_period, text):
+        """
+        Create or replace a user's comment with one INSERT ... ON CONFLICT DO
+        UPDATE, then read back the stored row (with its original created_at
+        and current like count).
+        """
+        key = dict(venue_id=venue_id, user_id=user_id, meal_period=meal_period)
+        with transaction.atomic():
+            cls.objects.bulk_create(
+                [cls(text=text, **key)],
+                update_conflicts=True,
+                unique_fields=['venue', 'meal_period', 'user'],
+                update_fields=['text', 'updated_at'],
+            )
+            _comments_changed([(venue_id, meal_period)])
+            return cls.objects.annotate(num_likes=Count('likes')).get(**key)
 
     @property
     def like_count(self):
+        if hasattr(self, 'num_likes'):
+            return self.num_likes
         return self.likes.count()
 
     def has_liked(self, user):
         return self.likes.filter(id=user.id).exists()
+
+    @classmethod
+    def set_liked(cls, comment_id, user_id, liked):
+        """
+        Like or unlike a comment and return its new like count.
+
+        One conflict-ignoring insert (or one delete) on the through table and
+        one count (which also reads the comment's venue and meal period, whose
+        warm list it drops), in a single transaction, so repeated or concurrent taps
+        are idempotent. Liking with a missing user or comment raises
+        IntegrityError; unliking raises User.DoesNotExist or
+        Comment.DoesNotExist, looked up only when nothing was deleted.
+        """
+        CommentLike = cls.likes.through
+        with transaction.atomic():
+            if liked:
+                CommentLike.objects.bulk_create(
+                    [CommentLike(comment_id=comment_id, user_id=user_id)], ignore_conflicts=True
+                )
+            elif not CommentLike.objects.filter(comment_id=comment_id, user_id=user_id).delete()[0]:
+                _check_exists(User, user_id)
+                _check_exists(cls, comment_id)
+            row = (
+                cls.objects.filter(id=comment_id).annotate(n=Count('likes'))
+                .values_list('venue_id', 'meal_period', 'n').first()
+            )
+            if row is None:
+                # Liked a missing comment: the insert fails at commit.
+                return 0
+            _comments_changed([row[:2]])
+            return row[2]
+
+    @classmethod
+    def apply_like_toggles(cls, user_id, toggles):
+        """
+        Apply a batch of (comment_id, liked) toggles for one user and return
+        {comment_id: like_count}. The last toggle per comment wins; the whole
+        batch is one insert, one delete and one grouped count. A missing user
+        raises IntegrityError, or User.DoesNotExist for a batch of unlikes
+        that deleted nothing.
+        """
+        desired = dict(toggles)
+        liked_ids = [comment_id for comment_id, liked in desired.items() if liked]
+        unliked_ids = [comment_id for comment_id, liked in desired.items() if not liked]
+        CommentLike = cls.likes.through
+        with transaction.atomic():
+            if liked_ids:
+                CommentLike.objects.bulk_create(
+                    [CommentLike(comment_id=comment_id, user_id=user_id) for comment_id in liked_ids],
+                    ignore_conflicts=True,
+                )
+            if unliked_ids:
+                deleted = CommentLike.objects.filter(comment_id__in=unliked_ids, user_id=user_id).delete()[0]
+                if not liked_ids and not deleted:
+                    _check_exists(User, user_id)
+            rows = list(
+                cls.objects.filter(id__in=desired).annotate(n=Count('likes'))
+                .values_list('id', 'venue_id', 'meal_period', 'n')
+            )
+            _comments_changed([(venue_id, meal_period) for _, venue_id, meal_period, _ in rows])
+        counts = {comment_id: n for comment_id, _, _, n in rows}
+        return {comment_id: counts.get(comment_id, 0) for comment_id in desired}
+
+
+def _check_exists(model, pk):
+    if not model.objects.filter(pk=pk).exists():
+        raise model.DoesNotExist(f"{model.__name__} {pk} does not exist.")
+
+
+def _comments_changed(keys):
+    """On commit, drop the comment listings and the warm lists of these (venue_id, meal_period) keys."""
+    from . import prewarm
+
+    keys = set(keys)
+    transaction.on_commit(lambda: listings.invalidate('comments'))
+    transaction.on_commit(lambda: prewarm.forget_comments(keys))
+
+
+class CommentLike(models.Model):
+    """A user's like of a comment: the through table of Comment.likes."""
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, db_index=False)  # Covered by unique_together
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)  # Covered by the activity index
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # The table the implicit through model had.
+        db_table = 'ratings_comment_likes'
+        unique_together = ('comment', 'user')
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'id', 'comment'], name='ratings_like_activity'),
+        ]
+
+
+class ArchivedRating(models.Model):
+    """
+    A Rating moved out of the live table by archive_ratings. It keeps its
+    original id and still counts in RatingAggregate until the user rates the
+    same venue and meal period again, which replaces it.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    venue = models.ForeignKey(Venue, on_delete=models.CASCADE, db_index=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    rating = models.FloatField()
+    meal_period = models.PositiveSmallIntegerField(choices=MealPeriod.choices)
+    timestamp = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['timestamp'], name='ratings_arch_rating_ts'),
+            # Rating.submit's lookup of a re-rated key.
+            models.Index(fields=['user', 'venue', 'meal_period'], name='ratings_arch_rating_key'),
+        ]
+
+    @classmethod
+    def archive_batch(cls, cutoff, batch_size):
+        """
+        Move up to batch_size ratings last changed before cutoff in one short
+        transaction. Returns the number moved.
+        """
+        with transaction.atomic():
+            candidates = list(
+                Rating.objects.filter(updated_at__lt=cutoff).order_by('id')
+                .values_list('id', 'venue_id', 'meal_period')[:batch_size]
+            )
+            if not candidates:
+                return 0
+            # Take the aggregate locks first, as Rating.submit does, so a
+            # concurrent re-rate either lands before the move (and the rating
+            # stays) or finds it archived and replaces it there.
+            list(
+                RatingAggregate.objects.select_for_update()
+                .filter(
+                    venue_id__in={venue_id for _, venue_id, _ in candidates},
+                    meal_period__in={meal_period for _, _, meal_period in candidates},
+                )
+                .order_by('pk').values_list('pk', flat=True)
+            )
+            archived = [
+                cls(**row)
+                for row in Rating.objects.select_for_update()
+                .filter(id__in=[rating_id for rating_id, _, _ in candidates], updated_at__lt=cutoff)
+                .values('id', 'venue_id', 'user_id', 'rating', 'meal_period', 'timestamp')
+            ]
+            cls.objects.bulk_create(archived, ignore_conflicts=True)
+            Rating.objects.filter(id__in=[rating.id for rating in archived]).delete()
+            # Listings without include_archived lose these rows.
+            transaction.on_commit(lambda: listings.invalidate('ratings'))
+        return len(archived)
+
+
+class ArchivedComment(models.Model):
+    """
+    A Comment moved out of the live table by archive_ratings: text
+    zlib-compressed, likes kept as a count.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    venue = models.ForeignKey(Venue, on_delete=models.CASCADE, db_index=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    meal_period = models.PositiveSmallIntegerField(choices=MealPeriod.choices)
+    compressed_text = models.BinaryField()
+    like_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [models.Index(fields=['created_at'], name='ratings_arch_comment_ts')]
+
+    @property
+    def text(self):
+        return zlib.decompress(self.compressed_text).decode()
+
+    @classmethod
+    def archive_batch(cls, cutoff, batch_size):
+        """
+        Move up to batch_size comments last edited before cutoff, with their
+        like counts, in one short transaction. Returns the number moved.
+        """
+        with transaction.atomic():
+            ids = list(
+                Comment.objects.filter(updated_at__lt=cutoff).order_by('id')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                return 0
+            # Locked before counting likes: Postgres refuses FOR UPDATE with GROUP BY.
+            ids = list(
+                Comment.objects.select_for_update()
+                .filter(id__in=ids, updated_at__lt=cutoff).values_list('id', flat=True)
+            )
+            archived = [
+                cls(
+                    id=comment.id,
+                    venue_id=comment.venue_id,
+                    user_id=comment.user_id,
+                    meal_period=comment.meal_period,
+                    compressed_text=zlib.compress(comment.text.encode()),
+                    like_count=comment.num_likes,
+                    created_at=comment.created_at,
+                    updated_at=comment.updated_at,
+                )
+                for comment in Comment.objects.filter(id__in=ids).annotate(num_likes=Count('likes'))
+            ]
+            cls.objects.bulk_create(archived, ignore_conflicts=True)
+            # Also removes the likes and, on SQLite, the search index entries.
+            Comment.objects.filter(id__in=ids).delete()
+            _comments_changed([(comment.venue_id, comment.meal_period) for comment in archived])
+        return len(ids)
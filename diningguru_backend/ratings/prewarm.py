@@ -0,0 +1,220 @@
+# ratings/prewarm.py
+
+import datetime
+import itertools
+import logging
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db.models import Count
+from django.utils import timezone
+
+from . import listings
+from .aggregate_store import aggregate_store
+from .meal_clock import current_meal_period, dining_date, next_meal_period
+from .models import Comment, MealPeriod, RatingAggregate
+from .singleflight import flights
+from venue_ratings.models import Venue
+
+logger = logging.getLogger(__name__)
+
+COMMENT_FIELDS = ('id', 'venue_id', 'user_id', 'text', 'like_count', 'created_at', 'updated_at')
+STATS_SECONDS = 2 * 86400
+
+
+def aggregate(venue_id, meal_period):
+    """
+    The venue's RatingAggregate for the period: from the shared aggregate
+    store when it is built, else from the table (one unique-index row, one
+    query shared by concurrent callers). It is not cached here: a
+    per-process copy would go stale as other workers take ratings.
+    """
+    value = aggregate_store.get(venue_id, meal_period)
+    _count('average', meal_period, hit=value is not None)
+    if value is None:
+        value = flights.do(
+            ('average_rating', venue_id, meal_period),
+            lambda: load_aggregate(venue_id, meal_period),
+        )
+    return value
+
+
+def comments(venue_id, meal_period):
+    """
+    The venue's comments for the period, newest first, through the warm
+    cache. A miss fills it only when the cache is shared: a write drops the
+    list only in caches the writer can see.
+    """
+    key = _comment_keys([(venue_id, meal_period)])[venue_id, meal_period]
+    value = _cache().get(key)
+    _count('comments', meal_period, hit=value is not None)
+    if value is None:
+        value = flights.do(
+            ('fetch_comments', venue_id, meal_period),
+            lambda: load_comments(venue_id, meal_period),
+        )
+        if _shared():
+            _cache().set(key, value, settings.PREWARM_CACHE_SECONDS)
+    return value
+
+
+def forget_comments(keys):
+    """Drop the warm comment lists of these (venue_id, meal_period) keys."""
+    _cache().delete_many([_version_key(venue_id, meal_period) for venue_id, meal_period in set(keys)])
+
+
+def load_aggregate(venue_id, meal_period):
+    return (
+        RatingAggregate.objects.filter(venue_id=venue_id, meal_period=meal_period).first()
+        or RatingAggregate(venue_id=venue_id, meal_period=meal_period)
+    )
+
+
+def load_comments(venue_id, meal_period):
+    return _comment_rows(Comment.objects.filter(venue_id=venue_id, meal_period=meal_period))
+
+
+def warm(meal_period):
+    """
+    Cache every venue's comment list for the period, in one query, for
+    PREWARM_CACHE_SECONDS, or in a per-process cache for no longer than the
+    listing bodies (LISTING_CACHE_SECONDS) go stale. Returns the number of
+    venues.
+    """
+    venue_ids = list(Venue.objects.values_list('id', flat=True))
+    keys = _comment_keys([(venue_id, meal_period) for venue_id in venue_ids])
+    rows = _comment_rows(Comment.objects.filter(meal_period=meal_period), order=('venue_id',))
+    by_venue = {venue_id: list(group) for venue_id, group in itertools.groupby(rows, lambda row: row['venue_id'])}
+    _cache().set_many(
+        {keys[venue_id, meal_period]: by_venue.get(venue_id, []) for venue_id in venue_ids},
+        settings.PREWARM_CACHE_SECONDS if _shared()
+        else min(settings.PREWARM_CACHE_SECONDS, settings.LISTING_CACHE_SECONDS),
+    )
+    return len(venue_ids)
+
+
+def hit_rates(day, meal_period):
+    """{'average': (hits, misses), 'comments': (hits, misses)} for requests on that dining day."""
+    keys = {
+        (kind, hit): _stats_key(day, meal_period, kind, hit)
+        for kind in ('average', 'comments') for hit in (True, False)
+    }
+    counts = _cache().get_many(keys.values())
+    return {
+        kind: (counts.get(keys[kind, True], 0), counts.get(keys[kind, False], 0))
+        for kind in ('average', 'comments')
+    }
+
+
+class Scheduler:
+    """
+    Warm the caches PREWARM_LEAD_SECONDS before each meal period starts and,
+    once it ends, log how many of its requests were served warm.
+    """
+
+    def __init__(self, lead_seconds=None):
+        self.lead = settings.PREWARM_LEAD_SECONDS if lead_seconds is None else lead_seconds
+
+    def run(self, stop):
+        """Loop until the `stop` event is set."""
+        while True:
+            start, period = next_meal_period()
+            if stop.wait(max((start - timezone.now()).total_seconds() - self.lead, 0)):
+                return
+            if period != MealPeriod.CLOSED:
+                try:
+                    venues = warm(period)
+                except Exception:
+                    logger.exception("Pre-warming failed meal_period=%(meal_period)s", {"meal_period": period.label})
+                else:
+                    logger.info(
+                        "Pre-warmed meal_period=%(meal_period)s venues=%(venues)s",
+                        {"meal_period": period.label, "venues": venues},
+                    )
+            # Just past the start, so the next loop looks at the period after.
+            if stop.wait(max((start - timezone.now()).total_seconds(), 0) + 1):
+                return
+            self.report(start - datetime.timedelta(seconds=1))
+
+    def report(self, when):
+        """Log the hit rates of the meal period in progress at `when`."""
+        period = current_meal_period(when)
+        if period == MealPeriod.CLOSED:
+            return
+        for kind, (hits, misses) in hit_rates(dining_date(when), period).items():
+            logger.info(
+                "Warm cache meal_period=%(meal_period)s kind=%(kind)s hits=%(hits)s "
+                "misses=%(misses)s hit_rate=%(hit_rate).3f",
+                {"meal_period": period.label, "kind": kind, "hits": hits, "misses": misses,
+                 "hit_rate": hits / max(hits + misses, 1)},
+            )
+
+
+def start_scheduler():
+    """Run a Scheduler on a daemon thread of this process; returns its stop event."""
+    stop = threading.Event()
+    threading.Thread(target=Scheduler().run, args=(stop,), name='prewarm', daemon=True).start()
+    return stop
+
+
+def _cache():
+    return caches[settings.LISTING_CACHE]
+
+
+def _shared():
+    # Local memory is the only per-process backend Django ships.
+    return not isinstance(_cache(), LocMemCache)
+
+
+def _comment_keys(keys):
+    """
+    {(venue_id, meal_period): cache key} for each key's comment list, under
+    the key's current version.
+    """
+    cache = _cache()
+    version_keys = {key: _version_key(*key) for key in keys}
+    versions = cache.get_many(version_keys.values())
+    for version_key in version_keys.values():
+        if version_key not in versions:
+            # First use, or dropped by a write (or evicted): a new random
+            # version, so a list loaded before the write, or cached under an
+            # earlier version, is never read again.
+            version = uuid.uuid4().hex
+            versions[version_key] = version if cache.add(version_key, version, None) else (
+                cache.get(version_key) or version
+            )
+    return {
+        (venue_id, meal_period): f'warm:comments:{versions[version_key]}:{venue_id}:{meal_period}'
+        for (venue_id, meal_period), version_key in version_keys.items()
+    }
+
+
+def _version_key(venue_id, meal_period):
+    return f'warm:comments:version:{venue_id}:{int(meal_period)}'
+
+
+def _count(kind, meal_period, hit):
+    key = _stats_key(dining_date(), meal_period, kind, hit)
+    cache = _cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, STATS_SECONDS)
+        cache.incr(key)
+
+
+def _stats_key(day, meal_period, kind, hit):
+    return f'warm:stats:{day.isoformat()}:{int(meal_period)}:{kind}:{"hit" if hit else "miss"}'
+
+
+def _comment_rows(queryset, order=()):
+    return listings.rows(
+        COMMENT_FIELDS,
+        queryset.annotate(like_count=Count('likes'))
+        .order_by(*order, '-created_at')
+        .values_list(*COMMENT_FIELDS),
+        {'created_at': datetime.datetime.isoformat, 'updated_at': datetime.datetime.isoformat},
+    )
@@ -0,0 +1,196 @@
+# ratings/recommendations.py
+
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from collections import namedtuple
+
+from django.conf import settings
+
+from .models import MealPeriod
+
+# File layout: a 64-byte header, the venue ids (uint32), then per meal period
+# a venues x venues float32 item-item similarity matrix, then per meal period
+# `rows` rows of `k` (venue_id, score) entries, best first, indexed by user id.
+# Row 0 holds the most popular venues; venue id 0 ends a short row. Files are
+# never changed once READY: `manage.py build_recommendations` writes a new one
+# and swaps it in.
+MAGIC = b'DGREC\x00\x00\x01'
+HEADER = struct.Struct('<8sIIIIqq')  # magic, state, k, rows, venues, built_at, similarities_built_at
+HEADER_SIZE = 64
+STATE = struct.Struct('<I')
+STATE_OFFSET = 8
+VENUE = struct.Struct('<I')
+SIMILARITY = struct.Struct('<f')
+ENTRY = struct.Struct('<If')  # venue_id, score
+
+BUILDING, READY, RETIRED = 0, 1, 2
+
+PERIODS = (MealPeriod.BREAKFAST, MealPeriod.LUNCH, MealPeriod.DINNER)
+POPULAR_ROW = 0
+
+Header = namedtuple('Header', 'magic state k rows venues built_at similarities_built_at')
+Layout = namedtuple('Layout', 'venues similarities entries size')
+
+
+def layout(k, rows, venues):
+    """The byte offsets of each section, and the file size."""
+    similarities = HEADER_SIZE + venues * VENUE.size
+    entries = similarities + len(PERIODS) * venues * venues * SIMILARITY.size
+    return Layout(HEADER_SIZE, similarities, entries, entries + len(PERIODS) * rows * k * ENTRY.size)
+
+
+def period_index(meal_period):
+    """The position of `meal_period` in PERIODS, or None if nothing is recommended for it."""
+    try:
+        return PERIODS.index(meal_period)
+    except ValueError:
+        return None
+
+
+def write(path, k, venue_ids, similarities, entries, built_at, similarities_built_at):
+    """
+    Write a READY file to `path` and retire the one it replaces. The venue
+    ids are a sequence of ints; `similarities` and `entries` are buffers
+    laid out as above (C-ordered numpy arrays of float32 and of ('<u4', '<f4')
+    records will do). built_at and similarities_built_at are microseconds
+    since the epoch.
+    """
+    venues = len(venue_ids)
+    rows, remainder = divmod(memoryview(entries).nbytes, len(PERIODS) * k * ENTRY.size)
+    offsets = layout(k, rows, venues)
+    if remainder or memoryview(similarities).nbytes != offsets.entries - offsets.similarities:
+        raise ValueError(f"Sections do not match k={k} and {venues} venues.")
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.recommendations-')
+    try:
+        with os.fdopen(fd, 'r+b') as file:
+            file.truncate(offsets.size)
+            with mmap.mmap(file.fileno(), 0) as buf:
+                HEADER.pack_into(buf, 0, MAGIC, BUILDING, k, rows, venues, built_at, similarities_built_at)
+                struct.pack_into(f'<{venues}I', buf, offsets.venues, *venue_ids)
+                buf[offsets.similarities:offsets.entries] = _raw(similarities)
+                buf[offsets.entries:offsets.size] = _raw(entries)
+                STATE.pack_into(buf, STATE_OFFSET, READY)
+        os.chmod(tmp_path, 0o644)
+        try:
+            old = open(path, 'r+b')
+        except FileNotFoundError:
+            old = None
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    if old is not None:
+        # Processes mapping the old file see this and map the new one.
+        with old:
+            old.seek(STATE_OFFSET)
+            old.write(STATE.pack(RETIRED))
+
+
+def read_header(buf):
+    return Header(*HEADER.unpack_from(buf, 0))
+
+
+def _raw(section):
+    view = memoryview(section)
+    # Slice assignment into the mapping wants plain bytes.
+    return view if view.format == 'B' and view.ndim == 1 and view.c_contiguous else view.tobytes()
+
+
+class RecommendationStore:
+    """
+    Each user's top-K venues per meal period, read from the memory-mapped
+    file the build job writes, so the endpoint answers with one slice of
+    the mapping and no database query.
+
+    Processes keep the file mapped; when a build swaps in a new one it marks
+    the old one RETIRED, and readers map the new one on their next get().
+    """
+
+    def __init__(self, path=None):
+        self._path = path
+        self._lock = threading.Lock()
+        self._buf = None
+
+    @property
+    def path(self):
+        return str(self._path if self._path is not None else getattr(settings, 'RECOMMENDATIONS_PATH', ''))
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def get(self, user_id, meal_period):
+        """
+        ([(venue_id, score)], personalized) for the user and meal period, best
+        first: the user's own row, or the most popular venues if the build
+        had nothing for them. None if no file has been built.
+        """
+        buf = self._mapping()
+        index = period_index(meal_period)
+        if buf is None or index is None:
+            return None
+        header = read_header(buf)
+        if 0 < user_id < header.rows:
+            entries = self._row(buf, header, index, user_id)
+            if entries:
+                return entries, True
+        return self._row(buf, header, index, POPULAR_ROW), False
+
+    def open(self):
+        """The current file's mapping (read-only), or None if it has not been built."""
+        return self._mapping()
+
+    def close(self):
+        with self._lock:
+            # Left for the garbage collector: a reader may still hold it.
+            self._buf = None
+
+    def _mapping(self):
+        buf = self._buf
+        if buf is not None and STATE.unpack_from(buf, STATE_OFFSET)[0] != RETIRED:
+            return buf
+        with self._lock:
+            if self._buf is not buf:
+                return self._buf
+            self._buf = None
+            if self.enabled:
+                self._buf = self._open(self.path)
+            return self._buf
+
+    @staticmethod
+    def _open(path):
+        try:
+            file = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        with file:
+            size = os.fstat(file.fileno()).st_size
+            if size < HEADER_SIZE:
+                return None
+            buf = mmap.mmap(file.fileno(), size, access=mmap.ACCESS_READ)
+        header = read_header(buf)
+        if (
+            header.magic == MAGIC and header.state == READY
+            and size == layout(header.k, header.rows, header.venues).size
+        ):
+            return buf
+        buf.close()
+        return None
+
+    @staticmethod
+    def _row(buf, header, index, row):
+        size = header.k * ENTRY.size
+        offset = layout(header.k, header.rows, header.venues).entries + (index * header.rows + row) * size
+        entries = []
+        for venue_id, score in ENTRY.iter_unpack(buf[offset:offset + size]):
+            if not venue_id:
+                break
+            entries.append((venue_id, score))
+        return entries
+
+
+recommendation_store = RecommendationStore()
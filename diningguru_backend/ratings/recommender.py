@@ -0,0 +1,193 @@
+# ratings/recommender.py
+
+"""
+The offline half of the venue recommendations: load the ratings into one
+sparse user x venue matrix per meal period, compute item-item similarities
+and each user's top-K venues in batch, and write them for
+ratings.recommendations to serve. Needs numpy and scipy
+(requirements-recommendations.txt); the web workers never import it.
+"""
+
+import datetime
+import itertools
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Max
+from django.utils import timezone
+from scipy import sparse
+
+from . import recommendations
+from .activity import EPOCH, ONE_MICROSECOND
+from .models import Rating, RatingAggregate
+from venue_ratings.models import Venue
+
+COLUMNS = ('user_id', 'venue_id', 'meal_period', 'rating')
+RATING = np.dtype([('user', '<u4'), ('venue', '<u4'), ('period', 'u1'), ('rating', '<f4')])
+ENTRY = np.dtype([('venue', '<u4'), ('score', '<f4')])
+
+# Similarities between venues few users have rated both of are shrunk
+# towards 0 by n / (n + SIMILARITY_SHRINKAGE); popularity is the mean
+# rating shrunk towards the period's mean as if POPULARITY_SHRINKAGE
+# more people had rated it that.
+SIMILARITY_SHRINKAGE = 10
+POPULARITY_SHRINKAGE = 5
+# Re-read ratings from slightly before the last build, so that a rating whose
+# transaction committed after the build had read the table is not missed.
+# Rebuilding a user twice is harmless.
+INCREMENTAL_OVERLAP = datetime.timedelta(minutes=5)
+USERS_PER_QUERY = 500
+
+
+def build(path, k=None, full=False):
+    """
+    Write the recommendations file at `path`. Unless `full`, an existing
+    file is updated for the users who rated since it was built, with its
+    similarities as they were; a full build recomputes everything, and is
+    also done when there is no file yet or a venue has appeared since.
+    Returns (users rebuilt, full build?).
+    """
+    k = k or settings.RECOMMENDATIONS_K
+    started = timezone.now()
+    venue_ids = np.array(sorted(Venue.objects.values_list('id', flat=True)), dtype='<u4')
+    rows = (User.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+    periods = len(recommendations.PERIODS)
+
+    previous = None if full else recommendations.RecommendationStore(path).open()
+    if previous is not None:
+        header = recommendations.read_header(previous)
+        offsets = recommendations.layout(header.k, header.rows, header.venues)
+        old_venue_ids = np.frombuffer(previous, '<u4', header.venues, offsets.venues)
+        if header.k == k and np.array_equal(old_venue_ids, venue_ids):
+            since = _datetime(header.built_at) - INCREMENTAL_OVERLAP
+            # A range scan of ratings_rating_updated, then of each user's
+            # ratings on ratings_rating_activity.
+            user_ids = sorted(set(
+                Rating.objects.filter(updated_at__gte=since).values_list('user_id', flat=True)
+            ))
+            ratings = _load_ratings(itertools.chain.from_iterable(
+                Rating.objects.filter(user_id__in=chunk).values_list(*COLUMNS).iterator()
+                for chunk in _chunks(user_ids, USERS_PER_QUERY)
+            ), venue_ids)
+            similarities = np.frombuffer(
+                previous, '<f4', periods * header.venues * header.venues, offsets.similarities
+            ).reshape(periods, header.venues, header.venues)
+            rows = max(rows, header.rows, user_ids[-1] + 1 if user_ids else 0)
+            entries = np.zeros((periods, rows, k), ENTRY)
+            entries[:, :header.rows] = np.frombuffer(
+                previous, ENTRY, periods * header.rows * k, offsets.entries
+            ).reshape(periods, header.rows, k)
+            # Rows are rebuilt whole, so a user whose ratings for a period are
+            # gone falls back to the popular venues.
+            entries[:, user_ids] = 0
+            _recommend(entries, ratings, venue_ids, similarities, k)
+            recommendations.write(
+                path, k, venue_ids, similarities, entries, _micros(started), header.similarities_built_at,
+            )
+            return len(user_ids), False
+
+    ratings = _load_ratings(Rating.objects.values_list(*COLUMNS).iterator(), venue_ids)
+    if len(ratings):
+        rows = max(rows, int(ratings['user'].max()) + 1)
+    similarities = np.stack([
+        _similarities(_matrix(ratings[ratings['period'] == period], venue_ids, rows))
+        for period in recommendations.PERIODS
+    ]) if len(venue_ids) else np.zeros((periods, 0, 0), '<f4')
+    entries = np.zeros((periods, rows, k), ENTRY)
+    _recommend(entries, ratings, venue_ids, similarities, k)
+    recommendations.write(path, k, venue_ids, similarities, entries, _micros(started), _micros(started))
+    return len(np.unique(ratings['user'])), True
+
+
+def _recommend(entries, ratings, venue_ids, similarities, k):
+    """Fill the popularity rows and the rows of every user in `ratings`."""
+    for index, period in enumerate(recommendations.PERIODS):
+        popularity = _popularity(period, venue_ids)
+        entries[index, recommendations.POPULAR_ROW] = _top(popularity[np.newaxis], venue_ids, k)[0]
+
+        period_ratings = ratings[ratings['period'] == period]
+        user_ids = np.unique(period_ratings['user'])
+        if not len(user_ids):
+            continue
+        matrix = _matrix(period_ratings, venue_ids, entries.shape[1])[user_ids]
+        rated = matrix.copy()
+        rated.data[:] = 1
+        weights = np.abs(similarities[index])
+        numerator = np.asarray(matrix @ similarities[index])
+        denominator = np.asarray(rated @ weights)
+        # Venues nobody who rated this user's venues has rated score by
+        # popularity; the user's own ratings stand as they are.
+        scores = np.where(
+            denominator > 0, numerator / np.where(denominator > 0, denominator, 1), popularity
+        ).astype('<f4')
+        own = matrix.tocoo()
+        scores[own.row, own.col] = own.data
+        entries[index, user_ids] = _top(scores, venue_ids, k)
+
+
+def _load_ratings(values, venue_ids):
+    ratings = np.fromiter(values, RATING)
+    # Venues registered after venue_ids was read wait for the next full build.
+    return ratings[np.isin(ratings['venue'], venue_ids)]
+
+
+def _matrix(ratings, venue_ids, rows):
+    columns = np.searchsorted(venue_ids, ratings['venue'])
+    return sparse.csr_matrix(
+        (ratings['rating'], (ratings['user'], columns)), shape=(rows, len(venue_ids)), dtype='<f4'
+    )
+
+
+def _similarities(matrix):
+    """Shrunk cosine similarity between every pair of venue columns; 0 on the diagonal."""
+    rated = matrix.copy()
+    rated.data[:] = 1
+    dot = (matrix.T @ matrix).toarray()
+    overlap = (rated.T @ rated).toarray()
+    norms = np.sqrt(np.diag(dot))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cosine = np.where(np.outer(norms, norms) > 0, dot / np.outer(norms, norms), 0)
+    similarities = cosine * overlap / (overlap + SIMILARITY_SHRINKAGE)
+    np.fill_diagonal(similarities, 0)
+    return similarities.astype('<f4')
+
+
+def _popularity(period, venue_ids):
+    counts = np.zeros(len(venue_ids), '<f8')
+    totals = np.zeros(len(venue_ids), '<f8')
+    for venue_id, count, total in RatingAggregate.objects.filter(meal_period=period).values_list(
+        'venue_id', 'count', 'total'
+    ):
+        column = np.searchsorted(venue_ids, venue_id)
+        if column < len(venue_ids) and venue_ids[column] == venue_id:
+            counts[column], totals[column] = count, total
+    mean = totals.sum() / counts.sum() if counts.sum() else 0.0
+    return ((totals + POPULARITY_SHRINKAGE * mean) / (counts + POPULARITY_SHRINKAGE)).astype('<f4')
+
+
+def _top(scores, venue_ids, k):
+    """The best `k` (venue, score) entries of each row of `scores`, best first."""
+    top = np.zeros((len(scores), k), ENTRY)
+    count = min(k, scores.shape[1])
+    if not count:
+        return top
+    columns = np.argpartition(-scores, count - 1, axis=1)[:, :count]
+    best = np.take_along_axis(scores, columns, axis=1)
+    order = np.argsort(-best, axis=1, kind='stable')
+    top['venue'][:, :count] = venue_ids[np.take_along_axis(columns, order, axis=1)]
+    top['score'][:, :count] = np.take_along_axis(best, order, axis=1)
+    return top
+
+
+def _chunks(values, size):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _micros(moment):
+    return (moment - EPOCH) // ONE_MICROSECOND
+
+
+def _datetime(micros):
+    return EPOCH + datetime.timedelta(microseconds=micros)
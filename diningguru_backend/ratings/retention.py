@@ -0,0 +1,41 @@
+# ratings/retention.py
+
+import datetime
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+
+def semester_start(keep, today=None):
+    """The first day of the `keep`-th most recent semester, counting the current one."""
+    if keep < 1:
+        raise ValueError("At least one semester must be kept.")
+    today = today or timezone.localdate()
+    starts = sorted(
+        (
+            datetime.date(year, month, day)
+            for year in range(today.year - keep, today.year + 1)
+            for month, day in settings.SEMESTER_STARTS
+        ),
+        reverse=True,
+    )
+    return [start for start in starts if start <= today][keep - 1]
+
+
+def retention_cutoff(before=None, keep_semesters=None, today=None):
+    """
+    The aware datetime before which rows are archived: an explicit `before`
+    date (YYYY-MM-DD) or number of semesters to keep, else the RETENTION_*
+    settings.
+    """
+    if before is None and keep_semesters is None:
+        before = settings.RETENTION_CUTOFF or None
+        keep_semesters = settings.RETENTION_KEEP_SEMESTERS
+    if before is not None:
+        cutoff = parse_date(before)
+        if cutoff is None:
+            raise ValueError(f"Invalid cutoff date {before!r}; expected YYYY-MM-DD.")
+    else:
+        cutoff = semester_start(keep_semesters, today)
+    return timezone.make_aware(datetime.datetime.combine(cutoff, datetime.time.min))
@@ -0,0 +1,230 @@
+# ratings/search.py
+
+import datetime
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from django.utils.html import escape
+from django.utils.dateparse import parse_datetime
+
+from .models import MealPeriod
+
+# External-content FTS5 index over ratings_comment.text. The triggers keep it
+# in sync with every insert, delete and text update, whichever code path
+# (views, admin, shell, bulk loads) touches the comment table.
+FTS_TABLE = 'ratings_comment_fts'
+
+CREATE_FTS_SQL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        text,
+        content='ratings_comment',
+        content_rowid='id',
+        tokenize='porter unicode61'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS ratings_comment_fts_ai AFTER INSERT ON ratings_comment BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS ratings_comment_fts_ad AFTER DELETE ON ratings_comment BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) VALUES ('delete', old.id, old.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS ratings_comment_fts_au AFTER UPDATE OF text ON ratings_comment BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) VALUES ('delete', old.id, old.text);
+        INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+]
+
+DROP_FTS_SQL = [
+    "DROP TRIGGER IF EXISTS ratings_comment_fts_au",
+    "DROP TRIGGER IF EXISTS ratings_comment_fts_ad",
+    "DROP TRIGGER IF EXISTS ratings_comment_fts_ai",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+# Snippets are HTML: the comment text escaped, with the matches in <mark>.
+# The database marks matches with private-use characters, which become the
+# tags only after the text around them has been escaped.
+SNIPPET_START = '<mark>'
+SNIPPET_END = '</mark>'
+_SNIPPET_START_SENTINEL = '\ue000'
+_SNIPPET_END_SENTINEL = '\ue001'
+_SENTINEL_RE = re.compile(f'({_SNIPPET_START_SENTINEL}|{_SNIPPET_END_SENTINEL})')
+SNIPPET_TOKENS = 12
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def build_match_query(raw):
+    """
+    Turn free text typed by a user into a safe FTS5 MATCH expression.
+
+    Every word is quoted so FTS5 operators and punctuation in the input can
+    never cause a syntax error; a trailing '*' on a word is kept as a prefix
+    search. Returns None if the input has no searchable words.
+    """
+    terms = []
+    for word in raw.split():
+        prefix = word.endswith('*')
+        for token in _TOKEN_RE.findall(word):
+            terms.append(f'"{token}"')
+        if prefix and terms:
+            terms[-1] += '*'
+    return ' '.join(terms) or None
+
+
+def is_available(using=connection):
+    return using.vendor in ('sqlite', 'postgresql')
+
+
+# Postgres counterpart: a GIN expression index over the same text, queried
+# with websearch_to_tsquery so raw user input is always valid.
+PG_TS_CONFIG = 'english'
+PG_FTS_INDEX = 'ratings_comment_text_fts'
+PG_CREATE_INDEX_SQL = (
+    f"CREATE INDEX IF NOT EXISTS {PG_FTS_INDEX} ON ratings_comment "
+    f"USING gin (to_tsvector('{PG_TS_CONFIG}', text))"
+)
+
+
+def search_comments(query, venue_id=None, meal_period=None, limit=50, offset=0):
+    """
+    Ranked comment search. Returns (rows, total) where rows are dicts with the
+    comment fields plus a highlighted `snippet` (HTML-escaped) and a `rank`
+    where lower is a better match (SQLite's bm25 convention; Postgres'
+    ts_rank is negated).
+    """
+    if connection.vendor == 'postgresql':
+        if not query.strip():
+            return [], 0
+        from_sql = (
+            f"ratings_comment c, websearch_to_tsquery('{PG_TS_CONFIG}', %s) q"
+        )
+        select_sql = (
+            f"ts_headline('{PG_TS_CONFIG}', c.text, q, %s), "
+            f"-ts_rank(to_tsvector('{PG_TS_CONFIG}', c.text), q) AS rank"
+        )
+        select_params = [
+            f"StartSel={_SNIPPET_START_SENTINEL}, StopSel={_SNIPPET_END_SENTINEL}, "
+            f"MaxWords={SNIPPET_TOKENS}, MinWords=4"
+        ]
+        where = [f"to_tsvector('{PG_TS_CONFIG}', c.text) @@ q"]
+        params = [query]
+    else:
+        match = build_match_query(query)
+        if match is None:
+            return [], 0
+        from_sql = f"{FTS_TABLE} JOIN ratings_comment c ON c.id = {FTS_TABLE}.rowid"
+        select_sql = (
+            f"snippet({FTS_TABLE}, 0, %s, %s, '…', %s), "
+            f"bm25({FTS_TABLE}) AS rank"
+        )
+        select_params = [_SNIPPET_START_SENTINEL, _SNIPPET_END_SENTINEL, SNIPPET_TOKENS]
+        where = [f"{FTS_TABLE} MATCH %s"]
+        params = [match]
+
+    if venue_id is not None:
+        where.append("c.venue_id = %s")
+        params.append(venue_id)
+    if meal_period is not None:
+        where.append("c.meal_period = %s")
+        params.append(meal_period)
+    where_sql = " AND ".join(where)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT c.id, c.venue_id, c.user_id, c.meal_period, c.text,
+                   {select_sql},
+                   (SELECT COUNT(*) FROM ratings_comment_likes l WHERE l.comment_id = c.id),
+                   c.created_at, c.updated_at
+            FROM {from_sql}
+            WHERE {where_sql}
+            ORDER BY rank
+            LIMIT %s OFFSET %s
+            """,
+            [*select_params, *params, limit, offset],
+        )
+        rows = cursor.fetchall()
+        cursor.execute(
+            f"""
+            SELECT COUNT(*)
+            FROM {from_sql}
+            WHERE {where_sql}
+            """,
+            params,
+        )
+        total = cursor.fetchone()[0]
+
+    results = []
+    for (comment_id, venue, user_id, period, text, snippet, rank,
+         like_count, created_at, updated_at) in rows:
+        results.append({
+            "id": comment_id,
+            "venue_id": venue,
+            "user_id": user_id,
+            "meal_period": MealPeriod(period).label,
+            "text": text,
+            "snippet": _highlight(snippet),
+            "rank": rank,
+            "like_count": like_count,
+            "created_at": _isoformat(created_at),
+            "updated_at": _isoformat(updated_at),
+        })
+    return results, total
+
+
+def rebuild_index(using=connection):
+    """Recreate the full-text index if needed and reindex every comment."""
+    with using.cursor() as cursor:
+        if using.vendor == 'postgresql':
+            cursor.execute(PG_CREATE_INDEX_SQL)
+            cursor.execute(f"REINDEX INDEX {PG_FTS_INDEX}")
+            cursor.execute("SELECT COUNT(*) FROM ratings_comment")
+            return cursor.fetchone()[0]
+        for statement in CREATE_FTS_SQL:
+            cursor.execute(statement)
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute("SELECT COUNT(*) FROM ratings_comment")
+        return cursor.fetchone()[0]
+
+
+def _highlight(snippet):
+    if snippet is None:
+        return None
+    html, marked = [], False
+    for part in _SENTINEL_RE.split(snippet):
+        if part == _SNIPPET_START_SENTINEL:
+            if not marked:
+                html.append(SNIPPET_START)
+            marked = True
+        elif part == _SNIPPET_END_SENTINEL:
+            if marked:
+                html.append(SNIPPET_END)
+            marked = False
+        else:
+            html.append(escape(part))
+    if marked:
+        html.append(SNIPPET_END)
+    return ''.join(html).replace(SNIPPET_START + SNIPPET_END, '')
+
+
+def _isoformat(value):
+    # Raw cursors skip the model field conversion, so match what the ORM
+    # would have returned (aware UTC datetimes) before formatting.
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    if value is None:
+        return None
+    if settings.USE_TZ and timezone.is_naive(value):
+        value = timezone.make_aware(value, datetime.timezone.utc)
+    return value.isoformat()
@@ -0,0 +1,68 @@
+# ratings/singleflight.py
+
+import threading
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Collapse concurrent identical reads into one call per process.
+
+    The first caller for a key runs the loader; callers that arrive while it
+    is in flight wait for it and share its result (or its exception). Nothing
+    is kept once the call finishes, so this never serves data older than the
+    query it joined. Results are shared between callers and must be treated
+    as read-only.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.stats = {'calls': 0, 'shared': 0}
+
+    def do(self, key, fn):
+        """Run `fn()` for `key`, or wait for the call already in flight."""
+        if not self.enabled:
+            return fn()
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.stats['calls'] += 1
+            else:
+                self.stats['shared'] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {'calls': 0, 'shared': 0}
+
+
+flights = SingleFlight()
@@ -1,3 +1,1294 @@
-from django.test import TestCase
+import datetime
+import gzip
+import importlib.util
+import io
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from unittest import mock, skipUnless
+from zoneinfo import ZoneInfo
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from diningguru_backend.replication import replicate
+from diningguru_backend.routers import REPLICA
+
+from venue_ratings.models import Venue, _known_venue_ids
+from . import prewarm, recommendations, search
+from .aggregate_store import AggregateStore, aggregate_store
+from .meal_clock import current_meal_period, dining_date, next_meal_period
+from .models import ArchivedComment, ArchivedRating, Comment, CommentLike, MealPeriod, Rating, RatingAggregate
+from .retention import retention_cutoff
+from .search import build_match_query
+from .singleflight import SingleFlight
+
+
+def _make_comment(author):
+    venue = Venue.objects.create(id=593)
+    return Comment.objects.create(
+        venue=venue, user=author, text="Great pasta", meal_period=MealPeriod.LUNCH
+    )
+
+
+class LikeCommentTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="a@example.com", email="a@example.com")
+        self.comment = _make_comment(self.user)
+        self.client = Client()
+
+    def post(self, url, payload):
+        return self.client.post(url, json.dumps(payload), content_type="application/json")
+
+    def test_like_and_unlike_are_idempotent(self):
+        for _ in range(2):
+            response = self.post(f"/api/comments/{self.comment.id}/like/", {"user_id": self.user.id})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["like_count"], 1)
+        for _ in range(2):
+            response = self.post(f"/api/comments/{self.comment.id}/unlike/", {"user_id": self.user.id})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["like_count"], 0)
+
+    def test_like_and_unlike_are_one_write_and_one_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            Comment.set_liked(self.comment.id, self.user.id, True)
+        statements = [q["sql"] for q in queries.captured_queries if not q["sql"].startswith(("SAVEPOINT", "RELEASE"))]
+        self.assertEqual(len(statements), 2, statements)
+        with CaptureQueriesContext(connection) as queries:
+            Comment.set_liked(self.comment.id, self.user.id, False)
+        statements = [q["sql"] for q in queries.captured_queries if not q["sql"].startswith(("SAVEPOINT", "RELEASE"))]
+        self.assertEqual(len(statements), 2, statements)
+
+    def test_batch_toggles(self):
+        other = Comment.objects.create(
+            venue_id=593, user=self.user, text="Long line", meal_period=MealPeriod.DINNER
+        )
+        response = self.post("/api/comments/likes/", {
+            "user_id": self.user.id,
+            "toggles": [
+                {"comment_id": self.comment.id, "liked": True},
+                {"comment_id": other.id, "liked": True},
+                {"comment_id": other.id, "liked": False},
+                {"comment_id": 9999, "liked": True},
+            ],
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            "like_counts": {str(self.comment.id): 1, str(other.id): 0},
+            "missing_comment_ids": [9999],
+        })
+
+
+class LikeIntegrityTests(TransactionTestCase):
+    # Foreign keys are checked at commit, so this needs real transactions.
+    databases = "__all__"
+
+    def test_unknown_user_or_comment(self):
+        user = User.objects.create(username="a@example.com", email="a@example.com")
+        comment = _make_comment(user)
+        client = Client()
+        response = client.post(
+            f"/api/comments/{comment.id}/like/", json.dumps({"user_id": 9999}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {"error": "User not found."})
+        response = client.post(
+            "/api/comments/9999/like/", json.dumps({"user_id": user.id}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {"error": "Comment not found."})
+        self.assertFalse(Comment.likes.through.objects.exists())
+
+    def test_unlike_unknown_user_or_comment(self):
+        user = User.objects.create(username="a@example.com", email="a@example.com")
+        comment = _make_comment(user)
+        client = Client()
+        for url, user_id, error in [
+            (f"/api/comments/{comment.id}/unlike/", 9999, "User not found."),
+            ("/api/comments/9999/unlike/", user.id, "Comment not found."),
+        ]:
+            response = client.post(url, json.dumps({"user_id": user_id}), content_type="application/json")
+            self.assertEqual((response.status_code, response.json()), (404, {"error": error}), url)
+        response = client.post(
+            "/api/comments/likes/",
+            json.dumps({"user_id": 9999, "toggles": [{"comment_id": comment.id, "liked": False}]}),
+            content_type="application/json",
+        )
+        self.assertEqual((response.status_code, response.json()), (404, {"error": "User not found."}))
+
+
+class ConcurrentLikeTests(TransactionTestCase):
+    databases = "__all__"
+    THREADS = 8
+    ROUNDS = 25
+
+    def test_counts_stay_exact_under_concurrent_toggles(self):
+        users = [
+            User.objects.create(username=f"u{n}@example.com", email=f"u{n}@example.com")
+            for n in range(self.THREADS)
+        ]
+        comment = _make_comment(users[0])
+        barrier = threading.Barrier(self.THREADS)
+        errors = []
+
+        def worker(user, final_state):
+            try:
+                barrier.wait()
+                for n in range(self.ROUNDS):
+                    # Double taps and flip-flops, ending on final_state.
+                    Comment.set_liked(comment.id, user.id, True)
+                    Comment.set_liked(comment.id, user.id, n % 2 == 0)
+                Comment.set_liked(comment.id, user.id, final_state)
+                Comment.set_liked(comment.id, user.id, final_state)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=worker, args=(user, n % 3 != 0))
+            for n, user in enumerate(users)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        expected = sum(1 for n in range(self.THREADS) if n % 3 != 0)
+        self.assertEqual(comment.likes.count(), expected)
+        self.assertEqual(Comment.likes.through.objects.filter(comment=comment).count(), expected)
+
+
+class SingleFlightTests(SimpleTestCase):
+    WAITERS = 5
+
+    def herd(self, flights, fn):
+        """Call flights.do('k', fn) from 1 + WAITERS threads; returns their outcomes."""
+        outcomes = []
+
+        def call():
+            try:
+                outcomes.append(("result", flights.do("k", fn)))
+            except Exception as e:
+                outcomes.append(("error", e))
+
+        threads = [threading.Thread(target=call) for _ in range(1 + self.WAITERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        return outcomes
+
+    def leader(self, flights, outcome):
+        # Holds the flight open until every other caller has joined it.
+        calls = []
+
+        def fn():
+            calls.append(1)
+            while flights.stats["shared"] < self.WAITERS:
+                threading.Event().wait(0.001)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        return fn, calls
+
+    def test_concurrent_calls_share_one_load(self):
+        flights = SingleFlight()
+        result = {"averageRating": 0.5}
+        fn, calls = self.leader(flights, result)
+        outcomes = self.herd(flights, fn)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(outcomes), 1 + self.WAITERS)
+        self.assertTrue(all(kind == "result" and value is result for kind, value in outcomes))
+        self.assertEqual(flights.stats, {"calls": 1, "shared": self.WAITERS})
+        # Nothing is kept once the flight lands.
+        self.assertEqual(flights.do("k", lambda: "fresh"), "fresh")
+
+    def test_waiters_get_the_leaders_exception(self):
+        flights = SingleFlight()
+        error = ValueError("database went away")
+        fn, calls = self.leader(flights, error)
+        outcomes = self.herd(flights, fn)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(outcomes, [("error", error)] * (1 + self.WAITERS))
+        self.assertEqual(flights.do("k", lambda: "recovered"), "recovered")
+
+    def test_disabled_runs_every_call(self):
+        flights = SingleFlight()
+        flights.enabled = False
+        calls = []
+        self.assertEqual([flights.do("k", lambda: calls.append(1) or len(calls)) for _ in range(3)], [1, 2, 3])
+
+
+class MealPeriodApiTests(TestCase):
+    def test_responses_carry_meal_period_names(self):
+        caches[settings.LISTING_CACHE].clear()
+        user = User.objects.create(username="a@example.com", email="a@example.com")
+        _make_comment(user)
+        Rating.submit(593, user.id, MealPeriod.LUNCH, 0.5)
+        client = Client()
+        for url, params, key in [
+            ("/api/ratings/all/", {"meal_period": "LUNCH"}, "ratings"),
+            ("/api/comments/all/", {"meal_period": "Lunch"}, "comments"),
+            ("/api/comments/search/", {"q": "pasta", "meal_period": "lunch"}, "comments"),
+            ("/api/activity/", {"user_id": user.id}, "activity"),
+        ]:
+            rows = client.get(url, params).json()[key]
+            self.assertTrue(rows, url)
+            self.assertEqual({row["meal_period"] for row in rows}, {"lunch"}, url)
+        self.assertEqual(client.get("/api/ratings/all/", {"meal_period": "brunch"}).status_code, 400)
+
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        caches[settings.LISTING_CACHE].clear()
+        self.users = [
+            User.objects.create(username=f"u{n}@example.com", email=f"u{n}@example.com") for n in range(4)
+        ]
+        Venue.objects.create(id=593)
+        # submit_rating remembers the venue once its callbacks run; the row
+        # itself is rolled back.
+        self.addCleanup(_known_venue_ids.clear)
+        for user, rating in zip(self.users, [-1.0, 0.0, 0.5, 1.0]):
+            Rating.submit(593, user.id, MealPeriod.LUNCH, rating)
+        self.client = Client()
+
+    def aggregate(self):
+        return RatingAggregate.objects.get(venue_id=593, meal_period=MealPeriod.LUNCH)
+
+    def test_deltas(self):
+        self.assertEqual(
+            RatingAggregate.deltas(0.5), {"bucket_3": 1, "count": 1, "total": 0.5, "total_squares": 0.25}
+        )
+        # A re-rate moves one rating between buckets and keeps the count.
+        self.assertEqual(
+            RatingAggregate.deltas(-1.0, previous=0.5),
+            {"bucket_0": 1, "bucket_3": -1, "total": -1.5, "total_squares": 0.75},
+        )
+        self.assertEqual(RatingAggregate.deltas(0.5, previous=0.5), {})
+
+    def test_statistics(self):
+        aggregate = self.aggregate()
+        self.assertEqual((aggregate.count, aggregate.buckets), (4, [1, 0, 1, 1, 1]))
+        self.assertAlmostEqual(aggregate.average, 0.125)
+        self.assertAlmostEqual(aggregate.variance, 0.546875)
+        for q, expected in [(25, -0.6), (50, 0.2), (75, 0.6), (90, 0.84), (100, 1.0)]:
+            self.assertAlmostEqual(aggregate.percentile(q), expected, msg=q)
+        self.assertIsNone(RatingAggregate().percentile(50))
+        self.assertEqual(RatingAggregate().variance, 0.0)
+        self.assertEqual(RatingAggregate.compute()[(593, MealPeriod.LUNCH)].buckets, aggregate.buckets)
+
+    def test_re_rate_updates_the_histogram_endpoint(self):
+        url = "/api/ratings/593/average"
+        self.assertEqual(self.client.get(url, {"meal_period": "lunch"}).json(), {"averageRating": 0.125, "reviewCount": 4})
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/ratings", json.dumps(
+                {"venue_id": 593, "user_id": self.users[0].id, "rating": 1.0, "meal_period": "lunch"}
+            ), content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+        data = self.client.get(url, {"meal_period": "lunch", "include": "histogram"}).json()
+        self.assertEqual((data["averageRating"], data["reviewCount"]), (0.625, 4))
+        self.assertEqual([bucket["count"] for bucket in data["histogram"]["buckets"]], [0, 0, 1, 1, 2])
+        self.assertEqual(data["histogram"]["buckets"][0], {"min": -1.0, "max": -0.6, "count": 0})
+        self.assertEqual(data["histogram"]["variance"], 0.171875)
+        self.assertEqual(data["histogram"]["percentiles"], {"p25": 0.2, "p50": 0.6, "p75": 0.8, "p90": 0.92})
+        self.assertNotIn("histogram", self.client.get(url, {"meal_period": "lunch"}).json())
+
+
+class RatingAggregateRebuildTests(TransactionTestCase):
+    databases = "__all__"
+
+    def test_ratings_committed_during_a_rebuild_are_kept(self):
+        first, second = (
+            User.objects.create(username=f"{name}@example.com", email=f"{name}@example.com") for name in "ab"
+        )
+        Venue.objects.create(id=593)
+        Rating.submit(593, first.id, MealPeriod.LUNCH, 0.5)
+        counted, release = threading.Event(), threading.Event()
+        compute = RatingAggregate.compute
+
+        def slow_compute():
+            totals = compute()
+            counted.set()
+            release.wait(10)
+            return totals
+
+        def run(function, *args):
+            try:
+                function(*args)
+            finally:
+                connection.close()
+
+        with mock.patch.object(RatingAggregate, "compute", slow_compute):
+            rebuild = threading.Thread(target=run, args=(RatingAggregate.rebuild,))
+            rebuild.start()
+            self.assertTrue(counted.wait(10))
+            writer = threading.Thread(target=run, args=(Rating.submit, 593, second.id, MealPeriod.LUNCH, -0.5))
+            writer.start()
+            writer.join(0.5)
+            # The writer waits for the rebuild rather than landing between
+            # its recount and its swap.
+            self.assertTrue(writer.is_alive())
+            release.set()
+            rebuild.join()
+            writer.join()
+
+        aggregate = RatingAggregate.objects.get(venue_id=593, meal_period=MealPeriod.LUNCH)
+        self.assertEqual((aggregate.count, aggregate.total, aggregate.buckets), (2, 0.0, [0, 1, 0, 1, 0]))
+
+
+class AggregateStoreTests(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "aggregates")
+        settings_override = override_settings(AGGREGATE_STORE_PATH=self.path)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(aggregate_store.close)
+        self.users = [
+            User.objects.create(username=f"u{n}@example.com", email=f"u{n}@example.com") for n in range(3)
+        ]
+        Venue.objects.create(id=593)
+        Venue.objects.create(id=594)
+
+    def submit(self, user, rating, venue_id=593):
+        with self.captureOnCommitCallbacks(execute=True):
+            Rating.submit(venue_id, user.id, MealPeriod.LUNCH, rating)
+
+    def stored(self, store=aggregate_store, venue_id=593):
+        aggregate = store.get(venue_id, MealPeriod.LUNCH)
+        return aggregate and (aggregate.count, aggregate.total, aggregate.buckets)
+
+    def test_get_and_record(self):
+        self.submit(self.users[0], 0.5)
+        self.assertIsNone(self.stored())
+        self.assertEqual(aggregate_store.rebuild(), 1)
+        self.assertEqual(self.stored(), (1, 0.5, [0, 0, 0, 1, 0]))
+        self.assertEqual(self.stored(venue_id=594), (0, 0.0, [0, 0, 0, 0, 0]))
+
+        self.submit(self.users[1], -1.0)
+        self.assertEqual(self.stored(), (2, -0.5, [1, 0, 0, 1, 0]))
+        # A copy of the committed row, so repeating it changes nothing.
+        aggregate_store.record(593, MealPeriod.LUNCH)
+        self.assertEqual(self.stored(), (2, -0.5, [1, 0, 0, 1, 0]))
+        self.assertEqual(aggregate_store.verify(), [])
+        with self.assertNumQueries(0):
+            self.assertEqual(prewarm.aggregate(593, MealPeriod.LUNCH).count, 2)
+
+    def test_re_rate_replaces_the_previous_rating(self):
+        aggregate_store.rebuild()
+        self.submit(self.users[0], 0.5)
+        self.submit(self.users[0], -0.5)
+        self.assertEqual(self.stored(), (1, -0.5, [0, 1, 0, 0, 0]))
+        self.assertEqual(aggregate_store.verify(), [])
+
+    def test_readers_reopen_a_rebuilt_file(self):
+        self.submit(self.users[0], 0.5)
+        aggregate_store.rebuild()
+        other_process = AggregateStore(self.path)
+        self.addCleanup(other_process.close)
+        self.assertEqual(self.stored(other_process), (1, 0.5, [0, 0, 0, 1, 0]))
+        # Not copied into the store, as if written by a worker that died.
+        Rating.submit(593, self.users[1].id, MealPeriod.LUNCH, 1.0)
+        self.assertEqual(aggregate_store.verify(), [(593, MealPeriod.LUNCH)])
+        aggregate_store.rebuild()
+        self.assertEqual(self.stored(other_process), (2, 1.5, [0, 0, 0, 1, 1]))
+        self.assertEqual(aggregate_store.verify(), [])
+
+    @override_settings(AGGREGATE_STORE_SLOTS=1)
+    def test_full_store_falls_back_to_the_table(self):
+        aggregate_store.rebuild()
+        self.submit(self.users[0], 0.5)
+        self.assertEqual(self.stored(), (1, 0.5, [0, 0, 0, 1, 0]))
+        with self.assertLogs("ratings.aggregate_store", "WARNING"):
+            self.submit(self.users[1], 1.0, venue_id=594)
+        self.assertIsNone(self.stored())
+        self.assertIsNone(aggregate_store.verify())
+        response = Client().get("/api/ratings/594/average", {"meal_period": "lunch"})
+        self.assertEqual(response.json(), {"averageRating": 1.0, "reviewCount": 1})
+        # A rebuild sizes the table for every row.
+        self.assertEqual(aggregate_store.rebuild(), 2)
+        self.assertEqual(self.stored(venue_id=594), (1, 1.0, [0, 0, 0, 0, 1]))
+
+
+class AggregateStoreRebuildTests(TransactionTestCase):
+    databases = "__all__"
+
+    def test_ratings_committed_during_a_rebuild_are_kept(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.addCleanup(aggregate_store.close)
+        first, second = (
+            User.objects.create(username=f"{name}@example.com", email=f"{name}@example.com") for name in "ab"
+        )
+        Venue.objects.create(id=593)
+        snapshotted, release = threading.Event(), threading.Event()
+        snapshot = AggregateStore._snapshot
+
+        def slow_snapshot():
+            rows = snapshot()
+            snapshotted.set()
+            release.wait(10)
+            return rows
+
+        def run(function, *args):
+            try:
+                function(*args)
+            finally:
+                connection.close()
+
+        with override_settings(AGGREGATE_STORE_PATH=os.path.join(directory.name, "aggregates")):
+            Rating.submit(593, first.id, MealPeriod.LUNCH, 0.5)
+            aggregate_store.rebuild()
+            with mock.patch.object(AggregateStore, "_snapshot", staticmethod(slow_snapshot)):
+                rebuild = threading.Thread(target=run, args=(aggregate_store.rebuild,))
+                rebuild.start()
+                self.assertTrue(snapshotted.wait(10))
+                writer = threading.Thread(target=run, args=(Rating.submit, 593, second.id, MealPeriod.LUNCH, -0.5))
+                writer.start()
+                writer.join(0.5)
+                # Committed, but waiting to copy its row into the new file
+                # rather than into the old one, which the swap would drop.
+                self.assertTrue(writer.is_alive())
+                release.set()
+                rebuild.join()
+                writer.join()
+
+            aggregate = aggregate_store.get(593, MealPeriod.LUNCH)
+            self.assertEqual((aggregate.count, aggregate.total), (2, 0.0))
+            self.assertEqual(aggregate_store.verify(), [])
+
+
+class UpsertTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="a@example.com", email="a@example.com")
+        Venue.objects.create(id=593)
+        self.addCleanup(_known_venue_ids.clear)
+        self.client = Client()
+
+    def post(self, url, payload):
+        return self.client.post(url, json.dumps(payload), content_type="application/json")
+
+    def test_re_rating_updates_the_row_in_one_insert(self):
+        payload = {"venue_id": 593, "user_id": self.user.id, "meal_period": "lunch", "rating": 0.5}
+        self.assertEqual(self.post("/api/ratings", payload).status_code, 201)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.post("/api/ratings", {**payload, "rating": -0.5}).status_code, 201)
+        inserts = [q["sql"] for q in queries.captured_queries if q["sql"].startswith('INSERT INTO "ratings_rating"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertIn("ON CONFLICT", inserts[0])
+        self.assertEqual(list(Rating.objects.values_list("rating", flat=True)), [-0.5])
+        aggregate = RatingAggregate.objects.get(venue_id=593, meal_period=MealPeriod.LUNCH)
+        self.assertEqual((aggregate.count, aggregate.total), (1, -0.5))
+
+    def test_out_of_range_ratings_are_rejected(self):
+        payload = {"venue_id": 593, "user_id": self.user.id, "meal_period": "lunch"}
+        for rating in [1e200, -1.5, float("inf"), float("nan")]:
+            response = self.client.post(
+                "/api/ratings", json.dumps({**payload, "rating": rating}), content_type="application/json"
+            )
+            self.assertEqual(response.status_code, 400, rating)
+        self.assertFalse(Rating.objects.exists())
+        self.assertEqual(self.post("/api/ratings", {**payload, "rating": -1.0}).status_code, 201)
+
+    def test_re_commenting_keeps_the_comment(self):
+        payload = {"venue_id": 593, "user_id": self.user.id, "meal_period": "lunch", "text": "Great pasta"}
+        first = self.post("/api/comments", payload).json()["comment"]
+        Comment.set_liked(first["id"], self.user.id, True)
+        with CaptureQueriesContext(connection) as queries:
+            second = self.post("/api/comments", {**payload, "text": "Cold pasta"}).json()["comment"]
+        inserts = [q["sql"] for q in queries.captured_queries if q["sql"].startswith('INSERT INTO "ratings_comment"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertIn("ON CONFLICT", inserts[0])
+        self.assertEqual((second["id"], second["created_at"]), (first["id"], first["created_at"]))
+        self.assertEqual((second["text"], second["like_count"]), ("Cold pasta", 1))
+        self.assertEqual(Comment.objects.count(), 1)
+
+
+class ConcurrentRatingTests(TransactionTestCase):
+    databases = "__all__"
+    THREADS = 8
+
+    def test_concurrent_first_ratings_are_all_counted(self):
+        users = [
+            User.objects.create(username=f"u{n}@example.com", email=f"u{n}@example.com")
+            for n in range(self.THREADS)
+        ]
+        Venue.objects.create(id=593)
+        barrier = threading.Barrier(self.THREADS)
+        errors = []
+
+        def worker(user):
+            try:
+                barrier.wait()
+                # A double tap: the second submit replaces the first.
+                Rating.submit(593, user.id, MealPeriod.LUNCH, 1.0)
+                Rating.submit(593, user.id, MealPeriod.LUNCH, 0.5)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        aggregate = RatingAggregate.objects.get(venue_id=593, meal_period=MealPeriod.LUNCH)
+        self.assertEqual((aggregate.count, aggregate.total), (self.THREADS, 0.5 * self.THREADS))
+        self.assertEqual(aggregate.buckets, [0, 0, 0, self.THREADS, 0])
+
+
+@skipUnless(connection.vendor == "postgresql", "Needs the PostgreSQL backend.")
+class PostgresBackendTests(TransactionTestCase):
+    databases = "__all__"
+
+    def test_connections_are_reused_from_the_pool(self):
+        pool = connection.pool
+        self.assertIsNotNone(pool)
+        before = pool.get_stats()
+        for _ in range(10):
+            User.objects.count()
+            connection.close()
+        after = pool.get_stats()
+        self.assertGreaterEqual(after["requests_num"] - before.get("requests_num", 0), 10)
+        # Closing hands the connection back rather than disconnecting.
+        self.assertLessEqual(after.get("connections_num", 0) - before.get("connections_num", 0), 2)
+
+    def test_master_closes_its_pool_before_workers_fork(self):
+        spec = importlib.util.spec_from_file_location(
+            "gunicorn_conf", os.path.join(settings.BASE_DIR, "gunicorn.conf.py")
+        )
+        gunicorn_conf = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(gunicorn_conf)
+        User.objects.count()
+        pool = connection.pool
+        self.assertGreater(pool.get_stats()["pool_size"], 0)
+        gunicorn_conf.when_ready(None)
+        self.assertTrue(pool.closed)
+        self.assertNotIn(connection.alias, connection._connection_pools)
+        # The next query opens a new pool.
+        User.objects.count()
+        self.assertIsNot(connection.pool, pool)
+
+    def test_listings_stream_through_server_side_cursors(self):
+        caches[settings.LISTING_CACHE].clear()
+        user = User.objects.create(username="a@example.com", email="a@example.com")
+        _make_comment(user)
+        Rating.submit(593, user.id, MealPeriod.LUNCH, 0.5)
+        client = Client()
+        for url, key in [("/api/ratings/all/", "ratings"), ("/api/comments/all/", "comments")]:
+            with mock.patch.object(connection, "chunked_cursor", wraps=connection.chunked_cursor) as chunked:
+                self.assertEqual(len(client.get(url).json()[key]), 1, url)
+            self.assertTrue(chunked.called, url)
+
+    def test_aggregate_lock_blocks_other_writers(self):
+        user = User.objects.create(username="a@example.com", email="a@example.com")
+        Venue.objects.create(id=593)
+        submitted = threading.Event()
+
+        def writer():
+            try:
+                Rating.submit(593, user.id, MealPeriod.LUNCH, 0.5)
+                submitted.set()
+            finally:
+                connection.close()
+
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as queries:
+                RatingAggregate.lock(593, MealPeriod.LUNCH)
+            self.assertTrue(any(q["sql"].endswith("FOR UPDATE") for q in queries.captured_queries))
+            thread = threading.Thread(target=writer)
+            thread.start()
+            self.assertFalse(submitted.wait(0.5))
+        thread.join(10)
+        self.assertTrue(submitted.is_set())
+
+
+class ImportRatingsTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.user = User.objects.create(username="a@example.com", email="a@example.com")
+        self.other = User.objects.create(username="b@example.com", email="b@example.com")
+        Venue.objects.create(id=593)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(content)
+        return path
+
+    def load(self, path, *args):
+        out = io.StringIO()
+        call_command("import_ratings", path, *args, stdout=out)
+        return out.getvalue()
+
+    def test_csv_upserts_and_counts_skipped_rows(self):
+        Rating.submit(593, self.user.id, MealPeriod.LUNCH, -0.5)
+        old = Comment.submit(593, self.user.id, MealPeriod.LUNCH, "Old")
+        path = self.write("ratings.csv", (
+            "email,venue_id,meal_period,rating,comment\n"
+            "a@example.com,593,lunch,0.5,Great pasta\n"
+            "b@example.com,593,Lunch,-1,\n"
+            "b@example.com,594,dinner,,Long line\n"
+            "nobody@example.com,593,lunch,1,\n"
+            "a@example.com,not-a-venue,lunch,1,\n"
+            "a@example.com,593,brunch,1,\n"
+            "a@example.com,593,dinner,,\n"
+            "a@example.com,593,dinner,nan,\n"
+            "a@example.com,593,dinner,1e200,\n"
+        ))
+        output = self.load(path)
+        self.assertIn("Imported 2 ratings and 2 comments from 9 rows (6 skipped)", output)
+        self.assertEqual(
+            sorted(Rating.objects.values_list("venue_id", "meal_period", "user_id", "rating")),
+            [(593, MealPeriod.LUNCH, self.user.id, 0.5), (593, MealPeriod.LUNCH, self.other.id, -1.0)],
+        )
+        # The existing comment is updated in place.
+        comment = Comment.objects.get(venue_id=593, user=self.user)
+        self.assertEqual((comment.id, comment.text, comment.created_at), (old.id, "Great pasta", old.created_at))
+        self.assertTrue(Venue.objects.filter(id=594).exists())
+        aggregate = RatingAggregate.objects.get(venue_id=593, meal_period=MealPeriod.LUNCH)
+        self.assertEqual((aggregate.count, aggregate.total), (2, -0.5))
+        self.assertFalse(User.objects.filter(email="nobody@example.com").exists())
+
+    def test_jsonl_creates_users_on_request(self):
+        path = self.write("ratings.jsonl", (
+            '{"email": "new@example.com", "venue_id": 593, "meal_period": "dinner", "rating": 1.0}\n'
+            "\n"
+            '{"email": "new@example.com", "venue_id": 593, "meal_period": "dinner", "rating": 0.0}\n'
+            '{"email": "a@example.com", "venue_id": 593, "meal_period": "Dinner", "comment": "Quiet"}\n'
+        ))
+        self.assertIn("(0 skipped)", self.load(path, "--create-users"))
+        user = User.objects.get(email="new@example.com")
+        self.assertEqual(user.username, "new@example.com")
+        # The later row for the same key wins.
+        self.assertEqual(Rating.objects.get(user=user).rating, 0.0)
+        self.assertEqual(Comment.objects.get(user=self.user).meal_period, MealPeriod.DINNER)
+
+
+class ImportRatingsIndexTests(TransactionTestCase):
+    # Each batch commits, as in a real run; Postgres refuses to recreate an
+    # index while the batch's foreign-key checks are still pending.
+    databases = "__all__"
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "ratings.jsonl")
+        User.objects.create(username="a@example.com", email="a@example.com")
+
+    def indexes(self):
+        with connection.cursor() as cursor:
+            indexes = {
+                table: sorted(
+                    name for name, info in connection.introspection.get_constraints(cursor, table).items()
+                    if info["index"]
+                )
+                for table in (Rating._meta.db_table, Comment._meta.db_table)
+            }
+            if connection.vendor == "sqlite":
+                cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' ORDER BY name")
+                indexes["triggers"] = [name for name, in cursor.fetchall()]
+        return indexes
+
+    def test_dropped_indexes_come_back_when_the_load_fails(self):
+        before = self.indexes()
+        with open(self.path, "w", encoding="utf-8") as file:
+            file.write(
+                '{"email": "a@example.com", "venue_id": 593, "meal_period": "lunch", "comment": "Great pasta"}\n'
+                "not json\n"
+            )
+        with self.assertRaisesMessage(CommandError, "Line 2"):
+            call_command("import_ratings", self.path, "--drop-indexes", "--batch-size", "1", stdout=io.StringIO())
+        self.assertEqual(self.indexes(), before)
+        # The first batch was loaded and, with the triggers back, is searchable.
+        self.assertEqual([comment["text"] for comment in search.search_comments("pasta")[0]], ["Great pasta"])
+
+
+class RetentionCutoffTests(SimpleTestCase):
+    def midnight(self, *date):
+        return timezone.make_aware(datetime.datetime(*date))
+
+    def test_semesters_count_back_from_today(self):
+        today = datetime.date(2026, 10, 19)
+        self.assertEqual(retention_cutoff(keep_semesters=1, today=today), self.midnight(2026, 8, 20))
+        self.assertEqual(retention_cutoff(keep_semesters=2, today=today), self.midnight(2026, 1, 15))
+        self.assertEqual(retention_cutoff(keep_semesters=3, today=today), self.midnight(2025, 8, 20))
+        # Before the spring start, the current semester began last August.
+        self.assertEqual(retention_cutoff(keep_semesters=1, today=datetime.date(2026, 1, 10)), self.midnight(2025, 8, 20))
+        self.assertEqual(retention_cutoff(keep_semesters=1, today=datetime.date(2026, 1, 15)), self.midnight(2026, 1, 15))
+        with self.assertRaises(ValueError):
+            retention_cutoff(keep_semesters=0, today=today)
+
+    def test_explicit_date_and_settings(self):
+        self.assertEqual(retention_cutoff(before="2025-06-01"), self.midnight(2025, 6, 1))
+        with self.assertRaises(ValueError):
+            retention_cutoff(before="June 2025")
+        with override_settings(RETENTION_CUTOFF="2024-01-01"):
+            self.assertEqual(retention_cutoff(), self.midnight(2024, 1, 1))
+        with override_settings(RETENTION_CUTOFF="", RETENTION_KEEP_SEMESTERS=2):
+            self.assertEqual(retention_cutoff(), retention_cutoff(keep_semesters=2))
+
+
+class ArchiveTests(TestCase):
+    CUTOFF = datetime.datetime(2026, 1, 15, tzinfo=datetime.timezone.utc)
+
+    def setUp(self):
+        caches[settings.LISTING_CACHE].clear()
+        self.users = [
+            User.objects.create(username=f"u{n}@example.com", email=f"u{n}@example.com") for n in range(3)
+        ]
+        Venue.objects.create(id=593)
+        self.client = Client()
+
+    def rate(self, user, rating, updated_at=None, timestamp=None):
+        Rating.submit(593, user.id, MealPeriod.LUNCH, rating)
+        rows = Rating.objects.filter(user=user)
+        if timestamp:
+            rows.update(timestamp=timestamp)
+        if updated_at:
+            rows.update(updated_at=updated_at)
+        return rows.get().id
+
+    def aggregate(self):
+        aggregate = RatingAggregate.objects.get(venue_id=593, meal_period=MealPeriod.LUNCH)
+        expected = RatingAggregate.compute()[(593, MealPeriod.LUNCH)]
+        self.assertEqual(
+            [getattr(aggregate, field) for field in ("count", "total", "buckets")],
+            [getattr(expected, field) for field in ("count", "total", "buckets")],
+        )
+        return aggregate.count, aggregate.total
+
+    def test_archives_by_last_change(self):
+        old = self.cutoff_minus(days=200)
+        stale = self.rate(self.users[0], -1.0, updated_at=old, timestamp=old)
+        # First rated long ago but changed since: stays live.
+        re_rated = self.rate(self.users[1], 0.5, timestamp=old)
+        recent = self.rate(self.users[2], 1.0)
+        self.assertEqual(ArchivedRating.archive_batch(self.CUTOFF, 10), 1)
+        self.assertEqual(ArchivedRating.archive_batch(self.CUTOFF, 10), 0)
+        self.assertEqual(list(ArchivedRating.objects.values_list("id", "rating")), [(stale, -1.0)])
+        self.assertEqual(sorted(Rating.objects.values_list("id", flat=True)), sorted([re_rated, recent]))
+        # Archived ratings still count.
+        self.assertEqual(self.aggregate(), (3, 0.5))
+
+        rows = self.client.get("/api/ratings/all/", {"include_archived": "1"}).json()["ratings"]
+        self.assertEqual(
+            sorted((row["id"], row["archived"]) for row in rows),
+            sorted([(stale, True), (re_rated, False), (recent, False)]),
+        )
+        rows = self.client.get("/api/ratings/all/").json()["ratings"]
+        self.assertEqual(sorted(row["id"] for row in rows), sorted([re_rated, recent]))
+
+    def test_re_rating_replaces_the_archived_rating(self):
+        old = self.cutoff_minus(days=200)
+        self.rate(self.users[0], -1.0, updated_at=old)
+        ArchivedRating.archive_batch(self.CUTOFF, 10)
+        self.assertFalse(Rating.submit(593, self.users[0].id, MealPeriod.LUNCH, -1.0))
+        self.assertFalse(ArchivedRating.objects.exists())
+        self.assertEqual(self.aggregate(), (1, -1.0))
+
+    def test_import_replaces_the_archived_rating(self):
+        self.rate(self.users[0], -1.0, updated_at=self.cutoff_minus(days=200))
+        ArchivedRating.archive_batch(self.CUTOFF, 10)
+        with tempfile.NamedTemporaryFile("w", suffix=".csv") as file:
+            file.write(f"email,venue_id,meal_period,rating\n{self.users[0].email},593,lunch,0.5\n")
+            file.flush()
+            call_command("import_ratings", file.name, stdout=io.StringIO())
+        self.assertFalse(ArchivedRating.objects.exists())
+        self.assertEqual(self.aggregate(), (1, 0.5))
+
+    def test_command_moves_ratings_and_comments(self):
+        old = self.cutoff_minus(days=1)
+        self.rate(self.users[0], 0.5, updated_at=old)
+        comment = Comment.objects.create(
+            venue_id=593, user=self.users[0], text="Great pasta", meal_period=MealPeriod.LUNCH
+        )
+        Comment.set_liked(comment.id, self.users[1].id, True)
+        Comment.objects.filter(id=comment.id).update(updated_at=old)
+
+        out = io.StringIO()
+        call_command("archive_ratings", "--before", "2026-01-15", "--dry-run", stdout=out)
+        self.assertIn("1 ratings and 1 comments would move.", out.getvalue())
+        self.assertEqual(Rating.objects.count(), 1)
+        call_command("archive_ratings", "--before", "2026-01-15", "--pause", "0", stdout=io.StringIO())
+        self.assertFalse(Rating.objects.exists())
+        archived = ArchivedComment.objects.get()
+        self.assertEqual((archived.id, archived.text, archived.like_count), (comment.id, "Great pasta", 1))
+        self.assertEqual(self.aggregate(), (1, 0.5))
+
+    def cutoff_minus(self, **delta):
+        return self.CUTOFF - datetime.timedelta(**delta)
+
+
+class CommentSearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="a@example.com", email="a@example.com")
+        self.comment = _make_comment(self.user)
+        self.client = Client()
+
+    def search(self, q, **params):
+        return self.client.get("/api/comments/search/", {"q": q, **params})
+
+    def found(self, q):
+        return [comment["id"] for comment in search.search_comments(q)[0]]
+
+    def test_build_match_query_quotes_every_word(self):
+        self.assertEqual(build_match_query('pasta AND sauce'), '"pasta" "AND" "sauce"')
+        self.assertEqual(build_match_query('NEAR(pasta "sauce" -bad) col:x ^y'),
+                         '"NEAR" "pasta" "sauce" "bad" "col" "x" "y"')
+        self.assertEqual(build_match_query("don't pas*"), '"don" "t" "pas"*')
+        self.assertIsNone(build_match_query('*** ( ) "'))
+
+    def test_operators_and_punctuation_are_searched_as_words(self):
+        for q in ['pasta"', '"great', '(great) pasta', 'pasta -', 'great:pasta', 'great^']:
+            response = self.search(q)
+            self.assertEqual(response.status_code, 200, q)
+            self.assertEqual([c["id"] for c in response.json()["comments"]], [self.comment.id], q)
+
+    def test_results_are_filtered_and_highlighted(self):
+        other = Comment.objects.create(
+            venue_id=593, user=User.objects.create(username="b@example.com", email="b@example.com"),
+            text="The pasta was cold", meal_period=MealPeriod.DINNER,
+        )
+        self.assertEqual(self.search("pasta").json()["total_comments"], 2)
+        self.assertEqual([c["id"] for c in self.search("pasta", meal_period="dinner").json()["comments"]], [other.id])
+        self.assertEqual(self.search("pasta", venue_id=600).json()["comments"], [])
+        result, = self.search("pasta", meal_period="lunch").json()["comments"]
+        self.assertEqual((result["id"], result["meal_period"]), (self.comment.id, "lunch"))
+        self.assertIn("<mark>pasta</mark>", result["snippet"])
+        self.assertEqual(self.search("").status_code, 400)
+
+    def test_snippets_escape_the_comment_text(self):
+        Comment.objects.filter(id=self.comment.id).update(
+            text='<img src=x onerror="alert(1)"> pasta & <b>wine</b> \ue000'
+        )
+        snippet = self.search("pasta").json()["comments"][0]["snippet"]
+        # Postgres drops the tags from headlines; SQLite keeps them, escaped.
+        self.assertEqual(set(re.findall(r"<[^>]*>", snippet)), {"<mark>", "</mark>"})
+        self.assertIn("<mark>pasta</mark> &amp;", snippet)
+
+    def test_index_follows_inserts_updates_and_deletes(self):
+        self.assertEqual(self.found("pasta"), [self.comment.id])
+        self.comment.text = "Soggy fries"
+        self.comment.save()
+        self.assertEqual(self.found("pasta"), [])
+        self.assertEqual(self.found("fries"), [self.comment.id])
+        Comment.objects.filter(id=self.comment.id).update(text="Crispy fries")
+        self.assertEqual(self.found("soggy"), [])
+        self.assertEqual(self.found("crispy"), [self.comment.id])
+        self.comment.delete()
+        self.assertEqual(self.found("crispy"), [])
+
+
+class ListingCacheTests(TestCase):
+    def setUp(self):
+        caches[settings.LISTING_CACHE].clear()
+        self.user = User.objects.create(username="a@example.com", email="a@example.com")
+        self.comment = _make_comment(self.user)
+        self.client = Client()
+
+    def test_gzip_is_served_only_when_accepted(self):
+        plain = self.client.get("/api/comments/all/")
+        self.assertNotIn("Content-Encoding", plain)
+        self.assertEqual(plain.json()["comments"][0]["meal_period"], "lunch")
+
+        with CaptureQueriesContext(connection) as queries:
+            gzipped = self.client.get("/api/comments/all/", HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(gzipped["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(gzipped.content), plain.content)
+        self.assertIn("Accept-Encoding", gzipped["Vary"])
+
+    def test_writes_invalidate_cached_listings(self):
+        url = f"/api/comments/593?meal_period=lunch&user_id={self.user.id}"
+        self.assertEqual(self.client.get(url).json()["comments"][0]["like_count"], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.set_liked(self.comment.id, self.user.id, True)
+        comment = self.client.get(url).json()["comments"][0]
+        self.assertEqual((comment["like_count"], comment["has_liked"]), (1, True))
+
+
+class UserActivityTests(TestCase):
+    def test_pages_merge_ratings_comments_and_likes_in_time_order(self):
+        user = User.objects.create(username="a@example.com", email="a@example.com")
+        other = User.objects.create(username="b@example.com", email="b@example.com")
+        liked = _make_comment(other)
+        start = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+        for n in range(1, 6):
+            Venue.objects.ensure(n)
+            Rating.objects.create(venue_id=n, user=user, rating=0.5, meal_period=MealPeriod.LUNCH)
+            Comment.objects.create(venue_id=n, user=user, text=f"c{n}", meal_period=MealPeriod.DINNER)
+        CommentLike.objects.create(comment=liked, user=user)
+        # Every rating and comment shares an instant with one of the others.
+        for n, rating in enumerate(Rating.objects.filter(user=user).order_by('id')):
+            Rating.objects.filter(id=rating.id).update(timestamp=start + datetime.timedelta(minutes=n))
+        for n, comment in enumerate(Comment.objects.filter(user=user).order_by('id')):
+            Comment.objects.filter(id=comment.id).update(updated_at=start + datetime.timedelta(minutes=n))
+        CommentLike.objects.update(created_at=start + datetime.timedelta(minutes=2))
+        Rating.objects.create(venue_id=593, user=other, rating=1.0, meal_period=MealPeriod.LUNCH)
+
+        client = Client()
+        seen, cursor = [], None
+        while True:
+            params = {"user_id": user.id, "limit": 3, **({"cursor": cursor} if cursor else {})}
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get("/api/activity/", params)
+            self.assertEqual(len(queries), 3)
+            seen += response.json()["activity"]
+            cursor = response.json()["next_cursor"]
+            if cursor is None:
+                break
+
+        self.assertEqual(len(seen), 11)
+        self.assertEqual([entry["timestamp"] for entry in seen], sorted((e["timestamp"] for e in seen), reverse=True))
+        # Ties go likes, then comments, then ratings.
+        self.assertEqual([entry["type"] for entry in seen[:5]], ["comment", "rating", "comment", "rating", "like"])
+        self.assertEqual(seen[4], {
+            "type": "like", "comment_id": liked.id, "venue_id": 593, "meal_period": "lunch",
+            "timestamp": (start + datetime.timedelta(minutes=2)).isoformat(),
+        })
+        self.assertEqual(seen[0]["text"], "c5")
+
+    def test_bad_cursor(self):
+        for params in [
+            {"user_id": 1, "cursor": "nope"},
+            {"user_id": 1, "cursor": "99999999999999999999.0.1"},
+            {"user_id": 1, "cursor": "0.0.99999999999999999999"},
+            {"user_id": 1, "cursor": "0.7.1"},
+            {"user_id": 99999999999999999999999},
+            {"user_id": 1, "limit": "1e3"},
+        ]:
+            self.assertEqual(Client().get("/api/activity/", params).status_code, 400, params)
+
+
+@override_settings(DINING_TIME_ZONE="America/New_York")
+class MealClockTests(TestCase):
+    def at(self, day, hour, minute=0):
+        local = datetime.datetime(2026, 3, day, hour, minute, tzinfo=ZoneInfo("America/New_York"))
+        return local.astimezone(datetime.timezone.utc)
+
+    def test_current_meal_period_follows_local_hours(self):
+        for hour, minute, period in [
+            (5, 59, MealPeriod.CLOSED), (6, 0, MealPeriod.BREAKFAST), (10, 59, MealPeriod.BREAKFAST),
+            (11, 0, MealPeriod.LUNCH), (17, 30, MealPeriod.DINNER), (22, 0, MealPeriod.CLOSED),
+        ]:
+            self.assertEqual(current_meal_period(self.at(2, hour, minute)), period, (hour, minute))
+
+    def test_next_meal_period_wraps_to_tomorrow(self):
+        start, period = next_meal_period(self.at(2, 10, 30))
+        self.assertEqual((start, period), (self.at(2, 11), MealPeriod.LUNCH))
+        start, period = next_meal_period(self.at(2, 23))
+        self.assertEqual((start, period), (self.at(3, 6), MealPeriod.BREAKFAST))
+
+
+class PrewarmTests(TestCase):
+    # Against a shared cache, as `manage.py prewarm_meal_periods` needs.
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        shared = override_settings(CACHES={
+            **settings.CACHES,
+            settings.LISTING_CACHE: {
+                "BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": directory.name,
+            },
+        })
+        shared.enable()
+        self.addCleanup(shared.disable)
+        self.user = User.objects.create(username="a@example.com", email="a@example.com")
+        self.comment = _make_comment(self.user)
+        Venue.objects.create(id=600)
+        self.addCleanup(_known_venue_ids.clear)
+        Rating.submit(593, self.user.id, MealPeriod.LUNCH, 0.5)
+        self.client = Client()
+
+    def comments(self, venue_id=593):
+        response = self.client.get(f"/api/comments/{venue_id}", {"meal_period": "lunch"})
+        return [comment["id"] for comment in response.json()["comments"]]
+
+    def test_warmed_comments_are_served_without_queries(self):
+        prewarm.warm(MealPeriod.LUNCH)
+        with CaptureQueriesContext(connection) as queries:
+            comments = self.comments()
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(comments, [self.comment.id])
+        self.assertEqual(prewarm.hit_rates(dining_date(), MealPeriod.LUNCH)["comments"], (1, 0))
+
+    def test_averages_are_not_cached_per_process(self):
+        average = lambda: self.client.get("/api/ratings/593/average", {"meal_period": "lunch"}).json()
+        self.assertEqual(average(), {"averageRating": 0.5, "reviewCount": 1})
+        # Committed by another worker: nothing here is told, and nothing needs to be.
+        other = User.objects.create(username="b@example.com", email="b@example.com")
+        Rating.submit(593, other.id, MealPeriod.LUNCH, -0.5)
+        self.assertEqual(average(), {"averageRating": 0.0, "reviewCount": 2})
+        # Without the aggregate store every read is a (one-row) miss.
+        self.assertEqual(prewarm.hit_rates(dining_date(), MealPeriod.LUNCH)["average"], (0, 2))
+
+    def test_comment_writes_drop_only_their_warm_list(self):
+        prewarm.warm(MealPeriod.LUNCH)
+        other = User.objects.create(username="b@example.com", email="b@example.com")
+        with self.captureOnCommitCallbacks(execute=True):
+            new = Comment.submit(593, other.id, MealPeriod.LUNCH, "Too salty")
+        self.assertEqual(self.comments(), [new.id, self.comment.id])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.comments(600), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.set_liked(self.comment.id, other.id, True)
+        self.assertEqual(prewarm.comments(593, MealPeriod.LUNCH)[1]["like_count"], 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.comments(600), [])
+
+    def test_list_loaded_before_a_write_is_not_served_after_it(self):
+        load = prewarm.load_comments
+
+        def load_then_write(venue_id, meal_period):
+            rows = load(venue_id, meal_period)
+            # A comment commits while this (now stale) list is on its way to the cache.
+            other = User.objects.create(username="b@example.com", email="b@example.com")
+            with self.captureOnCommitCallbacks(execute=True):
+                Comment.submit(venue_id, other.id, meal_period, "Too salty")
+            return rows
+
+        with mock.patch.object(prewarm, "load_comments", load_then_write):
+            self.assertEqual(len(prewarm.comments(593, MealPeriod.LUNCH)), 1)
+        self.assertEqual(len(prewarm.comments(593, MealPeriod.LUNCH)), 2)
+
+
+@override_settings(LISTING_CACHE_SECONDS=30, PREWARM_CACHE_SECONDS=900)
+class PrewarmLocalCacheTests(TestCase):
+    # The default per-process cache: other workers' writes cannot drop lists
+    # cached here, so they must not outlive the listing bodies.
+    def setUp(self):
+        caches[settings.LISTING_CACHE].clear()
+        self.user = User.objects.create(username="a@example.com", email="a@example.com")
+        _make_comment(self.user)
+        self.addCleanup(_known_venue_ids.clear)
+
+    def test_misses_are_not_cached(self):
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                self.assertEqual(len(prewarm.comments(593, MealPeriod.LUNCH)), 1)
+
+    def test_warm_lists_expire_with_the_listing_bodies(self):
+        prewarm.warm(MealPeriod.LUNCH)
+        with self.assertNumQueries(0):
+            prewarm.comments(593, MealPeriod.LUNCH)
+        now = time.time()
+        with mock.patch("time.time", lambda: now + 31):
+            with self.assertNumQueries(1):
+                prewarm.comments(593, MealPeriod.LUNCH)
+
+
+def _write_recommendations(path, user_id, user_row, popular_row, k=2):
+    # Only the lunch rows are filled in; similarities do not matter to reads.
+    venue_ids = [593, 600, 601]
+    entries = bytearray(len(recommendations.PERIODS) * (user_id + 1) * k * recommendations.ENTRY.size)
+    lunch = recommendations.period_index(MealPeriod.LUNCH)
+    for row, values in [(recommendations.POPULAR_ROW, popular_row), (user_id, user_row)]:
+        offset = (lunch * (user_id + 1) + row) * k * recommendations.ENTRY.size
+        for n, entry in enumerate(values):
+            recommendations.ENTRY.pack_into(entries, offset + n * recommendations.ENTRY.size, *entry)
+    similarities = bytes(len(recommendations.PERIODS) * len(venue_ids) ** 2 * recommendations.SIMILARITY.size)
+    recommendations.write(path, k, venue_ids, similarities, entries, 0, 0)
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "recommendations")
+        settings_override = override_settings(RECOMMENDATIONS_PATH=self.path, RECOMMENDATIONS_K=2)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        recommendations.recommendation_store.close()
+        self.addCleanup(recommendations.recommendation_store.close)
+        self.client = Client()
+
+    def get(self, user_id, **params):
+        return self.client.get(f"/api/recommendations/{user_id}", {"meal_period": "lunch", **params})
+
+    def test_unavailable_until_built(self):
+        self.assertEqual(self.get(7).status_code, 503)
+        self.assertEqual(self.get(7, meal_period="closed").status_code, 400)
+
+    def test_users_get_their_row_or_the_popular_venues_without_queries(self):
+        _write_recommendations(self.path, 7, [(600, 0.75), (593, 0.5)], [(593, 0.25)])
+        with CaptureQueriesContext(connection) as queries:
+            mine = self.get(7).json()
+            other = self.get(3).json()
+            unknown = self.get(1000).json()
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(mine, {
+            "meal_period": "lunch", "personalized": True,
+            "recommendations": [{"venue_id": 600, "score": 0.75}, {"venue_id": 593, "score": 0.5}],
+        })
+        self.assertEqual(other, {
+            "meal_period": "lunch", "personalized": False,
+            "recommendations": [{"venue_id": 593, "score": 0.25}],
+        })
+        self.assertEqual(unknown, other)
+        self.assertEqual(self.get(7, meal_period="dinner").json()["recommendations"], [])
+
+    def test_readers_move_to_a_rebuilt_file(self):
+        _write_recommendations(self.path, 7, [(600, 0.75)], [])
+        self.assertEqual(self.get(7).json()["recommendations"][0]["venue_id"], 600)
+        _write_recommendations(self.path, 7, [(601, 1.0)], [])
+        self.assertEqual(self.get(7).json()["recommendations"][0]["venue_id"], 601)
+
+    @skipUnless(
+        importlib.util.find_spec("numpy") and importlib.util.find_spec("scipy"),
+        "Building recommendations needs requirements-recommendations.txt.",
+    )
+    def test_build_then_update_incrementally(self):
+        from .recommender import build
+
+        users = [
+            User.objects.create(username=f"{name}@example.com", email=f"{name}@example.com")
+            for name in "abc"
+        ]
+        for venue_id in (1, 2, 3):
+            Venue.objects.ensure(venue_id)
+        for user, ratings in zip(users, [{1: 1.0, 2: 1.0}, {1: 1.0, 2: 1.0, 3: -1.0}, {1: 1.0}]):
+            for venue_id, rating in ratings.items():
+                Rating.submit(venue_id, user.id, MealPeriod.LUNCH, rating)
+
+        self.assertEqual(build(self.path, k=3), (3, True))
+        response = self.get(users[2].id).json()
+        self.assertTrue(response["personalized"])
+        # Users who liked 1 liked 2 and not 3.
+        self.assertEqual([entry["venue_id"] for entry in response["recommendations"]], [1, 2, 3])
+        self.assertEqual(response["recommendations"][0]["score"], 1.0)
+
+        # Out of the overlap the next build re-reads.
+        Rating.objects.update(updated_at=datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc))
+        Rating.submit(3, users[2].id, MealPeriod.LUNCH, 1.0)
+        self.assertEqual(build(self.path, k=3), (1, False))
+        response = self.get(users[2].id).json()
+        self.assertEqual([entry["venue_id"] for entry in response["recommendations"]][:2], [1, 3])
+
+
+class ReplicationTests(TestCase):
+    def test_replicate_copies_a_consistent_snapshot(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            primary_path = os.path.join(tmp, "primary.sqlite3")
+            replica_path = os.path.join(tmp, "replica.sqlite3")
+            primary = sqlite3.connect(primary_path)
+            primary.execute("CREATE TABLE t (n INTEGER)")
+            primary.executemany("INSERT INTO t VALUES (?)", [(n,) for n in range(1000)])
+            primary.commit()
+
+            replicate(primary_path, replica_path, pages=1)
+            primary.execute("INSERT INTO t VALUES (1000)")
+            primary.commit()
+
+            replica = sqlite3.connect(replica_path)
+            self.assertEqual(replica.execute("SELECT COUNT(*) FROM t").fetchone()[0], 1000)
+            replica.close()
+            replicate(primary_path, replica_path)
+            replica = sqlite3.connect(replica_path)
+            self.assertEqual(replica.execute("SELECT COUNT(*) FROM t").fetchone()[0], 1001)
+            replica.close()
+            primary.close()
+
+
+@skipUnless(connection.vendor == "sqlite", "File replication needs the SQLite backend.")
+@override_settings(
+    DATABASE_ROUTERS=['diningguru_backend.routers.PrimaryReplicaRouter'],
+    MIDDLEWARE=['diningguru_backend.routers.ReplicaRoutingMiddleware', *settings.MIDDLEWARE],
+    REPLICA_STICKY_READS=2,
+)
+class ReplicaRoutingTests(TransactionTestCase):
+    # Runs against two database files: the file-backed test database as the
+    # primary and a copy of it, refreshed by replicate(), as the replica.
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.primary_path = str(connections["default"].settings_dict["NAME"])
+        cls.replica_path = os.path.join(cls.tmp.name, "replica.sqlite3")
+        replicate(cls.primary_path, cls.replica_path)
+        # The alias is swapped in for this class only (replacing a configured
+        # test mirror, if any), so it is added here rather than declared up
+        # front where the test runner would look for it.
+        cls.saved_settings = connections.settings.get(REPLICA)
+        cls.saved_connection = connections[REPLICA] if cls.saved_settings else None
+        connections.settings[REPLICA] = {
+            **connections["default"].settings_dict, "NAME": cls.replica_path,
+        }
+        if cls.saved_connection is not None:
+            del connections[REPLICA]
+        cls.databases = {"default", REPLICA}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        if cls.saved_settings is None:
+            del connections.settings[REPLICA]
+        else:
+            connections.settings[REPLICA] = cls.saved_settings
+            connections[REPLICA] = cls.saved_connection
+        cls.tmp.cleanup()
+
+    def setUp(self):
+        self.user = User.objects.create(username="a@example.com", email="a@example.com")
+
+    def refresh_replica(self):
+        replicate(self.primary_path, self.replica_path)
+        # Production requests reconnect every time; the test client keeps
+        # connections open, so drop the one holding the old snapshot.
+        connections[REPLICA].close()
+
+    def rate(self, client, value):
+        response = client.post("/api/ratings", json.dumps({
+            "venue_id": 593, "user_id": self.user.id, "rating": value, "meal_period": "lunch",
+        }), content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+
+    def average(self, client):
+        return client.get("/api/ratings/593/average", {"meal_period": "lunch"}).json()["averageRating"]
+
+    def test_reads_use_replica_except_right_after_own_write(self):
+        writer, reader = Client(), Client()
+        self.rate(writer, 1.0)
+        self.refresh_replica()
+
+        with CaptureQueriesContext(connections[REPLICA]) as replica_queries:
+            self.assertEqual(self.average(reader), 1.0)
+        self.assertTrue(replica_queries.captured_queries)
+
+        self.rate(writer, -1.0)
+        # The writer reads its own change from the primary for two reads...
+        self.assertEqual(self.average(writer), -1.0)
+        self.assertEqual(self.average(writer), -1.0)
+        # ...while everyone else, and then the writer too, reads the replica.
+        self.assertEqual(self.average(reader), 1.0)
+        self.assertEqual(self.average(writer), 1.0)
+
+        self.refresh_replica()
+        self.assertEqual(self.average(reader), -1.0)
@@ -8,8 +8,12 @@ from .views import (
     submit_or_update_comment,
     like_comment,
     unlike_comment,
+    toggle_likes,
     get_all_ratings,
     get_all_comments,
+    search_comments,
+    user_activity,
+    recommend_venues,
 )
 
 
@@ -23,7 +27,11 @@ urlpatterns = [
     path('comments', submit_or_update_comment, name='submit_or_update_comment'),  # POST /api/comments
     path('comments/<int:comment_id>/like/', like_comment, name='like_comment'),
     path('comments/<int:comment_id>/unlike/', unlike_comment, name='unlike_comment'),
+    path('comments/likes/', toggle_likes, name='toggle_likes'),  # POST /api/comments/likes/ (batch)
     path('ratings/all/', get_all_ratings, name='get_all_ratings'),
     path('comments/all/', get_all_comments, name='get_all_comments'),
+    path('comments/search/', search_comments, name='search_comments'),  # GET /api/comments/search/?q=
+    path('activity/', user_activity, name='user_activity'),  # GET /api/activity/?user_id=&cursor=
+    path('recommendations/<int:user_id>', recommend_venues, name='recommend_venues'),  # GET /api/recommendations/<user_id>?meal_period=
 
 ]
@@ -5,16 +5,28 @@ from django.views.decorators.http import require_POST
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.models import User
-from .models import Rating, Comment
-from django.db.models import Avg
+from .models import RATING_MAX, RATING_MIN, ArchivedRating, Rating, Comment, MealPeriod
+from venue_ratings.models import Venue
 import json
 import logging
+from datetime import datetime
 from django.core.exceptions import ValidationError
 from django.core.paginator import Paginator
-from django.db.models import Q
+from django.db.models import Count, Q, Value
+from django.db import IntegrityError
+from . import activity, listings, prewarm, search
+from .meal_clock import current_meal_period, next_meal_period
+from .recommendations import recommendation_store
 
 logger = logging.getLogger(__name__)
 
+# Rows fetched per round trip when streaming listings; on Postgres .iterator()
+# reads through a server-side cursor instead of buffering the whole result.
+LISTING_CHUNK_SIZE = 2000
+
+MEAL_PERIOD_LABELS = dict(MealPeriod.choices)
+COMMENT_FIELDS = ('id', 'venue_id', 'user_id', 'meal_period', 'text', 'like_count', 'created_at', 'updated_at')
+
 
 
 def get_all_ratings(request):
@@ -27,6 +39,7 @@ def get_all_ratings(request):
         end_date = request.GET.get('end_date')
         page_number = request.GET.get('page', 1)
         page_size = request.GET.get('page_size', 50)
+        include_archived = request.GET.get('include_archived', '').lower() in ('1', 'true')
 
         # Build filters
         filters = Q()
@@ -35,7 +48,10 @@ def get_all_ratings(request):
         if venue_id:
             filters &= Q(venue_id=venue_id)
         if meal_period:
-            filters &= Q(meal_period__iexact=meal_period)
+            meal_period = MealPeriod.parse(meal_period)
+            if meal_period is None:
+                return JsonResponse({"error": "Invalid meal_period."}, status=400)
+            filters &= Q(meal_period=meal_period)
         if start_date and end_date:
             filters &= Q(timestamp__range=[start_date, end_date])
         elif start_date:
@@ -44,20 +60,34 @@ def get_all_ratings(request):
             filters &= Q(timestamp__lte=end_date)
 
         # Query and paginate
-        ratings = Rating.objects.filter(filters).order_by('-timestamp')
-        paginator = Paginator(ratings, page_size)
-        page_obj = paginator.get_page(page_number)
-
-        # Serialize data
-        ratings_data = list(page_obj.object_list.values())
+        columns = ('id', 'venue_id', 'user_id', 'rating', 'meal_period', 'timestamp')
+        ratings = Rating.objects.filter(filters).values_list(*columns)
+        fields = columns
+        if include_archived:
+            # Archived rows keep their ids, so one UNION ALL pages across both tables.
+            ratings = ratings.annotate(archived=Value(False)).union(
+                ArchivedRating.objects.filter(filters).values_list(*columns).annotate(archived=Value(True)),
+                all=True,
+            )
+            fields += ('archived',)
+        ratings = ratings.order_by('-timestamp')
+
+        def build():
+            paginator = Paginator(ratings, page_size)
+            page_obj = paginator.get_page(page_number)
+            return {
+                'ratings': listings.rows(
+                    fields,
+                    page_obj.object_list.iterator(chunk_size=LISTING_CHUNK_SIZE),
+                    {'meal_period': MEAL_PERIOD_LABELS.__getitem__, 'timestamp': listings.json_datetime, 'archived': bool},
+                ),
+                'total_ratings': paginator.count,
+                'num_pages': paginator.num_pages,
+                'current_page': page_obj.number
+            }
 
         # Response
-        return JsonResponse({
-            'ratings': ratings_data,
-            'total_ratings': paginator.count,
-            'num_pages': paginator.num_pages,
-            'current_page': page_obj.number
-        }, status=200)
+        return listings.cached_response(request, 'ratings', build)
     else:
         return JsonResponse({'error': 'Invalid request method.'}, status=405)
 
@@ -80,6 +110,9 @@ def get_all_comments(request):
         if venue_id:
             filters &= Q(venue_id=venue_id)
         if meal_period:
+            meal_period = MealPeriod.parse(meal_period)
+            if meal_period is None:
+                return JsonResponse({"error": "Invalid meal_period."}, status=400)
             filters &= Q(meal_period=meal_period)
         if start_date and end_date:
             filters &= Q(created_at__range=[start_date, end_date])
@@ -89,35 +122,130 @@ def get_all_comments(request):
             filters &= Q(created_at__lte=end_date)
 
         # Query and paginate
-        comments = Comment.objects.filter(filters).order_by('-created_at')
-        paginator = Paginator(comments, page_size)
-        page_obj = paginator.get_page(page_number)
-
-        # Serialize data
-        comments_data = []
-        for comment in page_obj.object_list:
-            comments_data.append({
-                "id": comment.id,
-                "venue_id": comment.venue_id,
-                "user_id": comment.user.id,
-                "meal_period": comment.meal_period,  # Include meal_period
-                "text": comment.text,
-                "like_count": comment.like_count,
-                "created_at": comment.created_at.isoformat(),
-                "updated_at": comment.updated_at.isoformat(),
-            })
+        comments = (
+            Comment.objects.filter(filters).annotate(like_count=Count('likes')).order_by('-created_at')
+            .values_list(*COMMENT_FIELDS)
+        )
+
+        def build():
+            paginator = Paginator(comments, page_size)
+            page_obj = paginator.get_page(page_number)
+            return {
+                'comments': listings.rows(
+                    COMMENT_FIELDS,
+                    page_obj.object_list.iterator(chunk_size=LISTING_CHUNK_SIZE),
+                    {'meal_period': MEAL_PERIOD_LABELS.__getitem__,
+                     'created_at': datetime.isoformat, 'updated_at': datetime.isoformat},
+                ),
+                'total_comments': paginator.count,
+                'num_pages': paginator.num_pages,
+                'current_page': page_obj.number
+            }
 
         # Response
+        return listings.cached_response(request, 'comments', build)
+    else:
+        return JsonResponse({'error': 'Invalid request method.'}, status=405)
+
+
+def search_comments(request):
+    """
+    Comments matching ?q=, best first. Each has a `snippet` of its text as
+    HTML: escaped, with the matched words in <mark>.
+    """
+    if request.method == "GET":
+        query = request.GET.get('q', '').strip()
+        venue_id = request.GET.get('venue_id')
+        meal_period = request.GET.get('meal_period')
+
+        if not query:
+            return JsonResponse({"error": "Missing q."}, status=400)
+        if meal_period:
+            meal_period = MealPeriod.parse(meal_period)
+            if meal_period is None:
+                return JsonResponse({"error": "Invalid meal_period."}, status=400)
+        if not search.is_available():
+            return JsonResponse({"error": "Search is not available on this database."}, status=501)
+
+        try:
+            page_number = max(int(request.GET.get('page', 1)), 1)
+            page_size = min(max(int(request.GET.get('page_size', 20)), 1), 100)
+            venue_id = int(venue_id) if venue_id else None
+        except ValueError:
+            return JsonResponse({"error": "Invalid query parameters."}, status=400)
+
+        comments_data, total = search.search_comments(
+            query,
+            venue_id=venue_id,
+            meal_period=meal_period or None,
+            limit=page_size,
+            offset=(page_number - 1) * page_size,
+        )
         return JsonResponse({
             'comments': comments_data,
-            'total_comments': paginator.count,
-            'num_pages': paginator.num_pages,
-            'current_page': page_obj.number
+            'total_comments': total,
+            'num_pages': (total + page_size - 1) // page_size,
+            'current_page': page_number,
         }, status=200)
     else:
         return JsonResponse({'error': 'Invalid request method.'}, status=405)
-        
-        
+
+
+
+def user_activity(request):
+    """
+    A user's ratings, comments and likes as one stream, newest first:
+    ?user_id=1&limit=20, then &cursor=<next_cursor> for the following page.
+    """
+    if request.method == "GET":
+        try:
+            user_id = int(request.GET['user_id'])
+            if not 0 < user_id <= activity.MAX_ID:
+                raise ValueError(f"user_id out of range: {user_id}")
+            limit = min(max(int(request.GET.get('limit', 20)), 1), 100)
+            cursor = request.GET.get('cursor')
+            cursor = activity.decode_cursor(cursor) if cursor else None
+        except (KeyError, ValueError, OverflowError):
+            return JsonResponse({"error": "Invalid query parameters."}, status=400)
+
+        entries, next_cursor = activity.activity_page(user_id, limit, cursor)
+        return JsonResponse({"activity": entries, "next_cursor": next_cursor}, status=200)
+    else:
+        return JsonResponse({'error': 'Invalid request method.'}, status=405)
+
+
+def recommend_venues(request, user_id):
+    """
+    The venues a user will probably like best in a meal period (by default
+    the current one, or the next once the dining halls close), from the
+    prebuilt recommendations file: no database query.
+    """
+    if request.method == "GET":
+        meal_period = request.GET.get('meal_period')
+        if meal_period:
+            meal_period = MealPeriod.parse(meal_period)
+            if meal_period is None or meal_period == MealPeriod.CLOSED:
+                return JsonResponse({"error": "Invalid meal_period."}, status=400)
+            meal_period = MealPeriod(meal_period)
+        else:
+            meal_period = current_meal_period()
+            if meal_period == MealPeriod.CLOSED:
+                meal_period = next_meal_period()[1]
+
+        found = recommendation_store.get(user_id, meal_period)
+        if found is None:
+            return JsonResponse({"error": "Recommendations are not available yet."}, status=503)
+        entries, personalized = found
+        return JsonResponse({
+            "meal_period": meal_period.label,
+            "personalized": personalized,
+            "recommendations": [
+                {"venue_id": venue_id, "score": round(score, 4)} for venue_id, score in entries
+            ],
+        }, status=200)
+    else:
+        return JsonResponse({'error': 'Invalid request method.'}, status=405)
+
 
 @csrf_exempt
 @require_POST
@@ -129,56 +257,72 @@ def submit_rating(request):
         rating = data.get("rating")
         meal_period = data.get("meal_period")
         
-        meal_period = meal_period.lower()  # Normalize to lowercase
-
         
-        # Log the received data
-        logger.debug(f"Received rating submission: venue_id={venue_id}, user_id={user_id}, rating={rating}, meal_period={meal_period}")
+        # Log the received data; formatted only if DEBUG is enabled
+        logger.debug(
+            "Received rating submission venue_id=%(venue_id)s user_id=%(user_id)s "
+            "rating=%(rating)s meal_period=%(meal_period)s",
+            {"venue_id": venue_id, "user_id": user_id, "rating": rating, "meal_period": meal_period},
+        )
         
         # Explicitly convert rating to float
         rating = float(rating)
     except (ValueError, TypeError) as e:
-        logger.error(f"Invalid rating value: {e}")
+        logger.error("Invalid rating value error=%(error)s", {"error": str(e)})
         return JsonResponse({"error": "Invalid rating value."}, status=400)
+
+    # Also rejects NaN and infinities: one bad value would poison the
+    # venue's running sums until the aggregates are rebuilt.
+    if not RATING_MIN <= rating <= RATING_MAX:
+        logger.error("Rating out of range rating=%(rating)s", {"rating": rating})
+        return JsonResponse({"error": f"Rating must be between {RATING_MIN} and {RATING_MAX}."}, status=400)
     
     # Check for missing fields (allow 0.0)
     if venue_id is None or user_id is None or meal_period is None:
         logger.error("Missing required fields.")
         return JsonResponse({"error": "Missing required fields."}, status=400)
+
+    meal_period = MealPeriod.parse(meal_period)  # Normalize to the stored code
+    if meal_period is None:
+        logger.error("Invalid meal period.")
+        return JsonResponse({"error": "Invalid meal_period."}, status=400)
     
     try:
         user = User.objects.get(id=user_id)
-        rating_obj, created = Rating.objects.update_or_create(
-            venue_id=venue_id, user=user, meal_period=meal_period,
-            defaults={'rating': rating}
+        venue_id = Venue.objects.ensure(venue_id)
+        Rating.submit(venue_id, user.id, meal_period, rating)
+        logger.info(
+            "Rating submitted user_id=%(user_id)s venue_id=%(venue_id)s",
+            {"user_id": user_id, "venue_id": venue_id},
         )
-        logger.info(f"Rating submitted successfully by user {user_id} for venue {venue_id}.")
         return JsonResponse({"message": "Rating submitted successfully"}, status=201)
     except User.DoesNotExist:
         logger.error("User not found.")
         return JsonResponse({"error": "User not found"}, status=404)
     except ValidationError as ve:
-        logger.error(f"Validation error: {ve}")
+        logger.error("Validation error error=%(error)s", {"error": str(ve)})
         return JsonResponse({"error": str(ve)}, status=400)
     except Exception as e:
-        logger.exception(f"Unexpected error: {e}")
+        logger.exception("Unexpected error submitting rating")
         return JsonResponse({"error": str(e)}, status=500)
 
 
 
-
-
-from django.db.models import Avg
-
 def average_rating(request, venue_id):
     if request.method == "GET":
         meal_period = request.GET.get('meal_period')
         if not meal_period:
             return JsonResponse({"error": "Missing meal_period."}, status=400)
-        ratings = Rating.objects.filter(venue_id=venue_id, meal_period=meal_period)
-        average = ratings.aggregate(Avg('rating'))['rating__avg'] or 0.0
-        count = ratings.count()
-        return JsonResponse({"averageRating": average, "reviewCount": count}, status=200)
+        meal_period = MealPeriod.parse(meal_period)
+        if meal_period is None:
+            return JsonResponse({"error": "Invalid meal_period."}, status=400)
+        include = set(request.GET.get('include', '').split(','))
+
+        aggregate = prewarm.aggregate(venue_id, meal_period)
+        data = {"averageRating": aggregate.average, "reviewCount": aggregate.count}
+        if 'histogram' in include:
+            data["histogram"] = aggregate.histogram()
+        return JsonResponse(data, status=200)
 
 
 def fetch_comments(request, venue_id):
@@ -187,27 +331,32 @@ def fetch_comments(request, venue_id):
         meal_period = request.GET.get('meal_period')
         if not meal_period:
             return JsonResponse({"error": "Missing meal_period."}, status=400)
-        
+        meal_period = MealPeriod.parse(meal_period)
+        if meal_period is None:
+            return JsonResponse({"error": "Invalid meal_period."}, status=400)
+
         try:
-            user = User.objects.get(id=user_id) if user_id else None
-        except User.DoesNotExist:
-            user = None
-
-        comments = Comment.objects.filter(venue_id=venue_id, meal_period=meal_period).order_by('-created_at')
-        comments_data = []
-        for comment in comments:
-            has_liked = comment.has_liked(user) if user else False
-            comments_data.append({
-                "id": comment.id,
-                "venue_id": comment.venue_id,
-                "user_id": comment.user.id,
-                "text": comment.text,
-                "like_count": comment.like_count,
-                "has_liked": has_liked,
-                "created_at": comment.created_at.isoformat(),
-                "updated_at": comment.updated_at.isoformat(),
-            })
-        return JsonResponse({"comments": comments_data}, status=200)
+            user_id = int(user_id) if user_id else None
+        except ValueError:
+            user_id = None
+
+        def build():
+            # The comment list is shared by every caller; only the has_liked
+            # flags are per user.
+            comments = prewarm.comments(venue_id, meal_period)
+            liked_ids = set()
+            if user_id and comments:
+                liked_ids = set(
+                    Comment.likes.through.objects.filter(
+                        user_id=user_id, comment__venue_id=venue_id, comment__meal_period=meal_period
+                    ).values_list('comment_id', flat=True)
+                )
+            return {
+                "comments": [{**comment, "has_liked": comment["id"] in liked_ids} for comment in comments]
+            }
+
+        return listings.cached_response(request, 'comments', build)
+
 
 
 @csrf_exempt
@@ -222,20 +371,20 @@ def submit_or_update_comment(request):
         if not all([venue_id, user_id, text, meal_period]):
             return JsonResponse({"error": "Missing required fields."}, status=400)
             
-        meal_period = meal_period.lower()  # Normalize to lowercase
+        meal_period = MealPeriod.parse(meal_period)  # Normalize to the stored code
+        if meal_period is None:
+            return JsonResponse({"error": "Invalid meal_period."}, status=400)
 
         try:
             user = User.objects.get(id=user_id)
-            comment, created = Comment.objects.update_or_create(
-                venue_id=venue_id, user=user, meal_period=meal_period,
-                defaults={'text': text}
-            )
+            venue_id = Venue.objects.ensure(venue_id)
+            comment = Comment.submit(venue_id, user.id, meal_period, text)
             return JsonResponse({
                 "message": "Comment submitted successfully",
                 "comment": {
                     "id": comment.id,
                     "venue_id": comment.venue_id,
-                    "user_id": comment.user.id,
+                    "user_id": comment.user_id,
                     "text": comment.text,
                     "like_count": comment.like_count,
                     "created_at": comment.created_at.isoformat(),
@@ -251,58 +400,92 @@ def submit_or_update_comment(request):
 @csrf_exempt
 def like_comment(request, comment_id):
     """
-    Like a specific comment.
+    Like a specific comment. Liking an already liked comment is a no-op.
     """
     if request.method == "POST":
-        data = json.loads(request.body)
-        user_id = data.get("user_id")
-        
-        if not user_id:
-            return JsonResponse({"error": "Missing user_id."}, status=400)
-        
-        try:
-            user = User.objects.get(id=user_id)
-            comment = Comment.objects.get(id=comment_id)
-            if comment.likes.filter(id=user.id).exists():
-                return JsonResponse({"message": "You have already liked this comment."}, status=400)
-            comment.likes.add(user)
-            return JsonResponse({"message": "Comment liked successfully.", "like_count": comment.like_count}, status=200)
-        except User.DoesNotExist:
-            return JsonResponse({"error": "User not found."}, status=404)
-        except Comment.DoesNotExist:
-            return JsonResponse({"error": "Comment not found."}, status=404)
-        except Exception as e:
-            return JsonResponse({"error": str(e)}, status=500)
-
+        return _set_liked(request, comment_id, liked=True)
+    return JsonResponse({"error": "Invalid request method."}, status=405)
 
 
 @csrf_exempt
 @require_POST
 def unlike_comment(request, comment_id):
     """
-    Unlike a specific comment.
+    Unlike a specific comment. Unliking a comment that is not liked is a no-op.
     """
-    try:
-        data = json.loads(request.body)
-        user_id = data.get("user_id")
+    return _set_liked(request, comment_id, liked=False)
 
-        if not user_id:
-            return JsonResponse({"error": "Missing user_id."}, status=400)
 
-        user = User.objects.get(id=user_id)
-        comment = Comment.objects.get(id=comment_id)
-
-        if not comment.likes.filter(id=user.id).exists():
-            return JsonResponse({"message": "You have not liked this comment."}, status=400)
+def _set_liked(request, comment_id, liked):
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({"error": "Invalid JSON."}, status=400)
+    user_id = data.get("user_id")
 
-        comment.likes.remove(user)
-        return JsonResponse({"message": "Comment unliked successfully.", "like_count": comment.like_count}, status=200)
+    if not user_id:
+        return JsonResponse({"error": "Missing user_id."}, status=400)
 
+    try:
+        like_count = Comment.set_liked(comment_id, user_id, liked)
+    except IntegrityError:
+        # Only reached for an unknown user or comment, so the extra lookup
+        # stays off the hot path.
+        if not User.objects.filter(id=user_id).exists():
+            return JsonResponse({"error": "User not found."}, status=404)
+        return JsonResponse({"error": "Comment not found."}, status=404)
     except User.DoesNotExist:
         return JsonResponse({"error": "User not found."}, status=404)
     except Comment.DoesNotExist:
         return JsonResponse({"error": "Comment not found."}, status=404)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+    message = "Comment liked successfully." if liked else "Comment unliked successfully."
+    return JsonResponse({"message": message, "like_count": like_count}, status=200)
+
+
+MAX_LIKE_TOGGLES = 100
+
+
+@csrf_exempt
+@require_POST
+def toggle_likes(request):
+    """
+    Apply several like/unlike toggles for one user in a single request:
+    {"user_id": 1, "toggles": [{"comment_id": 5, "liked": true}, ...]}
+    """
+    try:
+        data = json.loads(request.body)
     except json.JSONDecodeError:
         return JsonResponse({"error": "Invalid JSON."}, status=400)
+    user_id = data.get("user_id")
+    toggles = data.get("toggles")
+
+    if not user_id or not isinstance(toggles, list):
+        return JsonResponse({"error": "Missing required fields."}, status=400)
+    if len(toggles) > MAX_LIKE_TOGGLES:
+        return JsonResponse({"error": f"At most {MAX_LIKE_TOGGLES} toggles per request."}, status=400)
+
+    try:
+        pairs = [(int(toggle["comment_id"]), bool(toggle["liked"])) for toggle in toggles]
+    except (KeyError, TypeError, ValueError):
+        return JsonResponse({"error": "Invalid toggles."}, status=400)
+
+    comment_ids = {comment_id for comment_id, _ in pairs}
+    existing = set(Comment.objects.filter(id__in=comment_ids).values_list('id', flat=True))
+    missing = sorted(comment_ids - existing)
+
+    try:
+        like_counts = Comment.apply_like_toggles(
+            user_id, [pair for pair in pairs if pair[0] in existing]
+        )
+    except (IntegrityError, User.DoesNotExist):
+        return JsonResponse({"error": "User not found."}, status=404)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
+
+    return JsonResponse({
+        "like_counts": {str(comment_id): count for comment_id, count in like_counts.items()},
+        "missing_comment_ids": missing,
+    }, status=200)
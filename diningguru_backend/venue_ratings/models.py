@@ -1,3 +1,32 @@
-from django.db import models
+# venue_ratings/models.py
 
-# Create your models here.
+from django.db import models, transaction
+
+# Venue ids already known to exist in this process, so the write path only
+# pays for the insert the first time it sees a venue.
+_known_venue_ids = set()
+
+
+class VenueManager(models.Manager):
+    def ensure(self, venue_id):
+        """
+        Make sure a Venue row exists for `venue_id` and return it as an int.
+
+        Venues come from the upstream dining API, so new ids are registered
+        on first use with a single conflict-ignoring insert.
+        """
+        venue_id = int(venue_id)
+        if venue_id not in _known_venue_ids:
+            self.bulk_create([self.model(id=venue_id)], ignore_conflicts=True)
+            transaction.on_commit(lambda: _known_venue_ids.add(venue_id), using=self.db)
+        return venue_id
+
+
+class Venue(models.Model):
+    id = models.IntegerField(primary_key=True)  # Upstream dining API venue id
+    name = models.CharField(max_length=100, blank=True)
+
+    objects = VenueManager()
+
+    def __str__(self):
+        return self.name or f"Venue {self.id}"